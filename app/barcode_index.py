@@ -0,0 +1,316 @@
+# app/barcode_index.py
+# In-memory barcode -> product index for checking uploaded order lines.
+#
+# acc_productbatch can hold millions of barcodes, so this is not a dict of
+# str -> tuple (well over 200 bytes per entry). Barcodes are packed into one
+# bytearray and everything else lives in flat typed arrays; an
+# open-addressing hash table of uint32 slots points into them. That is about
+# 50 bytes per barcode, and a lookup is one hash plus (almost always) one
+# comparison.
+#
+# The index is loaded once in the background at startup and then kept
+# current from the delta-sync ChangeTracker: every scan that finds changed
+# product rows updates just those barcodes.
+
+import json
+import logging
+import math
+import threading
+import time
+from array import array
+
+from app.datasets import PRODUCT_DATASET
+from app.db_utils import get_db
+from app.delta_sync import get_change_tracker
+from app.settings import get_settings
+
+BARCODE_QUERY = """
+    SELECT barcode, productcode, cost, bmrp
+    FROM acc_productbatch
+    WHERE barcode IS NOT NULL
+"""
+
+DELETED = 0xFFFFFFFF
+MAX_LOAD = 0.7
+
+BARCODE_CHECK_OFF = "off"
+BARCODE_CHECK_FLAG = "flag"       # accept, list unknown barcodes in the response
+BARCODE_CHECK_REJECT = "reject"   # 400 if any line has an unknown barcode
+
+
+def _price(value):
+    return math.nan if value is None else float(value)
+
+
+def _unprice(value):
+    return None if math.isnan(value) else value
+
+
+class BarcodeIndex:
+    """Compact barcode -> (product code, rate, mrp) hash table"""
+
+    def __init__(self, capacity=1024):
+        self._blob = bytearray()          # all barcodes, UTF-8, back to back
+        self._offsets = array("Q", [0])   # entry i is blob[offsets[i]:offsets[i + 1]]
+        self._codes = array("I")          # index into _code_names, or DELETED
+        self._rates = array("d")          # NaN = NULL
+        self._mrps = array("d")
+        self._code_names = []             # product codes, each stored once
+        self._code_ids = {}
+        self._lock = threading.RLock()
+        self.live = 0
+        self.deleted = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        size = 1
+        while size < capacity / MAX_LOAD:
+            size *= 2
+        self._slots = array("I", bytes(4 * size))   # 0 = empty, else entry + 1
+        self._mask = size - 1
+
+    def _find(self, key):
+        """(slot, entry) for a barcode; entry is -1 when absent"""
+        slots, offsets, blob, mask = self._slots, self._offsets, self._blob, self._mask
+        i = hash(key) & mask
+        while True:
+            slot = slots[i]
+            if not slot:
+                return i, -1
+            entry = slot - 1
+            if blob[offsets[entry]:offsets[entry + 1]] == key:
+                return i, entry
+            i = (i + 1) & mask
+
+    def _rehash(self):
+        """Grow the slot table, or compact away deleted entries"""
+        entries = len(self._codes)
+        if self.deleted > self.live:
+            keep = [i for i in range(entries) if self._codes[i] != DELETED]
+            blob, offsets = bytearray(), array("Q", [0])
+            for i in keep:
+                blob += self._blob[self._offsets[i]:self._offsets[i + 1]]
+                offsets.append(len(blob))
+            self._blob, self._offsets = blob, offsets
+            self._codes = array("I", (self._codes[i] for i in keep))
+            self._rates = array("d", (self._rates[i] for i in keep))
+            self._mrps = array("d", (self._mrps[i] for i in keep))
+            self.deleted = 0
+            entries = len(keep)
+        self._allocate(max(1024, entries * 2))
+        for entry in range(entries):
+            slot, _ = self._find(bytes(self._blob[self._offsets[entry]:self._offsets[entry + 1]]))
+            self._slots[slot] = entry + 1
+
+    def _code_id(self, code):
+        code_id = self._code_ids.get(code)
+        if code_id is None:
+            code_id = self._code_ids[code] = len(self._code_names)
+            self._code_names.append(code)
+        return code_id
+
+    def upsert(self, barcode, code, rate=None, mrp=None):
+        key = barcode.encode("utf-8")
+        with self._lock:
+            slot, entry = self._find(key)
+            if entry < 0:
+                if len(self._codes) + 1 > (self._mask + 1) * MAX_LOAD:
+                    self._rehash()
+                    slot, _ = self._find(key)
+                self._blob += key
+                self._offsets.append(len(self._blob))
+                self._codes.append(self._code_id(code))
+                self._rates.append(_price(rate))
+                self._mrps.append(_price(mrp))
+                self._slots[slot] = len(self._codes)
+                self.live += 1
+                return
+            if self._codes[entry] == DELETED:
+                self.deleted -= 1
+                self.live += 1
+            self._codes[entry] = self._code_id(code)
+            self._rates[entry] = _price(rate)
+            self._mrps[entry] = _price(mrp)
+
+    def remove(self, barcode, code=None):
+        """Drop a barcode (only if it still belongs to ``code``, when given)"""
+        with self._lock:
+            _, entry = self._find(barcode.encode("utf-8"))
+            if entry < 0 or self._codes[entry] == DELETED:
+                return
+            if code is not None and self._code_names[self._codes[entry]] != code:
+                # The barcode has moved on to another product
+                return
+            self._codes[entry] = DELETED
+            self.live -= 1
+            self.deleted += 1
+
+    def get(self, barcode):
+        """(product code, rate, mrp) for a barcode, or None"""
+        with self._lock:
+            _, entry = self._find(barcode.encode("utf-8"))
+            if entry < 0 or self._codes[entry] == DELETED:
+                return None
+            return (
+                self._code_names[self._codes[entry]],
+                _unprice(self._rates[entry]),
+                _unprice(self._mrps[entry]),
+            )
+
+    def __contains__(self, barcode):
+        return self.get(barcode) is not None
+
+    def __len__(self):
+        return self.live
+
+    def unknown(self, barcodes):
+        """The barcodes (from one iterable) that are not in the index"""
+        with self._lock:
+            missing = []
+            for barcode in barcodes:
+                _, entry = self._find(barcode.encode("utf-8"))
+                if entry < 0 or self._codes[entry] == DELETED:
+                    missing.append(barcode)
+            return missing
+
+    def memory_bytes(self):
+        with self._lock:
+            arrays = (self._slots, self._offsets, self._codes, self._rates, self._mrps)
+            return len(self._blob) + sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+
+
+def load_barcode_index(chunk_size=5000):
+    """Read every barcode from the database into a new index (blocking)"""
+    started = time.perf_counter()
+    index = BarcodeIndex()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(BARCODE_QUERY)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for barcode, code, rate, mrp in rows:
+                    index.upsert(str(barcode), code, rate, mrp)
+        finally:
+            cursor.close()
+    logging.info(
+        f"🏷️ Barcode index: {len(index)} barcodes, {index.memory_bytes() / 1024 / 1024:.1f} MB, "
+        f"loaded in {time.perf_counter() - started:.2f}s"
+    )
+    return index
+
+
+class BarcodeCatalog:
+    """Owns the process-wide index: background load plus incremental updates"""
+
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+        self._loading = False
+        self._buffered = []   # changes that arrived while loading
+        self._refreshing = False
+
+    def start_loading(self):
+        with self._lock:
+            if self.index is not None or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._load, name="barcode-index", daemon=True).start()
+
+    def _load(self):
+        try:
+            index = load_barcode_index(get_settings().stream_chunk_size)
+        except Exception as e:
+            logging.warning(f"⚠️ Loading the barcode index failed (will retry on demand): {e}")
+            with self._lock:
+                self._loading = False
+                self._buffered = []
+            return
+        with self._lock:
+            for changes in self._buffered:
+                self._apply(index, changes)
+            self._buffered = []
+            self.index = index
+            self._loading = False
+
+    def on_changes(self, version, changes):
+        """ChangeTracker listener: update the barcodes of changed product rows"""
+        product_changes = changes.get(PRODUCT_DATASET)
+        if not product_changes:
+            return
+        with self._lock:
+            if self.index is None:
+                if self._loading:
+                    self._buffered.append(product_changes)
+                return
+            self._apply(self.index, product_changes)
+
+    @staticmethod
+    def _apply(index, changes):
+        for row_key in changes.get("deleted", ()):
+            code, barcode = json.loads(row_key)
+            if barcode is not None:
+                index.remove(str(barcode), code)
+        for _, data in changes.get("upserted", ()):
+            if data.get("barcode") is not None:
+                index.upsert(str(data["barcode"]), data.get("code"), data.get("cost"), data.get("bmrp"))
+
+    def ready_index(self):
+        """The index if loaded (else starts loading and returns None); also
+        starts a background delta scan when the last one is stale"""
+        if self.index is None:
+            self.start_loading()
+            return None
+        self._refresh_in_background()
+        return self.index
+
+    def _refresh_in_background(self):
+        tracker = get_change_tracker()
+        max_age = get_settings().delta_refresh_interval
+        if tracker.last_refresh is not None and time.monotonic() - tracker.last_refresh < max_age:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def _run():
+            try:
+                tracker.refresh_if_stale(max_age)
+            except Exception as e:
+                logging.warning(f"⚠️ Delta scan for the barcode index failed: {e}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=_run, name="barcode-refresh", daemon=True).start()
+
+    def stats(self):
+        index = self.index
+        if index is None:
+            return {"status": "loading" if self._loading else "not loaded"}
+        return {
+            "status": "ready",
+            "barcodes": len(index),
+            "deleted_entries": index.deleted,
+            "memory_mb": round(index.memory_bytes() / 1024 / 1024, 2),
+        }
+
+
+def find_unknown_barcodes(index, orders):
+    """``[{"order": i, "line": j, "barcode": ...}]`` for lines whose barcode
+    is not in the index (one lookup per distinct barcode)"""
+    barcodes = {line.barcode for order in orders for line in order.products}
+    missing = set(index.unknown(barcodes))
+    if not missing:
+        return []
+    return [
+        {"order": i, "line": j, "barcode": line.barcode}
+        for i, order in enumerate(orders)
+        for j, line in enumerate(order.products)
+        if line.barcode in missing
+    ]
+
+
+barcode_catalog = BarcodeCatalog()
@@ -0,0 +1,194 @@
+# app/catalog_cache.py
+# In-process cache of serialized /data-download responses.
+#
+# When dozens of devices sync within minutes of each other, the catalog is
+# queried and serialized once; everyone else gets the same bytes (already
+# gzip/brotli compressed) or a 304 if their ETag still matches.
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+from app.compression import HAS_BROTLI, compress_body, negotiate_encoding
+from app.settings import get_settings
+
+# zstd is left to the middleware: few clients ask for it
+PRECOMPRESSED = ("gzip", "br") if HAS_BROTLI else ("gzip",)
+
+
+class Snapshot:
+    """One serialized response body plus its precompressed variants"""
+
+    __slots__ = ("body", "encoded", "etag", "created_at", "size", "meta")
+
+    def __init__(self, body, meta=None, settings=None, compress=True):
+        self.body = body
+        self.encoded = {}
+        if compress:
+            settings = settings or get_settings()
+            for encoding in PRECOMPRESSED:
+                self.encoded[encoding] = compress_body(body, encoding, settings)
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.created_at = time.monotonic()
+        self.size = len(body) + sum(len(v) for v in self.encoded.values())
+        self.meta = meta or {}
+
+    def pick(self, accept_encoding, settings=None):
+        """Return ``(body, content_encoding)`` for the client's Accept-Encoding,
+        choosing among the precompressed variants like the compression
+        middleware would (see app/compression.py)"""
+        settings = settings or get_settings()
+        if settings.compression_enabled and len(self.body) >= settings.compression_min_size:
+            encoding = negotiate_encoding(accept_encoding, tuple(self.encoded))
+            if encoding is not None:
+                return self.encoded[encoding], encoding
+        # Uncompressed; the middleware may still compress it (e.g. zstd)
+        return self.body, None
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value covers ``etag``"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison: W/"x" matches "x" (proxies may weaken our tags)
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class SnapshotCache:
+    """LRU cache of Snapshots with a TTL and a total size budget"""
+
+    def __init__(self, ttl=300, max_bytes=256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _expired(self, snapshot):
+        return self.ttl and time.monotonic() - snapshot.created_at > self.ttl
+
+    def get(self, key):
+        with self._lock:
+            snapshot = self._entries.get(key)
+            if snapshot is None:
+                return None
+            if self._expired(snapshot):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def _remove(self, key):
+        snapshot = self._entries.pop(key, None)
+        if snapshot is not None:
+            self._bytes -= snapshot.size
+
+    def put(self, key, snapshot):
+        with self._lock:
+            self._remove(key)
+            if snapshot.size > self.max_bytes:
+                logging.warning(f"⚠️ Snapshot of {snapshot.size} bytes exceeds cache budget - not cached")
+                return
+            self._entries[key] = snapshot
+            self._bytes += snapshot.size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_build(self, key, builder):
+        """Return the cached snapshot for ``key``, building it at most once.
+
+        Concurrent callers for the same key wait for the first builder instead
+        of all hitting the database (blocking - call from the DB executor).
+        """
+        snapshot = self.get(key)
+        if snapshot is not None:
+            with self._lock:
+                self.hits += 1
+            return snapshot
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            snapshot = self.get(key)
+            if snapshot is not None:
+                with self._lock:
+                    self.hits += 1
+                return snapshot
+            with self._lock:
+                self.misses += 1
+            started = time.perf_counter()
+            snapshot = builder()
+            self.put(key, snapshot)
+            logging.info(
+                f"📸 Built catalog snapshot {key} in {time.perf_counter() - started:.2f}s: "
+                f"{len(snapshot.body)} bytes, variants "
+                + ", ".join(f"{name}={len(body)}" for name, body in snapshot.encoded.items())
+            )
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return snapshot
+
+    def invalidate(self, key=None):
+        """Drop one snapshot, or everything when ``key`` is None"""
+        with self._lock:
+            if key is None:
+                count = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                count = 1 if key in self._entries else 0
+                self._remove(key)
+        if count:
+            logging.info(f"🧹 Invalidated {count} catalog snapshot(s)")
+        return count
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+catalog_cache = SnapshotCache()
+
+
+def invalidate_catalog_cache(version=None, changes=None):
+    """Invalidation hook - also registered as a delta-sync change listener"""
+    return catalog_cache.invalidate()
+
+
+def snapshot_response(request, snapshot, media_type="application/json"):
+    """Serve a snapshot as raw bytes, or 304 if the client's ETag still matches"""
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept, Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+
+    body, encoding = snapshot.pick(request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["X-Uncompressed-Size"] = str(len(snapshot.body))
+        headers["X-Compressed-Size"] = str(len(body))
+    return Response(content=body, media_type=media_type, headers=headers)
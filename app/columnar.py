@@ -0,0 +1,64 @@
+# app/columnar.py
+# Compact columnar payloads (?format=columnar).
+#
+# Instead of repeating every key on every row, a dataset is sent as a column
+# header plus one array per column, built straight from the cursor tuples.
+# Repetitive string columns (product names, places) are dictionary-encoded:
+# the column holds integer codes into a per-column list of distinct values.
+# Available for full and paged downloads; delta (?since=) and streamed
+# downloads stay in row form.
+
+COLUMNAR_FORMAT = "columnar"
+ROWS_FORMAT = "rows"
+FORMATS = (ROWS_FORMAT, COLUMNAR_FORMAT)
+
+# Dictionary-encode a string column only if it has at most this share of
+# distinct values - unique columns such as barcodes would only get bigger
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def dictionary_encode(values):
+    """Return ``(distinct values, codes)``; None stays None in the codes"""
+    index = {}
+    dictionary = []
+    codes = []
+    for value in values:
+        if value is None:
+            codes.append(None)
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(dictionary)
+            dictionary.append(value)
+        codes.append(code)
+    return dictionary, codes
+
+
+def columnar_dataset(rows, fields):
+    """Build the columnar form of one dataset from cursor tuples.
+
+    Output::
+
+        {"columns": [...], "count": n, "values": [[col0...], [col1...]],
+         "dictionaries": {"name": ["distinct", ...]}}
+
+    A column listed in ``dictionaries`` carries integer codes in ``values``.
+    """
+    columns = list(zip(*rows)) if rows else [() for _ in fields]
+    values = []
+    dictionaries = {}
+    for field, column in zip(fields, columns):
+        if column and all(value is None or isinstance(value, str) for value in column):
+            distinct = len(set(column))
+            if distinct <= len(column) * DICTIONARY_MAX_RATIO:
+                dictionary, codes = dictionary_encode(column)
+                dictionaries[field] = dictionary
+                values.append(codes)
+                continue
+        values.append(list(column))
+    return {
+        "columns": list(fields),
+        "count": len(rows),
+        "values": values,
+        "dictionaries": dictionaries,
+    }
@@ -0,0 +1,222 @@
+# app/compression.py
+# Response compression negotiated per request (zstd / brotli / gzip).
+#
+# Whole bodies above ``compression_min_size`` are compressed in one go - on a
+# worker thread when they are large enough to stall the event loop - and get
+# X-Uncompressed-Size / X-Compressed-Size headers so bandwidth savings can be
+# measured per device. Streamed bodies (NDJSON) are compressed chunk by chunk
+# with a sync flush so rows still arrive as they are produced. Responses that
+# already carry a Content-Encoding (precompressed snapshots) pass through, as
+# do range-capable files, whose byte offsets must match what is on disk.
+
+import gzip
+import logging
+import zlib
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.settings import get_settings
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Server preference when the client weights encodings equally
+PREFERENCE = ("zstd", "br", "gzip")
+
+
+def available_encodings():
+    encodings = ["gzip"]
+    if HAS_BROTLI:
+        encodings.append("br")
+    if HAS_ZSTD:
+        encodings.append("zstd")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding, available=None):
+    """Pick the best encoding from an Accept-Encoding header, or None"""
+    if available is None:
+        available = available_encodings()
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        pieces = part.strip().split(";")
+        name = pieces[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            param = param.strip()
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[name] = q
+
+    candidates = []
+    for rank, name in enumerate(PREFERENCE):
+        if name not in available:
+            continue
+        q = weights.get(name, weights.get("*", 0.0))
+        if q > 0:
+            candidates.append((-q, rank, name))
+    return min(candidates)[2] if candidates else None
+
+
+def compress_body(body, encoding, settings):
+    """One-shot compression of a complete body"""
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=settings.compression_gzip_level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.compression_brotli_quality)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=settings.compression_zstd_level).compress(body)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes after every chunk"""
+
+    def __init__(self, encoding, settings):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._obj = zlib.compressobj(settings.compression_gzip_level, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=settings.compression_brotli_quality)
+        elif encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=settings.compression_zstd_level).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, chunk):
+        if self.encoding == "gzip":
+            return self._obj.compress(chunk) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._obj.process(chunk) + self._obj.flush()
+        return self._obj.compress(chunk) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        if self.encoding == "gzip":
+            return self._obj.flush(zlib.Z_FINISH)
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses per the client's Accept-Encoding"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        settings = get_settings()
+        encoding = None
+        if settings.compression_enabled:
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoding, settings, scope.get("path", ""))
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoding, settings, path):
+        self._send = send
+        self.encoding = encoding
+        self.settings = settings
+        self.path = path
+        self.start_message = None
+        self.passthrough = False
+        self.streamer = None
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until we see the first body chunk
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            status = message["status"]
+            if (
+                "content-encoding" in headers
+                or "content-range" in headers
+                or "accept-ranges" in headers
+                or status < 200 or status in (204, 206, 304)
+            ):
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.streamer is None and self.start_message is not None:
+            if not more_body:
+                await self._send_whole(body)
+                return
+            await self._start_stream()
+
+        self.raw_bytes += len(body)
+        data = self.streamer.compress(body) if body else b""
+        if not more_body:
+            data += self.streamer.finish()
+            logging.debug(
+                f"🗜️ {self.path} streamed {self.encoding}: {self.raw_bytes} -> {self.sent_bytes + len(data)} bytes"
+            )
+        self.sent_bytes += len(data)
+        await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+    async def _send_whole(self, body):
+        start, self.start_message = self.start_message, None
+        if len(body) < self.settings.compression_min_size:
+            await self._send(start)
+            await self._send({"type": "http.response.body", "body": body})
+            return
+
+        if len(body) >= self.settings.compression_offload_size:
+            # Large bodies: keep the event loop free for other requests
+            compressed = await anyio.to_thread.run_sync(compress_body, body, self.encoding, self.settings)
+        else:
+            compressed = compress_body(body, self.encoding, self.settings)
+
+        headers = MutableHeaders(raw=start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        headers["X-Uncompressed-Size"] = str(len(body))
+        headers["X-Compressed-Size"] = str(len(compressed))
+        headers.add_vary_header("Accept-Encoding")
+        logging.debug(f"🗜️ {self.path} {self.encoding}: {len(body)} -> {len(compressed)} bytes")
+
+        await self._send(start)
+        await self._send({"type": "http.response.body", "body": compressed})
+
+    async def _start_stream(self):
+        start, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["content-length"]
+        headers.add_vary_header("Accept-Encoding")
+        self.streamer = StreamCompressor(self.encoding, self.settings)
+        await self._send(start)
@@ -0,0 +1,277 @@
+# app/datasets.py
+# Registry of the datasets synced to the phones.
+#
+# Each dataset is declared once - SQL, output field names, key columns - and
+# every download path (full/cached, NDJSON, delta, paged, SQLite export)
+# works from the registry. Built-in datasets are registered below; extra ones
+# can be declared under "datasets" in config.json:
+#
+#   "datasets": [
+#     {"name": "all_masters", "columns": ["code", "name", "super_code"],
+#      "from": "FROM acc_master", "fields": ["code", "name", "super_code"],
+#      "key": ["code"], "aliases": ["accounts"]}
+#   ]
+#
+# ("sql" may replace "columns" + "from", but then fields= cannot be pushed
+# down into the SELECT list.)
+#
+# Clients pick a subset with ?datasets=products,master_data and the columns
+# they need with ?fields=products:code,barcode,salesprice.
+
+import logging
+import threading
+from collections import namedtuple
+
+from app.nesting import Nesting
+from app.settings import get_settings
+
+# key_fields identify a row for delta sync (see app/delta_sync.py);
+# unique_key says whether the source guarantees they are unique.
+# page_keys are SQL expressions matching the leading key_fields, for keyset
+# pagination; a dataset with page_keys must not have its own WHERE clause,
+# and nullable key columns need COALESCE(..., '') (see app/pagination.py).
+# Page keys covering every key field need a unique key; a shorter prefix
+# pages by whole groups of rows instead.
+# shard_query returns the first key's values in order, for range sharding.
+# columns (SQL expressions, one per field) + source (FROM ... clause) let
+# ?fields= projections be pushed down into the SELECT list; projectable is
+# the whitelist of fields a client may ask for (default: all of them).
+# nesting enables ?shape=nested (see app/nesting.py).
+Dataset = namedtuple(
+    "Dataset",
+    ["name", "query", "fields", "key_fields", "page_keys", "shard_query", "aliases",
+     "columns", "source", "projectable", "nesting", "unique_key"],
+    defaults=(None, None, (), None, None, None, None, True),
+)
+
+
+def select_query(columns, source):
+    """SELECT statement for a column list and a FROM ... clause"""
+    return "\n    SELECT\n        " + ",\n        ".join(columns) + "\n    " + source.strip() + "\n"
+
+
+MASTER_DATASET = "master_data"
+MASTER_COLUMNS = ("code", "name", "place")
+MASTER_SOURCE = "FROM acc_master WHERE super_code = 'SUNCR'"
+MASTER_QUERY = select_query(MASTER_COLUMNS, MASTER_SOURCE)
+MASTER_FIELDS = ("code", "name", "place")
+MASTER_KEY = ("code",)
+
+PRODUCT_DATASET = "product_data"
+PRODUCT_COLUMNS = ("p.code", "p.name", "pb.barcode", "pb.quantity", "pb.salesprice", "pb.bmrp", "pb.cost")
+PRODUCT_SOURCE = """
+    FROM
+        acc_product p
+    LEFT JOIN
+        acc_productbatch pb
+    ON
+        p.code = pb.productcode
+"""
+PRODUCT_QUERY = select_query(PRODUCT_COLUMNS, PRODUCT_SOURCE)
+PRODUCT_FIELDS = ("code", "name", "barcode", "quantity", "salesprice", "bmrp", "cost")
+PRODUCT_KEY = ("code", "barcode")
+# acc_productbatch does not guarantee unique (code, barcode), so products are
+# paged by whole product code
+PRODUCT_PAGE_KEYS = ("p.code",)
+# Products without batches have a NULL barcode, which sorts as ''
+PRODUCT_ORDER = ("p.code", "COALESCE(pb.barcode, '')")
+PRODUCT_SHARD_QUERY = "SELECT code FROM acc_product ORDER BY code"
+# ?shape=nested: one entry per product, its batches and stock/price aggregates
+PRODUCT_NESTING = Nesting(
+    parent_fields=("code", "name"),
+    child_name="batches",
+    aggregates=(
+        ("batch_count", "count", None),
+        ("total_quantity", "sum", "quantity"),
+        ("min_salesprice", "min", "salesprice"),
+        ("max_salesprice", "max", "salesprice"),
+    ),
+    order_by=PRODUCT_ORDER,
+)
+
+
+class UnknownDataset(Exception):
+    """Raised for dataset names that are not in the registry"""
+
+
+class InvalidProjection(Exception):
+    """Raised for ?fields= values a dataset does not allow"""
+
+
+_registry = {}   # name -> Dataset, in registration (= download) order
+_registry_lock = threading.Lock()
+_config_datasets = (None, ())   # (settings they were parsed from, datasets)
+
+
+def register_dataset(dataset):
+    """Add a dataset to the registry (module-level declarations)"""
+    validate_dataset(dataset)
+    with _registry_lock:
+        _registry[dataset.name] = dataset
+    return dataset
+
+
+def validate_dataset(dataset):
+    if not dataset.name or not dataset.query or not dataset.fields:
+        raise Exception(f"❌ Dataset {dataset.name!r} needs a name, a query and fields")
+    missing = [field for field in dataset.key_fields if field not in dataset.fields]
+    if not dataset.key_fields or missing:
+        raise Exception(f"❌ Dataset {dataset.name!r}: key fields {missing or '[]'} not in its fields")
+    if dataset.page_keys and len(dataset.page_keys) > len(dataset.key_fields):
+        raise Exception(f"❌ Dataset {dataset.name!r}: page_keys must match leading key fields")
+    if dataset.page_keys and len(dataset.page_keys) == len(dataset.key_fields) and not dataset.unique_key:
+        # Rows sharing the last page key would be skipped by "strictly after"
+        raise Exception(
+            f"❌ Dataset {dataset.name!r}: keyset paging needs unique keys; "
+            "use fewer page_keys to page by whole groups"
+        )
+    if dataset.columns is not None and len(dataset.columns) != len(dataset.fields):
+        raise Exception(f"❌ Dataset {dataset.name!r}: columns must match fields one to one")
+    unknown = [field for field in dataset.projectable or () if field not in dataset.fields]
+    if unknown:
+        raise Exception(f"❌ Dataset {dataset.name!r}: projectable fields {unknown} not in its fields")
+
+
+def dataset_from_config(entry):
+    """Build a Dataset from one entry of the "datasets" list in config.json"""
+    columns = tuple(entry["columns"]) if entry.get("columns") else None
+    source = entry.get("from")
+    query = entry.get("sql")
+    if columns and source:
+        query = select_query(columns, source)
+    dataset = Dataset(
+        name=entry.get("name"),
+        query=query,
+        fields=tuple(entry.get("fields") or ()),
+        key_fields=tuple(entry.get("key") or ()),
+        page_keys=tuple(entry["page_keys"]) if entry.get("page_keys") else None,
+        shard_query=entry.get("shard_sql"),
+        aliases=tuple(entry.get("aliases") or ()),
+        columns=columns if source else None,
+        source=source if columns else None,
+        projectable=tuple(entry["projectable"]) if entry.get("projectable") else None,
+        unique_key=bool(entry.get("unique_key", True)),
+    )
+    validate_dataset(dataset)
+    return dataset
+
+
+def _load_config_datasets():
+    """Datasets declared in config.json, re-parsed whenever the file changes"""
+    global _config_datasets
+    settings = get_settings()
+    parsed_from, datasets = _config_datasets
+    if parsed_from is settings:
+        return datasets
+
+    datasets = []
+    for entry in settings.get("datasets") or []:
+        try:
+            datasets.append(dataset_from_config(entry))
+        except Exception as e:
+            logging.error(f"❌ Ignoring dataset {entry.get('name')!r} from config.json: {str(e)}")
+    if datasets:
+        logging.info(f"📚 Datasets from config.json: {[dataset.name for dataset in datasets]}")
+    _config_datasets = (settings, tuple(datasets))
+    return _config_datasets[1]
+
+
+def get_datasets():
+    """All datasets in download order: built-ins first, then config.json"""
+    with _registry_lock:
+        datasets = dict(_registry)
+    for dataset in _load_config_datasets():
+        # Config may not silently replace a built-in
+        datasets.setdefault(dataset.name, dataset)
+    return tuple(datasets.values())
+
+
+def get_dataset(name):
+    for dataset in get_datasets():
+        if name == dataset.name or name in dataset.aliases:
+            return dataset
+    raise UnknownDataset(f"Unknown dataset {name!r} - available: {[d.name for d in get_datasets()]}")
+
+
+def select_datasets(spec=None):
+    """Datasets named in a ``?datasets=`` value (comma separated names or
+    aliases), in download order; all of them when ``spec`` is empty"""
+    if not spec:
+        return get_datasets()
+    wanted = {get_dataset(name.strip()).name for name in spec.split(",") if name.strip()}
+    return tuple(dataset for dataset in get_datasets() if dataset.name in wanted)
+
+
+def project_dataset(dataset, fields):
+    """Copy of ``dataset`` reading only ``fields`` (plus its key fields, which
+    delta sync, paging and the phones' upserts rely on)"""
+    if dataset.columns is None:
+        raise InvalidProjection(f"Dataset {dataset.name} does not support fields=")
+    allowed = dataset.projectable or dataset.fields
+    rejected = [field for field in fields if field not in allowed]
+    if rejected:
+        raise InvalidProjection(f"Fields {rejected} not available for {dataset.name} - allowed: {list(allowed)}")
+
+    wanted = set(fields) | set(dataset.key_fields)
+    # Keep the dataset's own column order
+    indexes = [i for i, field in enumerate(dataset.fields) if field in wanted]
+    columns = tuple(dataset.columns[i] for i in indexes)
+    return dataset._replace(
+        query=select_query(columns, dataset.source),
+        fields=tuple(dataset.fields[i] for i in indexes),
+        columns=columns,
+    )
+
+
+def apply_projections(datasets, specs):
+    """Apply ``?fields=`` values to the selected datasets.
+
+    Each value is ``dataset:field,field`` (name or alias); the dataset prefix
+    may be left out when only one dataset is selected. Datasets without a
+    projection are returned unchanged.
+    """
+    requested = {}
+    for spec in specs:
+        for part in spec.split(";"):
+            if not part.strip():
+                continue
+            name, sep, field_list = part.partition(":")
+            if sep:
+                target = get_dataset(name.strip()).name
+            elif len(datasets) == 1:
+                target, field_list = datasets[0].name, name
+            else:
+                raise InvalidProjection("fields= needs a dataset prefix, e.g. fields=products:code,barcode")
+            fields = [field.strip() for field in field_list.split(",") if field.strip()]
+            requested.setdefault(target, []).extend(fields)
+
+    selected = {dataset.name for dataset in datasets}
+    unselected = [name for name in requested if name not in selected]
+    if unselected:
+        raise InvalidProjection(f"fields= given for datasets that are not being downloaded: {unselected}")
+    return tuple(
+        project_dataset(dataset, requested[dataset.name]) if dataset.name in requested else dataset
+        for dataset in datasets
+    )
+
+
+def rows_to_dicts(rows, fields):
+    """Turn cursor tuples into the dicts the mobile app expects"""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+register_dataset(Dataset(
+    MASTER_DATASET, MASTER_QUERY, MASTER_FIELDS, MASTER_KEY,
+    aliases=("masters", "master"),
+    columns=MASTER_COLUMNS, source=MASTER_SOURCE,
+))
+register_dataset(Dataset(
+    PRODUCT_DATASET, PRODUCT_QUERY, PRODUCT_FIELDS, PRODUCT_KEY,
+    page_keys=PRODUCT_PAGE_KEYS, shard_query=PRODUCT_SHARD_QUERY,
+    aliases=("products", "product"),
+    columns=PRODUCT_COLUMNS, source=PRODUCT_SOURCE, nesting=PRODUCT_NESTING,
+    unique_key=False,
+))
+
+# Built-in datasets, in download order
+DOWNLOAD_DATASETS = tuple(_registry.values())
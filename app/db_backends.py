@@ -0,0 +1,222 @@
+# app/db_backends.py
+
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import time
+from decimal import Decimal
+
+# Hardcoded DB credentials
+DB_USER = "dba"
+DB_PASSWORD = "(*$^)"
+
+
+class SQLAnywhereBackend:
+    """Production backend: the customer's SQL Anywhere ERP database via ODBC DSN"""
+
+    name = "sqlanywhere"
+
+    def __init__(self, dsn, userid=DB_USER, password=DB_PASSWORD):
+        self.dsn = dsn
+        self.userid = userid
+        self.password = password
+
+    def connect(self):
+        if not self.dsn:
+            raise Exception("❌ DSN not found in config.json - please add 'dsn' field")
+        # Imported lazily so SQLite-only setups don't need the SQL Anywhere client
+        import sqlanydb
+        return sqlanydb.connect(dsn=self.dsn, userid=self.userid, password=self.password)
+
+    def describe(self):
+        return f"SQL Anywhere DSN '{self.dsn or 'NOT SET'}' as {self.userid}"
+
+    def limit_query(self, query, limit):
+        """Restrict an ordered SELECT to its first ``limit`` rows"""
+        query = query.lstrip()
+        return f"SELECT TOP {int(limit)} " + query[len("SELECT"):].lstrip()
+
+
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS acc_users (
+        id TEXT PRIMARY KEY,
+        pass TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS acc_master (
+        code TEXT PRIMARY KEY,
+        name TEXT,
+        place TEXT,
+        super_code TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_acc_master_super_code ON acc_master (super_code)",
+    """CREATE TABLE IF NOT EXISTS acc_product (
+        code TEXT PRIMARY KEY,
+        name TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS acc_productbatch (
+        productcode TEXT NOT NULL,
+        barcode TEXT,
+        quantity NUMERIC,
+        salesprice NUMERIC,
+        bmrp NUMERIC,
+        cost NUMERIC
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_acc_productbatch_productcode ON acc_productbatch (productcode)",
+    "CREATE INDEX IF NOT EXISTS ix_acc_productbatch_barcode ON acc_productbatch (barcode)",
+    """CREATE TABLE IF NOT EXISTS acc_purchaseordermaster (
+        slno INTEGER PRIMARY KEY,
+        orderno INTEGER,
+        supplier TEXT,
+        otype TEXT,
+        userid TEXT,
+        orderdate TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS acc_purchaseorderdetails (
+        masterslno INTEGER,
+        slno INTEGER PRIMARY KEY,
+        barcode TEXT,
+        qty NUMERIC,
+        rate NUMERIC,
+        mrp NUMERIC
+    )""",
+]
+
+# sqlanydb hands back Decimal for NUMERIC columns; let SQLite accept them too
+sqlite3.register_adapter(Decimal, str)
+
+
+class SQLiteBackend:
+    """Stand-in backend with the ERP table layout, for local runs and benchmarks"""
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def describe(self):
+        return f"SQLite file {self.path}"
+
+    def limit_query(self, query, limit):
+        """Restrict an ordered SELECT to its first ``limit`` rows"""
+        return f"{query.rstrip()} LIMIT {int(limit)}"
+
+    def create_schema(self, conn=None):
+        """Create the ERP tables this server reads and writes (idempotent)"""
+        own = conn is None
+        conn = conn or self.connect()
+        try:
+            for statement in SQLITE_SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            if own:
+                conn.close()
+
+    def seed(self, batches=10000, batches_per_product=3, masters=500, users=5,
+             chunk_size=10000, random_seed=42):
+        """Fill the tables with synthetic data at the requested scale.
+
+        ``batches`` is the number of acc_productbatch rows; products are
+        derived from it via ``batches_per_product``. Existing rows are wiped.
+        """
+        rng = random.Random(random_seed)
+        conn = self.connect()
+        try:
+            self.create_schema(conn)
+            for table in ("acc_users", "acc_master", "acc_product", "acc_productbatch",
+                          "acc_purchaseordermaster", "acc_purchaseorderdetails"):
+                conn.execute(f"DELETE FROM {table}")
+
+            conn.executemany(
+                "INSERT INTO acc_users (id, pass) VALUES (?, ?)",
+                [(f"user{i}", f"pass{i}") for i in range(1, users + 1)],
+            )
+
+            places = ["KOCHI", "CALICUT", "THRISSUR", "KANNUR", "KOLLAM", "PALAKKAD"]
+            conn.executemany(
+                "INSERT INTO acc_master (code, name, place, super_code) VALUES (?, ?, ?, ?)",
+                [
+                    (f"M{i:06d}", f"SUPPLIER {i}", rng.choice(places),
+                     "SUNCR" if i % 4 else "OTHER")
+                    for i in range(1, masters + 1)
+                ],
+            )
+
+            products = max(1, batches // max(1, batches_per_product))
+            for start in range(0, products, chunk_size):
+                conn.executemany(
+                    "INSERT INTO acc_product (code, name) VALUES (?, ?)",
+                    [(f"P{i:07d}", f"PRODUCT {i}") for i in range(start, min(start + chunk_size, products))],
+                )
+
+            for start in range(0, batches, chunk_size):
+                rows = []
+                for i in range(start, min(start + chunk_size, batches)):
+                    price = round(rng.uniform(5, 2000), 2)
+                    rows.append((
+                        f"P{i % products:07d}",
+                        str(8900000000000 + i),
+                        rng.randint(0, 500),
+                        price,
+                        round(price * 1.1, 2),
+                        round(price * 0.8, 2),
+                    ))
+                conn.executemany(
+                    "INSERT INTO acc_productbatch (productcode, barcode, quantity, salesprice, bmrp, cost) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            conn.commit()
+            return {"users": users, "masters": masters, "products": products, "batches": batches}
+        finally:
+            conn.close()
+
+
+BACKENDS = {
+    SQLAnywhereBackend.name: SQLAnywhereBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+def create_backend(settings):
+    """Build the backend selected by ``db_backend`` in config.json"""
+    name = (settings.db_backend or SQLAnywhereBackend.name).lower()
+    if name == SQLiteBackend.name:
+        path = settings.sqlite_path or "syncanywhere.db"
+        if not os.path.isabs(path) and settings.path:
+            # Relative paths are relative to config.json, like the logs folder
+            path = os.path.join(os.path.dirname(settings.path), path)
+        return SQLiteBackend(path)
+    if name == SQLAnywhereBackend.name:
+        return SQLAnywhereBackend(settings.dsn)
+    raise Exception(f"❌ Unknown db_backend '{settings.db_backend}' - use one of {sorted(BACKENDS)}")
+
+
+if __name__ == "__main__":
+    # Build a seeded SQLite database for local runs / benchmarks:
+    #   python -m app.db_backends bench.db --batches 200000
+    parser = argparse.ArgumentParser(description="Create and seed a SQLite stand-in ERP database")
+    parser.add_argument("path", help="SQLite file to create")
+    parser.add_argument("--batches", type=int, default=10000, help="acc_productbatch rows")
+    parser.add_argument("--batches-per-product", type=int, default=3)
+    parser.add_argument("--masters", type=int, default=500)
+    parser.add_argument("--users", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    started = time.perf_counter()
+    counts = SQLiteBackend(args.path).seed(
+        batches=args.batches,
+        batches_per_product=args.batches_per_product,
+        masters=args.masters,
+        users=args.users,
+    )
+    print(f"✅ Seeded {args.path} in {time.perf_counter() - started:.1f}s: {counts}")
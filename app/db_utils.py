@@ -1,21 +1,18 @@
 # app/db_utils.py
 
-import sqlanydb
-import json
 import os
-import socket
 import logging
 import sys
-import subprocess
-import platform
-
-# Try to import netifaces, but don't fail if not available
-try:
-    import netifaces
-    HAS_NETIFACES = True
-except ImportError:
-    HAS_NETIFACES = False
-    logging.warning("⚠️ netifaces not available - using basic network detection")
+import asyncio
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from app.settings import CONFIG_PATH, get_settings, update_config_file
+from app.network_utils import get_all_local_ips, get_best_local_ip
+from app.db_backends import DB_USER, create_backend
 
 logging.basicConfig(
     filename='app.log',
@@ -24,160 +21,6 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-def get_config_path():
-    """Get the best-guess path to config.json for EXE and dev environments"""
-    if getattr(sys, 'frozen', False):
-        # When running from PyInstaller EXE, use the EXE's directory
-        base_path = os.path.dirname(sys.executable)
-    else:
-        # When running normally (script), use script location
-        base_path = os.path.dirname(os.path.abspath(__file__))
-
-    return os.path.join(base_path, "config.json")
-
-CONFIG_PATH = get_config_path()
-
-# Hardcoded DB credentials 
-DB_USER = "dba"
-DB_PASSWORD = "(*$^)"
-
-def get_all_local_ips():
-    """Get all possible local IP addresses using multiple methods"""
-    ips = []
-    
-    # Method 1: Using netifaces if available (most reliable)
-    if HAS_NETIFACES:
-        try:
-            for interface in netifaces.interfaces():
-                if interface.startswith('lo'):  # Skip loopback
-                    continue
-                addresses = netifaces.ifaddresses(interface)
-                if netifaces.AF_INET in addresses:
-                    for addr in addresses[netifaces.AF_INET]:
-                        ip = addr['addr']
-                        if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                            if ip not in ips:
-                                ips.append(ip)
-        except Exception as e:
-            logging.warning(f"⚠️ netifaces method failed: {e}")
-    
-    # Method 2: Platform-specific commands
-    try:
-        if platform.system() == "Windows":
-            # Windows ipconfig
-            result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=10)
-            lines = result.stdout.split('\n')
-            for line in lines:
-                line = line.strip()
-                if 'IPv4 Address' in line and ':' in line:
-                    ip = line.split(':')[1].strip()
-                    if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                        if ip not in ips:
-                            ips.append(ip)
-        else:
-            # Linux/Mac ifconfig or ip command
-            try:
-                result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True, timeout=10)
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if 'inet ' in line and 'scope global' in line:
-                        parts = line.strip().split()
-                        for part in parts:
-                            if '/' in part and not part.startswith('127.') and not part.startswith('169.254.'):
-                                ip = part.split('/')[0]
-                                if ip not in ips:
-                                    ips.append(ip)
-            except:
-                # Fallback to ifconfig
-                result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=10)
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if 'inet ' in line and 'netmask' in line:
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            ip = parts[1]
-                            if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                                if ip not in ips:
-                                    ips.append(ip)
-    except Exception as e:
-        logging.warning(f"⚠️ Platform-specific command failed: {e}")
-    
-    # Method 3: Socket method (fallback)
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            s.connect(("8.8.8.8", 80))
-            primary_ip = s.getsockname()[0]
-            if primary_ip not in ips and not primary_ip.startswith('127.'):
-                ips.append(primary_ip)
-    except Exception as e:
-        logging.warning(f"⚠️ Socket method failed: {e}")
-    
-    # Method 4: Hostname method (backup)
-    try:
-        hostname = socket.gethostname()
-        host_ip = socket.gethostbyname(hostname)
-        if host_ip not in ips and not host_ip.startswith('127.'):
-            ips.append(host_ip)
-    except Exception as e:
-        logging.warning(f"⚠️ Hostname method failed: {e}")
-    
-    # Method 5: getaddrinfo method
-    try:
-        hostname = socket.gethostname()
-        for info in socket.getaddrinfo(hostname, None, socket.AF_INET):
-            ip = info[4][0]
-            if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                if ip not in ips:
-                    ips.append(ip)
-    except Exception as e:
-        logging.warning(f"⚠️ getaddrinfo method failed: {e}")
-    
-    # Fallback - at least return localhost
-    if not ips:
-        ips.append("127.0.0.1")
-        logging.warning("⚠️ Only localhost IP found - mobile connection may not work")
-    
-    # Sort IPs by priority (common home networks first)
-    def ip_priority(ip):
-        if ip.startswith('192.168.1.'):
-            return 1
-        elif ip.startswith('192.168.0.'):
-            return 2
-        elif ip.startswith('192.168.'):
-            return 3
-        elif ip.startswith('10.'):
-            return 4
-        elif ip.startswith('172.'):
-            return 5
-        else:
-            return 6
-    
-    ips.sort(key=ip_priority)
-    
-    logging.info(f"📡 Found {len(ips)} IP addresses: {ips}")
-    return ips
-
-def get_best_local_ip():
-    """Get the most likely IP address for mobile device connection"""
-    ips = get_all_local_ips()
-    
-    # Prefer 192.168.1.x (most common home networks)
-    wifi_ips = [ip for ip in ips if ip.startswith('192.168.1.')]
-    if wifi_ips:
-        return wifi_ips[0]
-    
-    # Then prefer other 192.168.x.x
-    wifi_ips = [ip for ip in ips if ip.startswith('192.168.')]
-    if wifi_ips:
-        return wifi_ips[0]
-    
-    # Then prefer 10.x.x.x (corporate networks)
-    corporate_ips = [ip for ip in ips if ip.startswith('10.')]
-    if corporate_ips:
-        return corporate_ips[0]
-    
-    # Return first available
-    return ips[0] if ips else "127.0.0.1"
 
 def debug_config_locations():
     """Debug function to find all possible config file locations"""
@@ -212,99 +55,429 @@ def debug_config_locations():
     
     return possible_paths
 
-def load_config():
-    """Load config with extensive debugging"""
-    
-    # 🔍 DEBUG: Show all possible config locations
+def log_config_locations():
+    """Log every candidate config.json location - startup diagnostics only"""
     logging.info("🔍 DEBUG: Looking for config.json in these locations:")
-    possible_paths = debug_config_locations()
-    
-    for name, path, exists in possible_paths:
+    for name, path, exists in debug_config_locations():
         status = "✅ EXISTS" if exists else "❌ NOT FOUND"
         logging.info(f"   {name}: {path} - {status}")
-        
-        # If file exists, show its contents
-        if exists:
-            try:
-                with open(path, 'r') as f:
-                    content = json.load(f)
-                logging.info(f"      📄 Content: {content}")
-            except Exception as e:
-                logging.info(f"      ❌ Error reading: {e}")
-    
-    # Now try to load the config using the original method
-    config_path = CONFIG_PATH
-    logging.info(f"🎯 Using config path: {config_path}")
-    
-    try:
-        if not os.path.exists(config_path):
-            raise Exception(f"❌ Config file not found at: {config_path}")
-        
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-        
-        logging.info(f"📋 Loaded config content: {config}")
-        
-        # Get current IP and update ONLY the IP field
-        current_ip = get_best_local_ip()
-        all_ips = get_all_local_ips()
-        
-        config["ip"] = current_ip
-        config["all_ips"] = all_ips  # Store all IPs for reference
-        
-        # Write back to config file
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=2)
-            
-        logging.info(f"📡 Updated config with current IP: {current_ip}")
-        logging.info(f"📡 All available IPs: {all_ips}")
-        logging.info(f"📋 Final DSN from config: {config.get('dsn', 'NOT SET')}")
-        return config
-        
-    except Exception as e:
-        logging.error(f"❌ Error loading config from {config_path}: {e}")
-        raise Exception(f"Config file error: {e}")
+    logging.info(f"🎯 Using config path: {CONFIG_PATH}")
+
+def load_config():
+    """Return the current config as a plain dict (cached, no disk writes)"""
+    return dict(get_settings().raw)
+
+def save_config_ips(all_ips, current_ip):
+    """Store detected IPs in config.json for reference.
+
+    Called at startup and when the network changes - never on a request path.
+    """
+    update_config_file({"ip": current_ip, "all_ips": list(all_ips)})
+    logging.info(f"📡 Updated config with current IP: {current_ip}")
+    logging.info(f"📡 All available IPs: {list(all_ips)}")
+
+def get_backend():
+    """The database backend selected in config.json (sqlanywhere or sqlite)"""
+    return create_backend(get_settings())
 
 def get_connection():
-    """Get database connection using ONLY what's in your config.json"""
+    """Open a new raw connection on the configured backend (the pool's factory)"""
+    backend = get_backend()
     try:
-        config = load_config()
-        
-        # Check if DSN is set in config
-        dsn = config.get("dsn")
-        if not dsn:
-            raise Exception("❌ DSN not found in config.json - please add 'dsn' field")
-        
-        logging.info(f"🔄 Attempting connection with DSN: {dsn}")
-        
-        # Try connection with your exact config values
-        conn = sqlanydb.connect(
-            dsn=dsn,
-            userid=DB_USER,
-            password=DB_PASSWORD
-        )
-        
+        logging.info(f"🔄 Attempting connection: {backend.describe()}")
+        conn = backend.connect()
         logging.info(f"✅ Database connection established successfully!")
-        logging.info(f"   📋 DSN: {dsn}")
-        logging.info(f"   👤 User: {DB_USER}")
+        logging.info(f"   📋 Backend: {backend.describe()}")
         return conn
 
     except Exception as e:
         # Detailed error reporting
-        config = load_config() if 'config' not in locals() else config
-        
+        dsn = get_settings().dsn
         logging.error(f"❌ Database connection failed!")
-        logging.error(f"   📋 DSN tried: {config.get('dsn', 'NOT SET')}")
-        logging.error(f"   👤 User: {DB_USER}")
+        logging.error(f"   📋 Backend tried: {backend.describe()}")
         logging.error(f"   🔍 Error details: {str(e)}")
         logging.error(f"")
         logging.error(f"🔧 Troubleshooting checklist:")
         logging.error(f"   1. Is SQL Anywhere server running?")
-        logging.error(f"   2. Is DSN '{config.get('dsn', 'NOT SET')}' configured correctly?")
-        logging.error(f"   3. Can you connect manually with these credentials?")
+        logging.error(f"   2. Is DSN '{dsn or 'NOT SET'}' configured correctly?")
+        logging.error(f"   3. Can you connect manually with these credentials ({DB_USER})?")
         logging.error(f"   4. Check Windows ODBC Data Sources for your DSN")
         
-        raise Exception(f"Connection failed with DSN '{config.get('dsn', 'NOT SET')}': {str(e)}")
+        raise Exception(f"Connection failed ({backend.describe()}): {str(e)}")
+
+
+# ---------------------------------------------------------------------------
+# Connection pool
+# ---------------------------------------------------------------------------
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available in time"""
+
+
+class _PooledConnection:
+    """A raw DB connection plus the bookkeeping the pool needs"""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections.
+
+    Connections are validated on checkout, recycled after ``max_lifetime``
+    seconds and closed after ``idle_timeout`` seconds of idleness (never
+    dropping below ``min_size``).
+    """
+
+    def __init__(self, connect, min_size=2, max_size=10, max_lifetime=1800,
+                 idle_timeout=300, checkout_timeout=30, validation_query="SELECT 1"):
+        if max_size < 1:
+            raise ValueError("pool max_size must be at least 1")
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.validation_query = validation_query
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0          # open connections (idle + in use + being opened)
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._total_checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._validation_failures = 0
+
+        self._fill_to_min()
+
+        self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    # -- connection lifecycle ------------------------------------------------
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created += 1
+        return _PooledConnection(conn)
+
+    def _close_quietly(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception as e:
+            logging.warning(f"⚠️ Error closing pooled connection: {e}")
+
+    def _fill_to_min(self):
+        """Open connections until the pool holds ``min_size`` of them"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pooled = self._open()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                logging.warning(f"⚠️ Could not pre-open pooled connection: {e}")
+                return
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def _expired(self, pooled, now):
+        return self.max_lifetime and now - pooled.created_at > self.max_lifetime
+
+    def _is_valid(self, pooled):
+        try:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute(self.validation_query)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception as e:
+            logging.warning(f"⚠️ Pooled connection failed validation: {e}")
+            return False
+
+    def _discard(self, pooled):
+        self._close_quietly(pooled)
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    # -- checkout / checkin --------------------------------------------------
+
+    def acquire(self, timeout=None):
+        """Check out a validated connection, waiting up to ``timeout`` seconds"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            pooled = None
+            open_new = False
+            with self._cond:
+                self._waiting += 1
+                try:
+                    while True:
+                        if self._closed:
+                            raise PoolTimeout("Connection pool is closed")
+                        if self._idle:
+                            pooled = self._idle.pop()
+                            break
+                        if self._size < self.max_size:
+                            self._size += 1
+                            open_new = True
+                            break
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(
+                                f"No database connection available after {timeout}s "
+                                f"({self._in_use}/{self.max_size} in use)"
+                            )
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            if open_new:
+                try:
+                    pooled = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif self._expired(pooled, time.monotonic()):
+                self._discard(pooled)
+                continue
+            elif not self._is_valid(pooled):
+                with self._cond:
+                    self._validation_failures += 1
+                self._discard(pooled)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._total_checkouts += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+            return pooled
+
+    def release(self, pooled, broken=False):
+        """Return a connection to the pool, discarding it if it is unusable"""
+        if not broken:
+            try:
+                # Never hand the next request a half-finished transaction
+                pooled.conn.rollback()
+            except Exception as e:
+                logging.warning(f"⚠️ Rollback on checkin failed, discarding connection: {e}")
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+
+        if broken or self._closed or self._expired(pooled, time.monotonic()):
+            self._discard(pooled)
+            return
+
+        pooled.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager yielding a pooled connection"""
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled.conn
+        finally:
+            self.release(pooled)
+
+    # -- maintenance ---------------------------------------------------------
+
+    def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout or 60, self.max_lifetime or 60, 60) / 2)
+        while True:
+            time.sleep(interval)
+            if self._closed:
+                return
+            try:
+                self.evict()
+            except Exception as e:
+                logging.warning(f"⚠️ Pool eviction failed: {e}")
+
+    def evict(self):
+        """Close expired connections and idle ones beyond ``min_size``"""
+        now = time.monotonic()
+        to_close = []
+        with self._cond:
+            keep = deque()
+            # Oldest-used first, so the warmest connections survive
+            for pooled in sorted(self._idle, key=lambda p: p.last_used):
+                idle_for = now - pooled.last_used
+                surplus = self._size - len(to_close) > self.min_size
+                if self._expired(pooled, now) or (
+                    self.idle_timeout and idle_for > self.idle_timeout and surplus
+                ):
+                    to_close.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+
+        for pooled in to_close:
+            self._discard(pooled)
+        if to_close:
+            logging.info(f"♻️ Pool evicted {len(to_close)} idle/expired connection(s)")
+        self._fill_to_min()
+
+    def stats(self):
+        """Snapshot of pool counters for monitoring"""
+        with self._cond:
+            checkouts = self._total_checkouts
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "total_checkouts": checkouts,
+                "avg_checkout_wait_ms": round(self._total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_checkout_wait_ms": round(self._max_wait * 1000, 3),
+                "checkout_timeouts": self._timeouts,
+                "connections_created": self._created,
+                "connections_discarded": self._discarded,
+                "validation_failures": self._validation_failures,
+            }
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                logging.info(
+                    f"🏊 Creating DB connection pool: min={settings.pool_min_size}, "
+                    f"max={settings.pool_max_size}, lifetime={settings.pool_max_lifetime}s, "
+                    f"idle={settings.pool_idle_timeout}s"
+                )
+                _pool = ConnectionPool(
+                    get_connection,
+                    min_size=settings.pool_min_size,
+                    max_size=settings.pool_max_size,
+                    max_lifetime=settings.pool_max_lifetime,
+                    idle_timeout=settings.pool_idle_timeout,
+                    checkout_timeout=settings.pool_checkout_timeout,
+                )
+    return _pool
+
+def get_db(timeout=None):
+    """Context manager yielding a pooled connection: ``with get_db() as conn:``"""
+    return get_pool().connection(timeout)
+
+def close_pool():
+    """Close the process-wide pool (application shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def get_pool_stats():
+    """Pool counters, or ``None`` if the pool has not been created yet"""
+    return _pool.stats() if _pool is not None else None
+
+# ---------------------------------------------------------------------------
+# DB executor
+# ---------------------------------------------------------------------------
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+def get_db_executor():
+    """Dedicated thread pool for blocking DB calls, sized to match the pool.
+
+    Keeping DB work off Starlette's shared threadpool means a slow query can
+    only ever queue behind other DB work, never behind /status or token checks.
+    """
+    global _db_executor
+    if _db_executor is None:
+        with _db_executor_lock:
+            if _db_executor is None:
+                settings = get_settings()
+                workers = settings.db_executor_size or settings.pool_max_size
+                logging.info(f"🧵 Creating DB executor with {workers} worker threads")
+                _db_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-worker")
+    return _db_executor
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking DB function on the DB executor and await its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+_fetch_executor = None
+
+def get_fetch_executor():
+    """Threads for the parallel dataset reads inside one download.
+
+    Separate from the DB executor: the download builder already runs on a
+    DB worker, and waiting there on more DB-executor jobs could deadlock
+    once every worker is busy doing the same.
+    """
+    global _fetch_executor
+    if _fetch_executor is None:
+        with _db_executor_lock:
+            if _fetch_executor is None:
+                settings = get_settings()
+                workers = settings.db_executor_size or settings.pool_max_size
+                _fetch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-fetch")
+    return _fetch_executor
+
+def shutdown_db_executor():
+    """Stop the DB executors (application shutdown)"""
+    global _db_executor, _fetch_executor
+    with _db_executor_lock:
+        if _db_executor is not None:
+            _db_executor.shutdown(wait=True)
+            _db_executor = None
+        if _fetch_executor is not None:
+            _fetch_executor.shutdown(wait=True)
+            _fetch_executor = None
 
 def test_connection():
     """Test function to verify database connection"""
@@ -0,0 +1,358 @@
+# app/delta_sync.py
+# Delta sync for /data-download.
+#
+# The ERP tables have no modification timestamps, so changes are detected by
+# hashing every row and comparing against the hashes recorded on the previous
+# scan. Each scan that finds changes bumps a version number; every changed or
+# deleted row is stamped with that version in a local SQLite state file. A sync
+# token is just (state epoch, version), and "changes since token" is an indexed
+# range query on that file - the ERP database is not touched to answer it.
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.datasets import DOWNLOAD_DATASETS, get_datasets
+from app.db_utils import get_db
+from app.settings import get_settings
+from app.streaming import json_default
+
+STATE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS row_state (
+        dataset TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        hash TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        data TEXT,
+        PRIMARY KEY (dataset, row_key)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_row_state_version ON row_state (dataset, version)",
+    """CREATE TABLE IF NOT EXISTS meta (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )""",
+]
+
+_encoder = json.JSONEncoder(default=json_default, ensure_ascii=False, separators=(",", ":"))
+
+
+class InvalidSyncToken(Exception):
+    """Raised for sync tokens that cannot be parsed"""
+
+
+def encode_token(epoch, version):
+    raw = f"{epoch}:{version}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_token(token):
+    """Return ``(epoch, version)`` from an opaque sync token"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        epoch, version = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":")
+        return epoch, int(version)
+    except Exception:
+        raise InvalidSyncToken(f"Invalid sync token: {token!r}")
+
+
+def row_hash(row):
+    """Short, stable fingerprint of a row's values"""
+    return hashlib.blake2b(_encoder.encode(list(row)).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def group_hash(digests):
+    """Fingerprint of several rows sharing one key, independent of their order"""
+    return hashlib.blake2b(",".join(sorted(digests)).encode("ascii"), digest_size=8).hexdigest()
+
+
+class ChangeTracker:
+    """Detects inserted/updated/deleted rows between scans of the ERP datasets"""
+
+    def __init__(self, path, datasets=DOWNLOAD_DATASETS, chunk_size=5000):
+        self.path = path
+        self.datasets = {dataset.name: dataset for dataset in datasets}
+        self.chunk_size = chunk_size
+
+        self._db_lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in STATE_SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+        self.epoch = self._meta("epoch")
+        if self.epoch is None:
+            # A fresh state file invalidates every token issued before it
+            self.epoch = uuid.uuid4().hex[:12]
+            self._set_meta("epoch", self.epoch)
+        self.version = int(self._meta("version") or 0)
+
+        self._hashes = {}           # dataset -> {row_key: hash}, loaded lazily
+        self.last_refresh = None    # time.monotonic() of the last completed scan
+        self.last_refresh_stats = {}
+        self._listeners = []
+
+    # -- state file helpers --------------------------------------------------
+
+    def _meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+        self._conn.commit()
+
+    def _load_hashes(self, name):
+        if name not in self._hashes:
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT row_key, hash FROM row_state WHERE dataset = ? AND deleted = 0", (name,)
+                ).fetchall()
+            self._hashes[name] = dict(rows)
+        return self._hashes[name]
+
+    # -- scanning ------------------------------------------------------------
+
+    def current_token(self):
+        """Token for the last completed scan, or None before the first one"""
+        return encode_token(self.epoch, self.version) if self.version else None
+
+    def add_listener(self, callback):
+        """Call ``callback(version, changes)`` after every scan that found changes.
+
+        ``changes`` maps dataset name to ``{"upserted": [(row_key, data)],
+        "deleted": [row_key], "hashes": [(row_key, old_hash, new_hash)]}``
+        where a hash is None for inserted / deleted keys. A key shared by
+        several rows appears once per row in "upserted".
+        """
+        self._listeners.append(callback)
+
+    def _scan_dataset(self, conn, dataset, previous):
+        """Hash every key of one dataset; returns (current hashes, upserts, deleted keys).
+
+        Keys are not guaranteed unique (e.g. a barcode repeated on one
+        product), so the rows sharing a key form one unit: its hash covers
+        all of them, an upsert carries all of them, and the key is only
+        deleted once none of them is left.
+        """
+        key_index = [dataset.fields.index(field) for field in dataset.key_fields]
+        current = {}
+        changed = {}     # key -> rows, for keys whose hash changed
+        members = {}     # key -> row hashes, for keys seen more than once
+        refetch = set()  # changed groups whose first row was not kept
+        for row in self._iter_rows(conn, dataset):
+            key = _encoder.encode([row[i] for i in key_index])
+            digest = row_hash(row)
+            if key not in current:
+                current[key] = digest
+                if previous.get(key) != digest:
+                    changed[key] = [row]
+                continue
+            members.setdefault(key, [current[key]]).append(digest)
+            if key in changed:
+                changed[key].append(row)
+            else:
+                refetch.add(key)
+
+        for key, digests in members.items():
+            current[key] = group_hash(digests)
+            if current[key] == previous.get(key):
+                changed.pop(key, None)
+                refetch.discard(key)
+        if refetch:
+            # Rare: a key gained a duplicate while its first row stayed the same
+            for key in refetch:
+                changed[key] = []
+            for row in self._iter_rows(conn, dataset):
+                key = _encoder.encode([row[i] for i in key_index])
+                if key in refetch:
+                    changed[key].append(row)
+
+        upserts = [
+            (key, current[key], [dict(zip(dataset.fields, row)) for row in rows])
+            for key, rows in changed.items()
+        ]
+        deleted = [key for key in previous if key not in current]
+        return current, upserts, deleted
+
+    def _iter_rows(self, conn, dataset):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(dataset.query)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def refresh(self):
+        """Scan all datasets and record changes under a new version (blocking)"""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            scanned = {}
+            changes = {}
+            previous_hashes = {}
+            with get_db() as conn:
+                for name, dataset in self.datasets.items():
+                    previous = self._load_hashes(name)
+                    current, upserts, deleted = self._scan_dataset(conn, dataset, previous)
+                    scanned[name] = current
+                    previous_hashes[name] = previous
+                    if upserts or deleted:
+                        changes[name] = (upserts, deleted)
+
+            if changes:
+                version = self.version + 1
+                with self._db_lock:
+                    for name, (upserts, deleted) in changes.items():
+                        self._conn.executemany(
+                            "INSERT OR REPLACE INTO row_state (dataset, row_key, hash, version, deleted, data) "
+                            "VALUES (?, ?, ?, ?, 0, ?)",
+                            (
+                                # One row is stored as an object, a group as a list
+                                (name, key, digest, version, _encoder.encode(data[0] if len(data) == 1 else data))
+                                for key, digest, data in upserts
+                            ),
+                        )
+                        self._conn.executemany(
+                            "UPDATE row_state SET deleted = 1, version = ?, data = NULL "
+                            "WHERE dataset = ? AND row_key = ?",
+                            ((version, name, key) for key in deleted),
+                        )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (str(version),)
+                    )
+                    self._conn.commit()
+                self.version = version
+
+            self._hashes.update(scanned)
+            self.last_refresh = time.monotonic()
+            elapsed = time.perf_counter() - started
+            self.last_refresh_stats = {
+                "version": self.version,
+                "seconds": round(elapsed, 3),
+                "rows": {name: len(hashes) for name, hashes in scanned.items()},
+                "changed": {name: {"upserted": len(u), "deleted": len(d)} for name, (u, d) in changes.items()},
+            }
+            logging.info(f"🔁 Delta scan finished in {elapsed:.2f}s: {self.last_refresh_stats}")
+
+            if changes:
+                summary = {
+                    name: {
+                        "upserted": [(key, row) for key, _, data in upserts for row in data],
+                        "deleted": deleted,
+                        "hashes": [(key, previous_hashes[name].get(key), digest) for key, digest, _ in upserts]
+                        + [(key, previous_hashes[name][key], None) for key in deleted],
+                    }
+                    for name, (upserts, deleted) in changes.items()
+                }
+                for listener in list(self._listeners):
+                    try:
+                        listener(self.version, summary)
+                    except Exception as e:
+                        logging.warning(f"⚠️ Delta change listener failed: {e}")
+            return self.version
+
+    def refresh_if_stale(self, max_age):
+        """Rescan only if the last scan is older than ``max_age`` seconds.
+
+        Concurrent callers share one scan: whoever waits on the lock sees the
+        fresh timestamp and returns immediately.
+        """
+        if self.last_refresh is not None and time.monotonic() - self.last_refresh < max_age:
+            return self.version
+        with self._refresh_lock:
+            if self.last_refresh is not None and time.monotonic() - self.last_refresh < max_age:
+                return self.version
+            return self.refresh()
+
+    def row_hashes(self, name):
+        """``(version, copy of {row_key: hash})`` for the live rows of one dataset"""
+        with self._refresh_lock:
+            return self.version, dict(self._load_hashes(name))
+
+    # -- answering clients ---------------------------------------------------
+
+    def _key_fields(self, name, row_key):
+        return dict(zip(self.datasets[name].key_fields, json.loads(row_key)))
+
+    def changes_since(self, token, dataset_names=None):
+        """Rows changed after ``token`` for each dataset.
+
+        Returns a dict with ``reset`` (True when the token is from another
+        state epoch or from the future, meaning every live row is returned and
+        the client should replace its copy) and per-dataset ``upserts`` and
+        ``deletes``.
+        """
+        epoch, since = decode_token(token)
+        reset = epoch != self.epoch or since > self.version
+        if reset:
+            since = 0
+
+        names = list(dataset_names or self.datasets)
+        with self._db_lock:
+            # Bounded by the version read here, so the token handed out with
+            # this result covers exactly the rows in it
+            version = self.version
+            result = {"reset": reset, "since_version": since, "version": version, "datasets": {}}
+            for name in names:
+                upserts = []
+                deletes = []
+                rows = self._conn.execute(
+                    "SELECT row_key, deleted, data FROM row_state "
+                    "WHERE dataset = ? AND version > ? AND version <= ?",
+                    (name, since, version),
+                )
+                for row_key, deleted, data in rows:
+                    if deleted:
+                        if not reset:
+                            deletes.append(self._key_fields(name, row_key))
+                    else:
+                        value = json.loads(data)
+                        if isinstance(value, list):
+                            upserts.extend(value)
+                        else:
+                            upserts.append(value)
+                result["datasets"][name] = {"upserts": upserts, "deletes": deletes}
+        return result
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_change_tracker():
+    """Process-wide ChangeTracker backed by ``sync_state_path``"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                settings = get_settings()
+                path = settings.sync_state_path
+                if not os.path.isabs(path) and settings.path:
+                    path = os.path.join(os.path.dirname(settings.path), path)
+                logging.info(f"🗂️ Delta sync state file: {path}")
+                # Datasets added to config.json later are tracked after a restart
+                _tracker = ChangeTracker(path, get_datasets(), chunk_size=settings.stream_chunk_size)
+    return _tracker
+
+
+def warm_up_change_tracker():
+    """Run the first scan in the background so early clients get sync tokens"""
+    def _run():
+        try:
+            get_change_tracker().refresh_if_stale(get_settings().delta_refresh_interval)
+        except Exception as e:
+            logging.warning(f"⚠️ Initial delta scan failed (will retry on demand): {e}")
+
+    threading.Thread(target=_run, name="delta-warmup", daemon=True).start()
@@ -1,18 +1,73 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from app.routes import sync
+from app.compression import HAS_BROTLI, HAS_ZSTD, CompressionMiddleware
 from app.logging_config import setup_logging
+from app.db_utils import log_config_locations, save_config_ips, close_pool, shutdown_db_executor
+from app.network_utils import network_info
+from app.settings import get_settings
+from app.delta_sync import get_change_tracker, warm_up_change_tracker
+from app.catalog_cache import catalog_cache, invalidate_catalog_cache
+from app.upload_journal import ApplierThread
+from app.barcode_index import BARCODE_CHECK_OFF, barcode_catalog
+from app.serialization import HAS_CBOR, HAS_MSGPACK
 import logging
 
 # ✅ Set up logging BEFORE FastAPI starts
 setup_logging()
 
 
+def log_missing_encodings():
+    """Warn about optional encoders that are not installed (see requirements.txt)"""
+    missing = [
+        name for name, installed in (
+            ("brotli", HAS_BROTLI), ("zstandard", HAS_ZSTD), ("msgpack", HAS_MSGPACK), ("cbor2", HAS_CBOR),
+        )
+        if not installed
+    ]
+    if missing:
+        logging.warning(f"⚠️ Encodings unavailable, packages not installed: {', '.join(missing)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Config and network detection happen here, never per request
+    log_config_locations()
+    log_missing_encodings()
+    settings = get_settings()
+    network_info.refresh_interval = settings.network_refresh_interval
+    network_info.change_check_interval = settings.network_change_check_interval
+    network_info.add_listener(save_config_ips)
+    network_info.start()
+    catalog_cache.ttl = settings.catalog_cache_ttl
+    catalog_cache.max_bytes = int(settings.catalog_cache_max_mb * 1024 * 1024)
+    # Any change found by the delta scanner makes cached snapshots stale
+    get_change_tracker().add_listener(invalidate_catalog_cache)
+    warm_up_change_tracker()
+    if settings.upload_barcode_check != BARCODE_CHECK_OFF:
+        # Uploaded lines are checked against it; kept current by the delta scans
+        get_change_tracker().add_listener(barcode_catalog.on_changes)
+        barcode_catalog.start_loading()
+    # Journaled uploads are normally applied by SyncService
+    applier = None
+    if settings.upload_journal and settings.journal_applier == "server":
+        applier = ApplierThread()
+        applier.start()
+    yield
+    if applier is not None:
+        applier.stop()
+    network_info.stop()
+    shutdown_db_executor()
+    close_pool()
+
+
 app = FastAPI(
     title="SyncAnywhere API",
     description="API for syncing data between SQL Anywhere and Mobile app",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 @app.exception_handler(Exception)
@@ -23,4 +78,7 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal Server Error", "details": str(exc)}
     )
 
+# Negotiated zstd/br/gzip for large JSON bodies (settings read per request)
+app.add_middleware(CompressionMiddleware)
+
 app.include_router(sync.router)
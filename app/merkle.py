@@ -0,0 +1,209 @@
+# app/merkle.py
+# Hash trees over a dataset, partitioned into code ranges, so a device can
+# find out which parts of its local catalog diverged and re-download only
+# those ranges (?code_from=&code_to= on /data-download).
+#
+# Leaves are chunks of roughly ``chunk_rows`` rows between fixed code
+# boundaries. A chunk's value is the row count plus the sum (mod 2**64) of
+# its rows' delta-sync hashes, so a changed row updates its chunk in O(1):
+# subtract the old hash, add the new one. The tree above the leaves is
+# rebuilt from the chunk values on demand, which is cheap (a few thousand
+# hashes at most).
+#
+# Clients re-fetch a chunk with code_from/code_to, which the database
+# compares in its own collation (SQL Anywhere's is case-insensitive), so
+# codes are ordered the way the database orders them: by their position in
+# the dataset's shard_query, never by Python string comparison.
+#
+# Client side, with the same definitions:
+#   row hash  = blake2b(compact JSON array of the row's values, digest 8);
+#               rows sharing a key count once, hashed as blake2b of their
+#               sorted row hashes joined with "," (digest 8)
+#   leaf      = blake2b(f"{rows}:{sum of row hashes mod 2**64:016x}", digest 16)
+#   parent    = blake2b(left_hex + right_hex, digest 16); an odd last node
+#               is carried up unchanged
+
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from app.pagination import ordered_codes
+
+HASH_MASK = (1 << 64) - 1
+
+# Re-partition when a chunk has grown to this many times the target size
+REBALANCE_FACTOR = 4
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("ascii"), digest_size=16).hexdigest()
+
+
+def leaf_hash(rows, total):
+    return _digest(f"{rows}:{total:016x}")
+
+
+def build_levels(leaves):
+    """All tree levels, leaves first and the root level last"""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_digest(level[i] + level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def row_code(row_key):
+    """First key value of a delta-sync row key (the code ranges are over it)"""
+    return json.loads(row_key)[0]
+
+
+class HashTree:
+    """Incrementally maintained chunk hashes for one dataset of a ChangeTracker"""
+
+    def __init__(self, tracker, dataset_name, chunk_rows=1000):
+        self.tracker = tracker
+        self.dataset_name = dataset_name
+        self.chunk_rows = max(1, chunk_rows)
+        self.layout = None      # changes whenever the chunk boundaries move
+        self.starts = []        # first code of chunks 1..n-1 (chunk 0 is open-ended)
+        self.start_positions = []
+        self.positions = {}     # code -> position in the database's ordering
+        self.counts = []
+        self.sums = []
+        self.version = None
+        self._levels = None
+        self._lock = threading.Lock()
+
+    # -- building ------------------------------------------------------------
+
+    def _partition(self, hashes, codes):
+        """Choose chunk boundaries from the current codes (``codes`` in the
+        database's order) and sum every chunk"""
+        started = time.perf_counter()
+        positions = {code: position for position, code in enumerate(codes)}
+        by_position = {}
+        unplaced = 0
+        for row_key, digest in hashes.items():
+            position = positions.get(row_code(row_key))
+            if position is None:
+                # Gone from the database since the last scan; the scan that
+                # deletes it triggers a fresh partition
+                unplaced += 1
+                continue
+            count, total = by_position.get(position, (0, 0))
+            by_position[position] = (count + 1, (total + int(digest, 16)) & HASH_MASK)
+
+        starts, start_positions, counts, sums = [], [], [0], [0]
+        for position in sorted(by_position):
+            count, total = by_position[position]
+            # A code never straddles two chunks, so ranges stay [from, to)
+            if counts[-1] >= self.chunk_rows:
+                starts.append(codes[position])
+                start_positions.append(position)
+                counts.append(0)
+                sums.append(0)
+            counts[-1] += count
+            sums[-1] = (sums[-1] + total) & HASH_MASK
+
+        self.starts, self.start_positions, self.counts, self.sums = starts, start_positions, counts, sums
+        self.positions = positions
+        self.layout = uuid.uuid4().hex[:12]
+        self._levels = None
+        logging.info(
+            f"🌳 Partitioned {self.dataset_name} into {len(counts)} hash chunks "
+            f"({len(hashes) - unplaced} rows) in {time.perf_counter() - started:.2f}s"
+        )
+
+    def ensure_built(self):
+        while True:
+            with self._lock:
+                if self.layout is not None:
+                    return
+            # Read outside our lock: listeners run with the tracker's lock held.
+            # Codes after hashes, so every scanned code is in the ordering
+            # unless it has been deleted since (and will be, by a later scan)
+            version, hashes = self.tracker.row_hashes(self.dataset_name)
+            codes = ordered_codes(self.tracker.datasets[self.dataset_name])
+            with self._lock:
+                if self.layout is not None:
+                    return
+                if self.tracker.version != version:
+                    # A scan finished in between and its listener call found no
+                    # tree to update; start again from the new state
+                    continue
+                self._partition(hashes, codes)
+                self.version = version
+                return
+
+    # -- incremental maintenance ---------------------------------------------
+
+    def on_changes(self, version, changes):
+        """ChangeTracker listener: fold changed row hashes into their chunks"""
+        dataset_changes = changes.get(self.dataset_name)
+        with self._lock:
+            if self.layout is None:
+                # Not built yet; the first request partitions the fresh state
+                return
+            changed = dataset_changes.get("hashes", ()) if dataset_changes else ()
+            if any(row_code(row_key) not in self.positions for row_key, _, _ in changed):
+                # A code we cannot place (new since the partition): the next
+                # request re-partitions from the database's current order
+                self.layout = None
+                return
+            if changed:
+                for row_key, old, new in changed:
+                    index = bisect.bisect_right(self.start_positions, self.positions[row_code(row_key)])
+                    if old is not None:
+                        self.counts[index] -= 1
+                        self.sums[index] = (self.sums[index] - int(old, 16)) & HASH_MASK
+                    if new is not None:
+                        self.counts[index] += 1
+                        self.sums[index] = (self.sums[index] + int(new, 16)) & HASH_MASK
+                self._levels = None
+            self.version = version
+            if max(self.counts, default=0) > self.chunk_rows * REBALANCE_FACTOR:
+                # Re-partitioned by the next request
+                self.layout = None
+
+    # -- answering clients ---------------------------------------------------
+
+    def snapshot(self):
+        """Chunks with their code ranges and hashes, plus every tree level"""
+        self.ensure_built()
+        with self._lock:
+            leaves = [leaf_hash(count, total) for count, total in zip(self.counts, self.sums)]
+            if self._levels is None:
+                self._levels = build_levels(leaves)
+            edges = [None] + self.starts + [None]
+            chunks = [
+                {"code_from": edges[i], "code_to": edges[i + 1], "rows": self.counts[i], "hash": leaves[i]}
+                for i in range(len(leaves))
+            ]
+            return {
+                "dataset": self.dataset_name,
+                "layout": self.layout,
+                "root": self._levels[-1][0] if leaves else None,
+                "chunks": chunks,
+                "levels": self._levels,
+            }
+
+
+_trees = {}
+_trees_lock = threading.Lock()
+
+
+def get_hash_tree(tracker, dataset_name, chunk_rows=1000):
+    """Process-wide HashTree per dataset, registered as a change listener"""
+    with _trees_lock:
+        tree = _trees.get(dataset_name)
+        if tree is None:
+            tree = _trees[dataset_name] = HashTree(tracker, dataset_name, chunk_rows)
+            tracker.add_listener(tree.on_changes)
+    return tree
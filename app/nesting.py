@@ -0,0 +1,112 @@
+# app/nesting.py
+# Nested download shape (?shape=nested): one entry per parent row with its
+# children listed under it, plus server-side aggregates.
+#
+# The product/batch join repeats each product's code and name on every batch
+# row. Ordered by product code, consecutive rows of a product form a group,
+# so nesting is a single streaming pass - no second query, no sorting in
+# Python, and only the product currently being grouped is held in memory.
+
+from collections import namedtuple
+
+FLAT_SHAPE = "flat"
+NESTED_SHAPE = "nested"
+SHAPES = (FLAT_SHAPE, NESTED_SHAPE)
+
+# parent_fields: fields identifying a parent (the first one is the group key)
+# child_name: key the list of children goes under
+# aggregates: (output name, "sum" | "min" | "max", source field) or
+#             (output name, "count", None) for the number of children
+# order_by: SQL expressions that put rows of one parent next to each other
+Nesting = namedtuple("Nesting", ["parent_fields", "child_name", "aggregates", "order_by"])
+
+
+def _combine(func, current, value):
+    if current is None:
+        return value
+    if func == "sum":
+        return current + value
+    if func == "min":
+        return value if value < current else current
+    return value if value > current else current
+
+
+class Nester:
+    """Groups consecutive rows into parent dicts, one chunk at a time.
+
+    ``feed()`` returns the parents completed by a chunk; the last, possibly
+    still growing parent is only returned by ``finish()``, so groups may
+    span fetchmany() chunks.
+    """
+
+    def __init__(self, fields, nesting):
+        self.parent_index = [(field, fields.index(field)) for field in nesting.parent_fields if field in fields]
+        if not self.parent_index:
+            raise ValueError(f"Nested shape needs {nesting.parent_fields[0]!r} in the fields")
+        parent_names = {field for field, _ in self.parent_index}
+        self.child_index = [(field, i) for i, field in enumerate(fields) if field not in parent_names]
+        self.child_name = nesting.child_name
+        # Aggregates over fields that were projected away are skipped
+        self.aggregates = [
+            (name, func, None if source is None else fields.index(source))
+            for name, func, source in nesting.aggregates
+            if source is None or source in fields
+        ]
+        self.key_index = self.parent_index[0][1]
+        self._current = None
+        self._current_key = None
+        self.parents = 0
+
+    def _start(self, row):
+        parent = {field: row[i] for field, i in self.parent_index}
+        for name, func, _ in self.aggregates:
+            parent[name] = 0 if func in ("count", "sum") else None
+        parent[self.child_name] = []
+        return parent
+
+    def _add(self, parent, row):
+        # LEFT JOIN rows of a parent without children carry only NULLs
+        if all(row[i] is None for _, i in self.child_index):
+            return
+        parent[self.child_name].append({field: row[i] for field, i in self.child_index})
+        for name, func, i in self.aggregates:
+            if func == "count":
+                parent[name] += 1
+                continue
+            value = row[i]
+            if value is not None:
+                parent[name] = _combine(func, parent[name], value)
+
+    def feed(self, rows):
+        completed = []
+        key_index = self.key_index
+        for row in rows:
+            key = row[key_index]
+            if self._current is None or key != self._current_key:
+                if self._current is not None:
+                    completed.append(self._current)
+                self._current = self._start(row)
+                self._current_key = key
+            self._add(self._current, row)
+        self.parents += len(completed)
+        return completed
+
+    def finish(self):
+        last, self._current = self._current, None
+        if last is None:
+            return []
+        self.parents += 1
+        return [last]
+
+
+def nest_rows(rows, fields, nesting):
+    """All rows of a dataset, ordered by parent, as a list of parent dicts"""
+    nester = Nester(fields, nesting)
+    return nester.feed(rows) + nester.finish()
+
+
+def ordered_for_nesting(dataset):
+    """Copy of ``dataset`` whose query returns each parent's rows together"""
+    return dataset._replace(
+        query=dataset.query.rstrip() + "\n    ORDER BY " + ", ".join(dataset.nesting.order_by) + "\n"
+    )
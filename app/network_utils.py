@@ -0,0 +1,280 @@
+# app/network_utils.py
+
+import logging
+import platform
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Try to import netifaces, but don't fail if not available
+try:
+    import netifaces
+    HAS_NETIFACES = True
+except ImportError:
+    HAS_NETIFACES = False
+    logging.warning("⚠️ netifaces not available - using basic network detection")
+
+DEFAULT_REFRESH_INTERVAL = 300       # full re-probe every 5 minutes
+DEFAULT_CHANGE_CHECK_INTERVAL = 5    # cheap interface fingerprint check
+
+
+def _usable(ip):
+    return not ip.startswith('127.') and not ip.startswith('169.254.')
+
+
+# ---------------------------------------------------------------------------
+# Individual probes - each returns a list of IPv4 addresses
+# ---------------------------------------------------------------------------
+
+def _probe_netifaces():
+    """Method 1: netifaces (most reliable)"""
+    ips = []
+    if not HAS_NETIFACES:
+        return ips
+    for interface in netifaces.interfaces():
+        if interface.startswith('lo'):  # Skip loopback
+            continue
+        addresses = netifaces.ifaddresses(interface)
+        for addr in addresses.get(netifaces.AF_INET, []):
+            ips.append(addr['addr'])
+    return ips
+
+
+def _probe_platform_command():
+    """Method 2: ipconfig on Windows, ip addr / ifconfig elsewhere"""
+    ips = []
+    if platform.system() == "Windows":
+        result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=10)
+        for line in result.stdout.split('\n'):
+            line = line.strip()
+            if 'IPv4 Address' in line and ':' in line:
+                ips.append(line.split(':')[1].strip())
+        return ips
+
+    try:
+        result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True, timeout=10)
+        for line in result.stdout.split('\n'):
+            if 'inet ' in line and 'scope global' in line:
+                for part in line.strip().split():
+                    if '/' in part:
+                        ips.append(part.split('/')[0])
+    except Exception:
+        # Fallback to ifconfig
+        result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=10)
+        for line in result.stdout.split('\n'):
+            if 'inet ' in line and 'netmask' in line:
+                parts = line.strip().split()
+                if len(parts) >= 2:
+                    ips.append(parts[1])
+    return ips
+
+
+def _probe_udp_socket():
+    """Method 3: address of the default route (no packet is actually sent)"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(("8.8.8.8", 80))
+        return [s.getsockname()[0]]
+
+
+def _probe_hostname():
+    """Method 4: hostname lookup"""
+    return [socket.gethostbyname(socket.gethostname())]
+
+
+def _probe_getaddrinfo():
+    """Method 5: every IPv4 address the hostname resolves to"""
+    hostname = socket.gethostname()
+    return [info[4][0] for info in socket.getaddrinfo(hostname, None, socket.AF_INET)]
+
+
+PROBES = [
+    ("netifaces", _probe_netifaces),
+    ("platform command", _probe_platform_command),
+    ("socket", _probe_udp_socket),
+    ("hostname", _probe_hostname),
+    ("getaddrinfo", _probe_getaddrinfo),
+]
+
+
+def ip_priority(ip):
+    """Sort key: common home networks first"""
+    if ip.startswith('192.168.1.'):
+        return 1
+    elif ip.startswith('192.168.0.'):
+        return 2
+    elif ip.startswith('192.168.'):
+        return 3
+    elif ip.startswith('10.'):
+        return 4
+    elif ip.startswith('172.'):
+        return 5
+    else:
+        return 6
+
+
+def discover_local_ips():
+    """Run every probe concurrently and merge the results in priority order"""
+    with ThreadPoolExecutor(max_workers=len(PROBES), thread_name_prefix="ip-probe") as executor:
+        futures = [(name, executor.submit(probe)) for name, probe in PROBES]
+
+    ips = []
+    for name, future in futures:
+        try:
+            found = future.result()
+        except Exception as e:
+            logging.warning(f"⚠️ {name} method failed: {e}")
+            continue
+        for ip in found:
+            if _usable(ip) and ip not in ips:
+                ips.append(ip)
+
+    # Fallback - at least return localhost
+    if not ips:
+        ips.append("127.0.0.1")
+        logging.warning("⚠️ Only localhost IP found - mobile connection may not work")
+
+    ips.sort(key=ip_priority)
+    return ips
+
+
+def pick_best_ip(ips):
+    """Get the most likely IP address for mobile device connection"""
+    # Prefer 192.168.1.x, then other 192.168.x.x, then 10.x.x.x (corporate)
+    for prefix in ('192.168.1.', '192.168.', '10.'):
+        for ip in ips:
+            if ip.startswith(prefix):
+                return ip
+
+    # Return first available
+    return ips[0] if ips else "127.0.0.1"
+
+
+def interface_fingerprint():
+    """Cheap snapshot of the host's interfaces, used to spot network changes"""
+    parts = []
+    try:
+        parts.extend(name for _, name in socket.if_nameindex())
+    except (OSError, AttributeError):
+        pass
+    if HAS_NETIFACES:
+        try:
+            for interface in netifaces.interfaces():
+                for addr in netifaces.ifaddresses(interface).get(netifaces.AF_INET, []):
+                    parts.append(f"{interface}={addr.get('addr')}")
+        except Exception:
+            pass
+    return tuple(sorted(parts))
+
+
+class NetworkInfoCache:
+    """Keeps the local IP list in memory and refreshes it in the background.
+
+    A full probe runs every ``refresh_interval`` seconds, and early whenever the
+    interface fingerprint (checked every ``change_check_interval`` seconds)
+    changes. Readers never wait on probes once the first discovery finished.
+    """
+
+    def __init__(self, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 change_check_interval=DEFAULT_CHANGE_CHECK_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self.change_check_interval = change_check_interval
+        self._ips = ()
+        self._best_ip = None
+        self._refreshed_at = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def refresh(self):
+        """Re-probe the network now and update the cache"""
+        with self._refresh_lock:
+            fingerprint = interface_fingerprint()
+            started = time.perf_counter()
+            ips = tuple(discover_local_ips())
+            elapsed = (time.perf_counter() - started) * 1000
+
+            with self._lock:
+                changed = ips != self._ips
+                self._ips = ips
+                self._best_ip = pick_best_ip(ips)
+                self._refreshed_at = time.time()
+                self._fingerprint = fingerprint
+
+            logging.info(f"📡 Found {len(ips)} IP addresses in {elapsed:.0f}ms: {list(ips)}")
+            if changed:
+                for listener in list(self._listeners):
+                    try:
+                        listener(list(ips), self._best_ip)
+                    except Exception as e:
+                        logging.warning(f"⚠️ Network change listener failed: {e}")
+            return list(ips)
+
+    def _ensure_loaded(self):
+        if self._refreshed_at is None:
+            self.refresh()
+
+    def get_all_ips(self):
+        self._ensure_loaded()
+        return list(self._ips)
+
+    def get_best_ip(self):
+        self._ensure_loaded()
+        return self._best_ip
+
+    def snapshot(self):
+        """Cached state without ever triggering a probe"""
+        with self._lock:
+            return {
+                "ips": list(self._ips),
+                "best_ip": self._best_ip,
+                "refreshed_at": self._refreshed_at,
+            }
+
+    def add_listener(self, callback):
+        """Call ``callback(all_ips, best_ip)`` whenever the IP list changes"""
+        self._listeners.append(callback)
+
+    def start(self):
+        """Start the background refresher (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="network-info", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        next_full = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            try:
+                if now >= next_full or self._refreshed_at is None:
+                    self.refresh()
+                    next_full = now + self.refresh_interval
+                elif interface_fingerprint() != self._fingerprint:
+                    logging.info("🔄 Network interfaces changed - refreshing IP list")
+                    self.refresh()
+                    next_full = now + self.refresh_interval
+            except Exception as e:
+                logging.warning(f"⚠️ Network refresh failed: {e}")
+            self._stop.wait(self.change_check_interval)
+
+
+network_info = NetworkInfoCache()
+
+
+def get_all_local_ips():
+    """Get all possible local IP addresses (served from the background cache)"""
+    return network_info.get_all_ips()
+
+
+def get_best_local_ip():
+    """Get the most likely IP address for mobile device connection"""
+    return network_info.get_best_ip()
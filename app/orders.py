@@ -0,0 +1,235 @@
+# app/orders.py
+# Writing uploaded purchase orders into the ERP database.
+#
+# Shared by the /upload-orders endpoint and the upload journal applier
+# (app/upload_journal.py), which runs in SyncService.
+
+import logging
+import time
+
+from typing import List
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.db_utils import get_db
+from app.schemas import OrderInput, OrderUploadInput
+from app.sequences import PO_DETAIL_SLNO, PO_MASTER_SLNO, PO_ORDERNO, order_numbers
+from app.settings import get_settings
+from app.upload_dedupe import upload_ledger
+
+
+class InvalidOrders(Exception):
+    """Raised for upload payloads whose structure cannot be written"""
+
+
+_order_list = TypeAdapter(List[OrderInput])
+
+# Validation errors listed in the 400 response
+MAX_REPORTED_ERRORS = 5
+
+
+def describe_validation_error(error):
+    """Short "orders[0].products[3].quantity: ..." summary of a ValidationError"""
+    messages = []
+    for item in error.errors()[:MAX_REPORTED_ERRORS]:
+        path = ""
+        for part in item["loc"]:
+            path += f"[{part}]" if isinstance(part, int) else (f".{part}" if path else str(part))
+        messages.append(f"{path or 'body'}: {item['msg']}")
+    if error.error_count() > MAX_REPORTED_ERRORS:
+        messages.append(f"... {error.error_count() - MAX_REPORTED_ERRORS} more")
+    return "; ".join(messages)
+
+
+def check_line_limit(orders):
+    max_lines = get_settings().upload_max_lines
+    line_count = sum(len(order.products) for order in orders)
+    if max_lines and line_count > max_lines:
+        raise InvalidOrders(f"Upload has {line_count} lines; at most {max_lines} are accepted per upload")
+
+
+def validate_upload(payload):
+    """Validated OrderInput list out of an /upload-orders body (one pass, no
+    database access); raises InvalidOrders"""
+    try:
+        orders = OrderUploadInput.model_validate(payload).orders
+    except ValidationError as e:
+        raise InvalidOrders(describe_validation_error(e))
+    check_line_limit(orders)
+    return orders
+
+
+def validate_orders(orders, check_limit=True):
+    """``orders`` as OrderInput models; already validated lists pass through.
+
+    ``check_limit=False`` skips upload_max_lines, for several uploads that
+    were each checked on arrival and are now written together.
+    """
+    if isinstance(orders, list) and all(isinstance(order, OrderInput) for order in orders):
+        return orders
+    try:
+        orders = _order_list.validate_python(orders)
+    except ValidationError as e:
+        raise InvalidOrders(describe_validation_error(e))
+    if check_limit:
+        check_line_limit(orders)
+    return orders
+
+
+def build_order_rows(orders, check_limit=True):
+    """Validate the upload and turn it into header/line tuples (unnumbered)
+    plus each order's client UUID (None when the phone sent none)"""
+    orders = validate_orders(orders, check_limit)
+    headers = []
+    lines = []
+    order_uuids = []
+    for order in orders:
+        order_uuids.append(str(order.order_uuid) if order.order_uuid else None)
+        headers.append((order.supplier_code, order.otype, order.userid, order.order_date))
+        lines.append([(line.barcode, line.quantity, line.rate, line.mrp) for line in order.products])
+    return headers, lines, order_uuids
+
+
+def executemany_batched(cursor, sql, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def write_order_rows(master_rows, detail_rows, ledger_rows, batch_size, timings):
+    """Insert numbered orders and their ledger rows in one transaction.
+
+    Returns False (nothing written) if one of the order UUIDs was recorded
+    by a concurrent upload in the meantime.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            phase = time.perf_counter()
+            try:
+                executemany_batched(cursor, """
+                    INSERT INTO acc_purchaseordermaster (slno, orderno, supplier, otype, userid, orderdate)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, master_rows, batch_size)
+                executemany_batched(cursor, """
+                    INSERT INTO acc_purchaseorderdetails
+                    (masterslno, slno, barcode, qty, rate, mrp)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, detail_rows, batch_size)
+                # Same transaction: an order is written and recorded, or neither
+                upload_ledger.record(cursor, ledger_rows, time.strftime("%Y-%m-%d %H:%M:%S"))
+            except Exception:
+                conn.rollback()
+                if ledger_rows and upload_ledger.lookup(conn, [row[0] for row in ledger_rows]):
+                    logging.info("🔁 Orders of this upload were written by a concurrent retry")
+                    return False
+                # Most likely the ERP numbered rows itself; re-prime from MAX() next time
+                order_numbers.invalidate()
+                raise
+            timings["insert"] = (time.perf_counter() - phase) * 1000
+
+            phase = time.perf_counter()
+            conn.commit()
+            timings["commit"] = (time.perf_counter() - phase) * 1000
+        finally:
+            cursor.close()
+    return True
+
+
+def insert_orders(orders, retry_duplicates=True, check_limit=True):
+    """Write uploaded orders in one transaction (blocking - runs on the DB executor).
+
+    Orders whose ``order_uuid`` was already written (a retried upload) are
+    answered with their original numbers and not written again (see
+    app/upload_dedupe.py). Numbers come from blocks reserved up front
+    (app/sequences.py); rows are built in memory and written with batched
+    executemany() instead of one round trip per header and line. Returns
+    counts, per-order numbers and per-phase timings in milliseconds.
+    """
+    batch_size = max(1, get_settings().upload_batch_size)
+    timings = {}
+
+    started = time.perf_counter()
+    headers, lines, order_uuids = build_order_rows(orders, check_limit)
+    timings["validate"] = (time.perf_counter() - started) * 1000
+
+    phase = time.perf_counter()
+    known = {}
+    wanted = {order_uuid for order_uuid in order_uuids if order_uuid}
+    if wanted:
+        with get_db() as conn:
+            known = upload_ledger.lookup(conn, wanted)
+    # Orders to write: no UUID, or a UUID seen neither before nor earlier in this upload
+    new_orders = []
+    seen = set(known)
+    for index, order_uuid in enumerate(order_uuids):
+        if order_uuid is None or order_uuid not in seen:
+            new_orders.append(index)
+            if order_uuid:
+                seen.add(order_uuid)
+    timings["dedupe"] = (time.perf_counter() - phase) * 1000
+
+    # Reserved in its own short transaction, before the insert connection
+    # is taken, so the counter locks are held only for a moment
+    phase = time.perf_counter()
+    line_count = sum(len(lines[index]) for index in new_orders)
+    first = order_numbers.reserve({
+        PO_MASTER_SLNO: len(new_orders),
+        PO_ORDERNO: len(new_orders),
+        PO_DETAIL_SLNO: line_count,
+    })
+    slno = first.get(PO_MASTER_SLNO)
+    orderno = first.get(PO_ORDERNO)
+    detail_slno = first.get(PO_DETAIL_SLNO)
+
+    master_rows = []
+    detail_rows = []
+    ledger_rows = []
+    assigned = dict(known)
+    for index in new_orders:
+        supplier_code, otype, order_userid, orderdate = headers[index]
+        master_rows.append((slno, orderno, supplier_code, otype, order_userid, orderdate))
+        for barcode, quantity, rate, mrp in lines[index]:
+            detail_rows.append((slno, detail_slno, barcode, quantity, rate, mrp))
+            detail_slno += 1
+        order_uuid = order_uuids[index]
+        if order_uuid:
+            ledger_rows.append((order_uuid, slno, orderno, len(lines[index])))
+            assigned[order_uuid] = (slno, orderno, len(lines[index]))
+        else:
+            assigned[index] = (slno, orderno, len(lines[index]))
+        slno += 1
+        orderno += 1
+    timings["numbering"] = (time.perf_counter() - phase) * 1000
+
+    if not write_order_rows(master_rows, detail_rows, ledger_rows, batch_size, timings):
+        if not retry_duplicates:
+            raise Exception("Orders were written concurrently twice")
+        # A retry of the same upload got in first (the phone gave up waiting
+        # on this one); start again so those orders are answered from the ledger
+        return insert_orders(orders, retry_duplicates=False, check_limit=check_limit)
+
+    written = set(new_orders)
+    results = []
+    for index, order_uuid in enumerate(order_uuids):
+        order_slno, order_orderno, order_lines = assigned[order_uuid or index]
+        results.append({
+            "order_uuid": order_uuid,
+            "slno": order_slno,
+            "orderno": order_orderno,
+            "lines": order_lines,
+            "duplicate": index not in written,
+        })
+
+    timings = {name: round(value, 1) for name, value in timings.items()}
+    duplicates = len(orders) - len(new_orders)
+    logging.info(
+        f"📦 Inserted {len(master_rows)} orders / {len(detail_rows)} lines "
+        f"(batches of {batch_size}), {duplicates} already uploaded: {timings} ms"
+    )
+    return {
+        "orders": len(master_rows),
+        "lines": len(detail_rows),
+        "duplicates": duplicates,
+        "results": results,
+        "timings_ms": timings,
+    }
@@ -0,0 +1,178 @@
+# app/pagination.py
+# Keyset pagination and code-range sharding for pageable datasets.
+#
+# Pages are ordered by the dataset's page keys and each page starts strictly
+# after the last key of the previous one, so resuming after a dropped
+# connection re-fetches only the missing pages and no page costs more than an
+# index seek plus ``limit`` rows. Shards are disjoint
+# [code_from, code_to) ranges a client can download in parallel.
+#
+# "Strictly after" is only safe when page keys are unique. Products are keyed
+# by (code, barcode), which acc_productbatch does not guarantee, so they are
+# paged by product code alone: a page always holds whole products, and may go
+# over ``limit`` when one product has more rows than that.
+
+import base64
+import json
+import logging
+
+from app.db_utils import get_backend, get_db
+
+
+class InvalidCursor(Exception):
+    """Raised for continuation cursors that cannot be parsed"""
+
+
+def encode_cursor(last_key, code_to=None, dataset=None):
+    raw = json.dumps({"d": dataset, "k": list(last_key), "to": code_to}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, dataset=None):
+    """Return ``(last_key, code_to)`` from an opaque continuation cursor.
+
+    With ``dataset`` given, cursors issued for another dataset are rejected.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        last_key = tuple(data["k"])
+        cursor_dataset = data.get("d")
+    except Exception:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    if dataset is not None and cursor_dataset not in (None, dataset.name):
+        raise InvalidCursor(f"Cursor belongs to dataset {cursor_dataset!r}, not {dataset.name!r}")
+    if dataset is not None and len(last_key) != len(dataset.page_keys):
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}")
+    return last_key, data.get("to")
+
+
+def keyset_condition(page_keys):
+    """``(k0, k1, ...) > (?, ?, ...)`` spelled out for databases without row
+    value comparisons; returns ``(sql, number of params per key)``"""
+    branches = []
+    for i, key in enumerate(page_keys):
+        equal = [f"{previous} = ?" for previous in page_keys[:i]]
+        branches.append("(" + " AND ".join(equal + [f"{key} > ?"]) + ")")
+    return "(" + " OR ".join(branches) + ")"
+
+
+def keyset_params(after):
+    params = []
+    for i in range(len(after)):
+        params.extend(after[:i])
+        params.append(after[i])
+    return params
+
+
+def build_page_query(backend, dataset, after=None, code_from=None, code_to=None, limit=1000):
+    """SQL + params for one keyset page of ``dataset``.
+
+    ``code_from`` / ``code_to`` bound the first page key to [from, to).
+    """
+    page_keys = dataset.page_keys
+    conditions = []
+    params = []
+    if after is not None:
+        conditions.append(keyset_condition(page_keys))
+        params.extend(keyset_params(after))
+    if code_from is not None:
+        conditions.append(f"{page_keys[0]} >= ?")
+        params.append(code_from)
+    if code_to is not None:
+        conditions.append(f"{page_keys[0]} < ?")
+        params.append(code_to)
+
+    query = dataset.query.rstrip()
+    if conditions:
+        query += "\n    WHERE " + " AND ".join(conditions)
+    query += "\n    ORDER BY " + ", ".join(page_keys)
+    return backend.limit_query(query, limit), params
+
+
+def build_group_query(backend, dataset, key):
+    """SQL + params for every row whose page keys equal ``key``"""
+    conditions = " AND ".join(f"{expression} = ?" for expression in dataset.page_keys)
+    query = dataset.query.rstrip() + "\n    WHERE " + conditions
+    query += "\n    ORDER BY " + ", ".join(dataset.page_keys)
+    return query, list(key)
+
+
+def page_key(dataset, row):
+    """Keyset position of a row; NULL keys sort as '' (see PRODUCT_ORDER)"""
+    return tuple(
+        "" if row[index] is None else row[index]
+        for index in (dataset.fields.index(field) for field in dataset.key_fields[:len(dataset.page_keys)])
+    )
+
+
+def _fetch(query, params):
+    with get_db() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        rows = db_cursor.fetchall()
+        db_cursor.close()
+    return rows
+
+
+def fetch_page(dataset, cursor=None, code_from=None, code_to=None, limit=1000):
+    """Fetch one page of a pageable dataset (blocking - runs on the DB executor).
+
+    Returns ``(cursor tuples in dataset.fields order, next_cursor or None)``.
+    """
+    after = None
+    if cursor:
+        after, cursor_code_to = decode_cursor(cursor, dataset)
+        code_to = code_to if code_to is not None else cursor_code_to
+
+    backend = get_backend()
+    rows = _fetch(*build_page_query(backend, dataset, after, code_from, code_to, limit + 1))
+
+    has_more = len(rows) > limit
+    if has_more and len(dataset.page_keys) < len(dataset.key_fields):
+        # Page keys are a group key: never split a group across pages
+        boundary = page_key(dataset, rows[limit])
+        cut = limit
+        while cut and page_key(dataset, rows[cut - 1]) == boundary:
+            cut -= 1
+        if cut:
+            rows = rows[:cut]
+        else:
+            # One group bigger than a page: return all of it
+            rows = _fetch(*build_group_query(backend, dataset, boundary))
+    else:
+        rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(page_key(dataset, rows[-1]), code_to, dataset.name)
+    return rows, next_cursor
+
+
+def ordered_codes(dataset):
+    """Every first-key value of ``dataset`` in the database's own order
+    (``dataset.shard_query``)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(dataset.shard_query)
+        codes = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return codes
+
+
+def compute_shards(dataset, count):
+    """Split ``dataset`` into ``count`` disjoint first-key ranges of similar size.
+
+    Boundaries come from the database's own ordering, so they agree with the
+    ``>=`` / ``<`` comparisons used by the page query.
+    """
+    codes = ordered_codes(dataset)
+    count = max(1, min(count, len(codes) or 1))
+    step = len(codes) / count
+    boundaries = [codes[int(i * step)] for i in range(1, count)]
+    # Duplicate boundaries collapse (tiny catalogs), ranges stay disjoint
+    boundaries = sorted(set(boundaries), key=boundaries.index)
+
+    edges = [None] + boundaries + [None]
+    shards = [{"code_from": edges[i], "code_to": edges[i + 1]} for i in range(len(edges) - 1)]
+    logging.info(f"🧩 Planned {len(shards)} {dataset.name} shards over {len(codes)} keys")
+    return shards
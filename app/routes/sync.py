@@ -1,13 +1,41 @@
 # app/routes/sync.py
-from fastapi import APIRouter, HTTPException, Request, Body
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import json
 from jose import JWTError, jwt
 from app.schemas import PairCheckInput, LoginInput
-from app.db_utils import get_connection, load_config
+from app.db_utils import get_db, get_pool_stats, run_db
+from app.settings import get_settings
+from app.network_utils import network_info
+from app.datasets import (
+    InvalidProjection, UnknownDataset, apply_projections, get_datasets, rows_to_dicts, select_datasets
+)
+from app.dataset_fetch import fetch_dataset_rows, iter_datasets_concurrently
+from app.delta_sync import InvalidSyncToken, encode_token, get_change_tracker
+from app.merkle import get_hash_tree
+from app.nesting import FLAT_SHAPE, NESTED_SHAPE, SHAPES, nest_rows, ordered_for_nesting
+from app.pagination import InvalidCursor, compute_shards, fetch_page
+from app.columnar import COLUMNAR_FORMAT, FORMATS, ROWS_FORMAT, columnar_dataset
+from app.catalog_cache import Snapshot, catalog_cache, invalidate_catalog_cache, snapshot_response
+from app.orders import InvalidOrders, insert_orders, validate_upload
+from app.barcode_index import BARCODE_CHECK_OFF, BARCODE_CHECK_REJECT, barcode_catalog, find_unknown_barcodes
+from app.upload_coalescer import upload_coalescer
+from app.upload_journal import UnknownReceipt, get_upload_journal
+from app.serialization import (
+    MEDIA_TYPES, UnsupportedBodyEncoding, encode_body, negotiate_body_encoding, read_body,
+)
+from app.sqlite_export import EXPORT_MEDIA_TYPE, ExportNotFound, export_filename, get_export_store
+from app.streaming import (
+    NDJSON_MEDIA_TYPE, iter_dataset_ndjson, iterate_db_stream, prime_db_stream, wants_ndjson
+)
 from app.token_utils import create_access_token, SECRET_KEY, ALGORITHM
 from datetime import timedelta
+from functools import partial
 from datetime import datetime
 import traceback
+import anyio
+import asyncio
+import time
 import subprocess
 import os
 import psutil
@@ -18,6 +46,24 @@ router = APIRouter()
 
 PAIR_PASSWORD = "IMC-MOBILE"  # You can change this to whatever password you want
 
+def authorize(request: Request, context: str):
+    """Validate the Bearer token on a request and return the user id"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        logging.warning(f"❌ Token missing in {context} request")
+        raise HTTPException(status_code=401, detail="Token missing")
+
+    token = auth_header.split(" ")[1]
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        logging.warning(f"❌ Invalid token in {context} request")
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    userid = payload.get("sub")
+    logging.info(f"✅ {context.capitalize()} authorized for user: {userid}")
+    return userid
+
+
 @router.post("/pair-check")
 def pair_check(data: dict):
     """
@@ -80,8 +126,32 @@ def pair_check(data: dict):
         raise HTTPException(status_code=500, detail=f"Failed to start sync service: {str(e)}")
 
 
+def encoded_response(request: Request, payload, status_code=200):
+    """Payload as JSON, MessagePack or CBOR, per the client's Accept header"""
+    encoding = negotiate_body_encoding(request.headers.get("accept"))
+    return Response(
+        content=encode_body(payload, encoding),
+        status_code=status_code,
+        media_type=MEDIA_TYPES[encoding],
+        headers={"Vary": "Accept"},
+    )
+
+
+def fetch_user(userid, password):
+    """Look up a user row (blocking - runs on the DB executor)"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+
+        query = "SELECT id, pass FROM acc_users WHERE id = ? AND pass = ?"
+        cursor.execute(query, (userid, password))
+        user = cursor.fetchone()
+
+        cursor.close()
+    return user
+
+
 @router.post("/login")
-def login(payload: LoginInput):
+async def login(payload: LoginInput):
     """
     Login endpoint - validates user credentials
     Expected payload: {"userid": "username", "password": "userpass"}
@@ -89,15 +159,7 @@ def login(payload: LoginInput):
     logging.info(f"🔐 Login attempt for user: {payload.userid}")
     
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        query = "SELECT id, pass FROM acc_users WHERE id = ? AND pass = ?"
-        cursor.execute(query, (payload.userid, payload.password))
-        user = cursor.fetchone()
-
-        cursor.close()
-        conn.close()
+        user = await run_db(fetch_user, payload.userid, payload.password)
 
         if user:
             user_id = user[0]
@@ -123,180 +185,446 @@ def login(payload: LoginInput):
 
 
 @router.get("/verify-token")
-def verify_token(request: Request):
+async def verify_token(request: Request):
     """Verify JWT token validity"""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logging.warning("❌ Token missing in verification request")
-        raise HTTPException(status_code=401, detail="Token missing")
+    userid = authorize(request, "token verification")
+    return {"status": "success", "userid": userid}
+    
 
-    token = auth_header.split(" ")[1]
+def build_download_payload(fmt=ROWS_FORMAT, datasets=None, shape=FLAT_SHAPE):
+    """Full download response body in the requested format (blocking)"""
+    datasets = datasets or get_datasets()
+    # Token first: data fetched afterwards is at least as new as the token
+    token = get_change_tracker().current_token()
+
+    started = time.perf_counter()
+    data = {}
+    counts = {}
+    for dataset, rows in iter_datasets_concurrently(datasets):
+        # Formatted while any slower query is still running.
+        # Columnar output is built straight from the tuples - no dict per row
+        format_started = time.perf_counter()
+        if shape == NESTED_SHAPE and dataset.nesting:
+            data[dataset.name] = nest_rows(rows, dataset.fields, dataset.nesting)
+        else:
+            data[dataset.name] = format_rows(rows, dataset.fields, fmt)
+        counts[dataset.name] = len(data[dataset.name])
+        logging.info(
+            f"⏱️ {dataset.name}: formatted ({fmt}, {shape}) in {time.perf_counter() - format_started:.3f}s"
+        )
+
+    logging.info(f"✅ Data download built ({fmt}, {shape}) in {time.perf_counter() - started:.3f}s: {counts}")
+    payload = {"status": "success"}
+    if fmt != ROWS_FORMAT:
+        payload["format"] = fmt
+    if shape != FLAT_SHAPE:
+        payload["shape"] = shape
+    for dataset in datasets:
+        payload[dataset.name] = data[dataset.name]
+    # Pass back as ?since= next time to receive only changes
+    payload["sync_token"] = token
+    return payload
+
+
+def build_download_snapshot(fmt=ROWS_FORMAT, encoding="json", datasets=None, shape=FLAT_SHAPE):
+    """Query and serialize the full download once for the snapshot cache"""
+    settings = get_settings()
+    return Snapshot(
+        encode_body(build_download_payload(fmt, datasets, shape), encoding),
+        settings=settings,
+        compress=settings.compression_enabled,
+    )
+
+
+def fetch_delta(since, datasets=None):
+    """Changes since a sync token (blocking - may rescan the ERP tables)"""
+    tracker = get_change_tracker()
+    tracker.refresh_if_stale(get_settings().delta_refresh_interval)
+    selected = {dataset.name: dataset for dataset in datasets or get_datasets() if dataset.name in tracker.datasets}
+    changes = tracker.changes_since(since, list(selected))
+
+    response = {
+        "status": "success",
+        "delta": True,
+        "reset": changes["reset"],
+        # From the version the changes were read at: a scan finishing since
+        # then must not be skipped by the client
+        "sync_token": encode_token(tracker.epoch, changes["version"]) if changes["version"] else None,
+    }
+    counts = {}
+    for name, dataset_changes in changes["datasets"].items():
+        fields = selected[name].fields
+        if fields != tracker.datasets[name].fields:
+            # ?fields= projection; the state file keeps whole rows
+            dataset_changes["upserts"] = [
+                {field: row.get(field) for field in fields} for row in dataset_changes["upserts"]
+            ]
+        response[name] = dataset_changes
+        counts[name] = {key: len(value) for key, value in dataset_changes.items()}
+    logging.info(f"✅ Delta download since v{changes['since_version']} -> v{changes['version']}: {counts}")
+    return response
+
+
+async def download_page(request: Request, datasets, fmt=ROWS_FORMAT):
+    """Keyset-paginated / range-sharded download of one pageable dataset.
+
+    ``limit`` sets the page size, ``cursor`` continues after a previous page
+    and ``code_from`` / ``code_to`` restrict the download to a [from, to)
+    shard of the first page key (product code). The other selected datasets
+    ride along on the first page of the first shard only.
+    """
+    settings = get_settings()
+    params = request.query_params
+    paged = pageable_dataset(datasets)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        userid = payload.get("sub")
-        logging.info(f"✅ Token verified for user: {userid}")
-        return {"status": "success", "userid": userid}
-    except JWTError as e:
-        logging.warning(f"❌ Invalid token: {str(e)}")
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
+        limit = int(params.get("limit") or settings.page_size_default)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="limit must be an integer")
+    limit = max(1, min(limit, settings.page_size_max))
+    cursor = params.get("cursor")
+    code_from = params.get("code_from")
+    code_to = params.get("code_to")
+
+    riders = [dataset for dataset in datasets if dataset is not paged] if not cursor and not code_from else []
+    try:
+        # Riders are read on their own connections alongside the page
+        (page_rows, next_cursor), *rider_rows = await asyncio.gather(
+            run_db(fetch_page, paged, cursor, code_from, code_to, limit),
+            *(run_db(fetch_dataset_rows, dataset) for dataset in riders),
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"❌ Paged data download failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+
+    response = {"status": "success"}
+    if fmt != ROWS_FORMAT:
+        response["format"] = fmt
+    for dataset, rows in zip(riders, rider_rows):
+        response[dataset.name] = format_rows(rows, dataset.fields, fmt)
+    response.update({
+        paged.name: format_rows(page_rows, paged.fields, fmt),
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None,
+    })
+    logging.info(f"✅ {paged.name} page served: {len(page_rows)} rows, more={next_cursor is not None}")
+    return encoded_response(request, response)
+
+
+def pageable_dataset(datasets):
+    """The one dataset with page keys among ``datasets`` (400 otherwise)"""
+    pageable = [dataset for dataset in datasets if dataset.page_keys]
+    if len(pageable) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Paging needs exactly one pageable dataset, got {[d.name for d in pageable]}",
+        )
+    return pageable[0]
+
+
+def requested_datasets(request: Request):
+    """Datasets selected by ``?datasets=`` (all when absent), narrowed to the
+    columns named in ``?fields=``"""
+    params = request.query_params
+    try:
+        datasets = select_datasets(params.get("datasets"))
+        return apply_projections(datasets, params.getlist("fields"))
+    except (UnknownDataset, InvalidProjection) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def format_rows(rows, fields, fmt):
+    """Cursor tuples in the response format the client asked for"""
+    if fmt == COLUMNAR_FORMAT:
+        return columnar_dataset(rows, fields)
+    return rows_to_dicts(rows, fields)
+
+
+@router.get("/data-download/shards")
+async def data_download_shards(request: Request, count: int = 4):
+    """Split a pageable dataset (products by default) into ``count`` key
+    ranges for parallel download"""
+    authorize(request, "shard planning")
+    if count < 1 or count > 64:
+        raise HTTPException(status_code=400, detail="count must be between 1 and 64")
+    dataset = pageable_dataset(requested_datasets(request))
+    if not dataset.shard_query:
+        raise HTTPException(status_code=400, detail=f"Dataset {dataset.name} cannot be sharded")
+    try:
+        shards = await run_db(compute_shards, dataset, count)
+    except Exception as e:
+        logging.error(f"❌ Shard planning failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Shard planning failed: {str(e)}")
+    return encoded_response(request, {"status": "success", "dataset": dataset.name, "shards": shards})
+
+
+def fetch_hash_tree(dataset):
+    """Current hash tree of a dataset (blocking - may rescan the ERP tables)"""
+    settings = get_settings()
+    tracker = get_change_tracker()
+    if dataset.name not in tracker.datasets:
+        raise HTTPException(status_code=400, detail=f"Dataset {dataset.name} is not tracked yet - restart the server")
+    tracker.refresh_if_stale(settings.delta_refresh_interval)
+    tree = get_hash_tree(tracker, dataset.name, settings.merkle_chunk_rows)
+    snapshot = tree.snapshot()
+    # The version the hashes describe; rows fetched later are at least this new
+    snapshot["sync_token"] = encode_token(tracker.epoch, tree.version) if tree.version else None
+    return snapshot
+
+
+@router.get("/data-download/hashes")
+async def data_download_hashes(request: Request):
+    """Hash tree over a pageable dataset (products by default), by code range.
+
+    A device compares ``root`` - and on mismatch each chunk's ``hash`` - with
+    hashes of its local rows (see app/merkle.py for the definitions), then
+    re-downloads only the diverged chunks via
+    /data-download?code_from=...&code_to=... . ``layout`` changes whenever the
+    chunk boundaries move.
+    """
+    authorize(request, "hash tree")
+    dataset = pageable_dataset(requested_datasets(request))
+    if not dataset.shard_query:
+        raise HTTPException(status_code=400, detail=f"Dataset {dataset.name} has no code ordering for a hash tree")
+    try:
+        snapshot = await run_db(fetch_hash_tree, dataset)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Hash tree failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Hash tree failed: {str(e)}")
+    logging.info(f"🌳 Hash tree served for {dataset.name}: {len(snapshot['chunks'])} chunks")
+    return encoded_response(request, {"status": "success", **snapshot})
+
+
+def current_export_token():
+    """Catalog version to export: the latest change scan (blocking)"""
+    tracker = get_change_tracker()
+    tracker.refresh_if_stale(get_settings().delta_refresh_interval)
+    return tracker.current_token()
+
+
+@router.get("/data-download/sqlite")
+async def data_download_sqlite(request: Request, version: str = None):
+    """Ready-made SQLite file with master_data / product_data for new devices.
+
+    Supports Range requests. The response's X-Sync-Token names the catalog
+    version; pass it as ``?version=`` to resume that exact file, and as
+    ``?since=`` on /data-download for later delta syncs.
+    """
+    authorize(request, "SQLite export")
+    store = get_export_store()
+    try:
+        if version:
+            path = store.existing(version)
+        else:
+            version = await run_db(current_export_token)
+            if version is None:
+                raise HTTPException(status_code=503, detail="Catalog not scanned yet - retry shortly")
+            path = await run_db(store.get_or_build, version)
+    except ExportNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌ SQLite export failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+
+    return FileResponse(
+        path,
+        media_type=EXPORT_MEDIA_TYPE,
+        filename=export_filename(version),
+        headers={"X-Sync-Token": version, "Cache-Control": "no-cache"},
+    )
+
 
 @router.get("/data-download")
-def data_download(request: Request):
+async def data_download(request: Request):
     """Download data endpoint - requires valid JWT token"""
     logging.info("📥 Data download request received")
     
     # ✅ Step 1: Verify JWT token
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logging.warning("❌ Token missing in data download request")
-        raise HTTPException(status_code=401, detail="Token missing")
-
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        userid = payload.get("sub")
-        logging.info(f"✅ Data download authorized for user: {userid}")
-    except JWTError:
-        logging.warning("❌ Invalid token in data download request")
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    authorize(request, "data download")
+
+    params = request.query_params
+    fmt = params.get("format", ROWS_FORMAT)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(FORMATS)}")
+    datasets = requested_datasets(request)
+    paged = any(name in params for name in ("limit", "cursor", "code_from", "code_to"))
+    since = params.get("since")
+    if fmt != ROWS_FORMAT and not paged and (since or wants_ndjson(request)):
+        raise HTTPException(
+            status_code=400,
+            detail=f"format={fmt} is only available for full and paged downloads",
+        )
+
+    shape = params.get("shape", FLAT_SHAPE)
+    if shape not in SHAPES:
+        raise HTTPException(status_code=400, detail=f"shape must be one of {list(SHAPES)}")
+    if shape == NESTED_SHAPE:
+        if paged or since or fmt != ROWS_FORMAT:
+            raise HTTPException(
+                status_code=400,
+                detail="shape=nested is only available for full and streamed downloads in rows format",
+            )
+        # Grouping needs each product's rows next to each other
+        datasets = tuple(ordered_for_nesting(dataset) if dataset.nesting else dataset for dataset in datasets)
 
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
+    if paged:
+        return await download_page(request, datasets, fmt)
 
-        # ✅ Step 3: Fetch acc_master data
-        cursor.execute("SELECT code, name, place FROM acc_master WHERE super_code = 'SUNCR'")
-        master_rows = cursor.fetchall()
-        master_data = [
-            {
-                "code": row[0],
-                "name": row[1],
-                "place": row[2]
-            }
-            for row in master_rows
-        ]
-
-        cursor.execute("""
-            SELECT 
-                p.code,
-                p.name,
-                pb.barcode,
-                pb.quantity,
-                pb.salesprice,
-                pb.bmrp,
-                pb.cost
-            FROM 
-                acc_product p
-            LEFT JOIN 
-                acc_productbatch pb
-            ON 
-                p.code = pb.productcode
-        """)
-        product_rows = cursor.fetchall()
-        product_data = [
-            {
-                "code": row[0],
-                "name": row[1],
-                "barcode": row[2],
-                "quantity": row[3],
-                "salesprice": row[4],
-                "bmrp": row[5],
-                "cost": row[6]
-            }
-            for row in product_rows
-        ]
+    if since:
+        # Delta mode: only rows inserted/updated/deleted after the client's token
+        try:
+            delta = await run_db(fetch_delta, since, datasets)
+        except InvalidSyncToken as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logging.error(f"❌ Delta download failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+        return encoded_response(request, delta)
+
+    if wants_ndjson(request):
+        # Streaming mode: rows leave in bounded chunks as they are fetched
+        gen = iter_dataset_ndjson(datasets, get_settings().stream_chunk_size, nested=shape == NESTED_SHAPE)
+        try:
+            first = await prime_db_stream(gen)
+        except Exception as e:
+            logging.error(f"❌ Data download failed: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
+        logging.info("📤 Streaming data download as NDJSON")
+        return StreamingResponse(iterate_db_stream(gen, first), media_type=NDJSON_MEDIA_TYPE)
 
-        cursor.close()
-        conn.close()
+    try:
+        if get_settings().catalog_cache_enabled:
+            # Serve the shared, precompressed snapshot (or 304) for this catalog version
+            tracker = get_change_tracker()
+            encoding = negotiate_body_encoding(request.headers.get("accept"))
+            selection = tuple((dataset.name, dataset.fields) for dataset in datasets)
+            key = (fmt, shape, encoding, selection, tracker.epoch, tracker.version)
+            snapshot = await run_db(
+                catalog_cache.get_or_build, key, partial(build_download_snapshot, fmt, encoding, datasets, shape)
+            )
+            logging.info(f"✅ Data download served from snapshot {snapshot.etag} ({encoding})")
+            return snapshot_response(request, snapshot, media_type=MEDIA_TYPES[encoding])
 
-        logging.info(f"✅ Data download successful: {len(master_data)} masters, {len(product_data)} products")
-        
-        return {
-            "status": "success",
-            "master_data": master_data,
-            "product_data": product_data
-        }
+        payload = await run_db(build_download_payload, fmt, datasets, shape)
+        return encoded_response(request, payload)
 
     except Exception as e:
         logging.error(f"❌ Data download failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
 
+def check_barcodes(orders):
+    """Look every line's barcode up in the in-memory index (no DB access).
+
+    Returns extra response fields ("flag" mode) or raises a 400 ("reject"
+    mode). Skipped while the index is still loading.
+    """
+    mode = get_settings().upload_barcode_check
+    if mode == BARCODE_CHECK_OFF:
+        return {}
+    index = barcode_catalog.ready_index()
+    if index is None:
+        logging.warning("⚠️ Barcode index not loaded yet; upload accepted unchecked")
+        return {}
+    unknown = find_unknown_barcodes(index, orders)
+    if unknown and mode == BARCODE_CHECK_REJECT:
+        barcodes = sorted({line["barcode"] for line in unknown})
+        logging.warning(f"❌ Rejected orders upload: {len(unknown)} lines with unknown barcodes")
+        raise HTTPException(status_code=400, detail={
+            "message": f"{len(unknown)} order lines have unknown barcodes: {barcodes[:20]}",
+            "unknown_barcodes": unknown,
+        })
+    if unknown:
+        logging.warning(f"⚠️ {len(unknown)} uploaded lines have unknown barcodes")
+    return {"unknown_barcodes": unknown}
+
+
+async def journal_upload(request: Request, userid, orders, flags):
+    """Journal validated orders durably and acknowledge with a receipt id;
+    the journal applier writes them later (see app/upload_journal.py)"""
+    orders = [order.model_dump(mode="json") for order in orders]
+    try:
+        started = time.perf_counter()
+        receipt_id = await anyio.to_thread.run_sync(get_upload_journal().append, userid, orders)
+    except Exception as e:
+        logging.error(f"❌ Journaling orders upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    logging.info(
+        f"📓 Journaled {len(orders)} orders as receipt {receipt_id} "
+        f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+    return encoded_response(request, {
+        "status": "accepted",
+        "message": "Orders received and queued",
+        "receipt_id": receipt_id,
+        "orders": len(orders),
+        "results": [{"order_uuid": order.get("order_uuid")} for order in orders],
+        **flags,
+    }, status_code=202)
+
+
+@router.get("/upload-orders/{receipt_id}")
+async def upload_receipt_status(request: Request, receipt_id: str):
+    """Whether a journaled upload has been applied (or failed)"""
+    authorize(request, "upload status")
+    try:
+        status = await anyio.to_thread.run_sync(get_upload_journal().status, receipt_id)
+    except UnknownReceipt as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return encoded_response(request, status)
+
+
 @router.post("/upload-orders")
-def upload_orders(request: Request, payload: dict = Body(...)):
-    """Upload orders endpoint - requires valid JWT token"""
+async def upload_orders(request: Request):
+    """Upload orders endpoint - requires valid JWT token.
+
+    The body may be JSON, MessagePack or CBOR (see Content-Type).
+    """
     logging.info("📤 Orders upload request received")
     
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        logging.warning("❌ Token missing in upload orders request")
-        raise HTTPException(status_code=401, detail="Token missing")
-        
-    token = auth_header.split(" ")[1]
+    userid = authorize(request, "upload orders")
 
     try:
-        decoded_payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        userid = decoded_payload.get("sub")
-        logging.info(f"✅ Upload orders authorized for user: {userid}")
-    except JWTError:
-        logging.warning("❌ Invalid token in upload orders request")
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-
+        payload = await read_body(request)
+    except UnsupportedBodyEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Request body must be an object")
+
+    # Whole upload checked before any connection is taken; on a worker
+    # thread, as a 20k-line upload takes long enough to stall other requests
     try:
-        logging.info("🔗 Connecting to database...")
-        conn = get_connection()
-        cursor = conn.cursor()
+        started = time.perf_counter()
+        orders = await anyio.to_thread.run_sync(validate_upload, payload)
+    except InvalidOrders as e:
+        logging.warning(f"❌ Rejected orders upload: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    logging.info(f"✅ Validated {len(orders)} orders in {(time.perf_counter() - started) * 1000:.1f} ms")
 
-        cursor.execute("SELECT MAX(slno) FROM acc_purchaseordermaster")
-        max_slno = int(cursor.fetchone()[0] or 0)
-
-        cursor.execute("SELECT MAX(orderno) FROM acc_purchaseordermaster")
-        max_orderno = int(cursor.fetchone()[0] or 0)
-
-        orders = payload.get("orders", [])
-        logging.info(f"📦 Processing {len(orders)} orders...")
-
-        for order in orders:
-            # Generate new slno and orderno
-            max_slno += 1
-            max_orderno += 1
-            logging.info(f"📝 Processing Order: slno={max_slno}, orderno={max_orderno}")
-
-            supplier_code = order.get("supplier_code")
-            otype = order.get("otype", "O")
-            order_userid = order.get("userid")
-            orderdate = order.get("order_date")
-
-            cursor.execute("""
-                INSERT INTO acc_purchaseordermaster (slno, orderno, supplier, otype, userid, orderdate)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (max_slno, max_orderno, supplier_code, otype, order_userid, orderdate))
-
-            cursor.execute("SELECT MAX(slno) FROM acc_purchaseorderdetails")
-            max_detail_slno = int(cursor.fetchone()[0] or 0)
-
-            for product in order.get("products", []):
-                max_detail_slno += 1
-                cursor.execute("""
-                    INSERT INTO acc_purchaseorderdetails 
-                    (masterslno, slno, barcode, qty, rate, mrp)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    max_slno,
-                    max_detail_slno,
-                    product.get("barcode"),
-                    product.get("quantity"),
-                    product.get("rate"),
-                    product.get("mrp")
-                ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+    flags = await anyio.to_thread.run_sync(check_barcodes, orders)
+
+    if get_settings().upload_journal:
+        return await journal_upload(request, userid, orders, flags)
+
+    try:
+        if get_settings().upload_coalesce:
+            result = await upload_coalescer.submit(orders)
+        else:
+            logging.info("🔗 Connecting to database...")
+            result = await run_db(insert_orders, orders)
         
         logging.info(f"✅ Orders uploaded successfully: {len(orders)} orders processed")
-        return {"status": "success", "message": "Orders uploaded successfully"}
+        return encoded_response(
+            request, {"status": "success", "message": "Orders uploaded successfully", **result, **flags}
+        )
 
     except Exception as e:
         logging.error(f"❌ Orders upload failed: {str(e)}")
@@ -306,13 +634,18 @@ def upload_orders(request: Request, payload: dict = Body(...)):
 
 
 @router.get("/status")
-def get_status():
+async def get_status():
     """Enhanced status check endpoint with all IP addresses"""
-    config = load_config()
+    # Served from the background network cache - no probing here
+    network = network_info.snapshot()
+    if network["refreshed_at"] is None:
+        # First discovery still running; fall back to what startup last saved
+        settings = get_settings()
+        network = {"ips": list(settings.all_ips), "best_ip": settings.ip}
     
     # Get all available IPs for the user to try
-    all_ips = config.get("all_ips", [])
-    primary_ip = config.get("ip", "unknown")
+    all_ips = network["ips"]
+    primary_ip = network["best_ip"] or "unknown"
     
     return {
         "status": "online",
@@ -331,4 +664,31 @@ def get_status():
                 "Verify port 8000 is not blocked"
             ]
         }
-    }
\ No newline at end of file
+    }
+
+@router.get("/pool-stats")
+async def pool_stats():
+    """Database connection pool counters for monitoring"""
+    stats = get_pool_stats()
+    if stats is None:
+        return {"status": "idle", "message": "Connection pool not created yet"}
+    return {"status": "success", "pool": stats}
+
+
+@router.get("/upload-stats")
+async def upload_stats():
+    """Group commit sizes achieved by /upload-orders, for monitoring"""
+    return {
+        "status": "success",
+        "coalescer": upload_coalescer.stats(),
+        "barcode_index": barcode_catalog.stats(),
+    }
+
+
+@router.post("/cache/invalidate")
+async def invalidate_cache(request: Request):
+    """Drop cached download snapshots (e.g. after a bulk price update in the ERP)"""
+    authorize(request, "cache invalidation")
+
+    removed = invalidate_catalog_cache()
+    return {"status": "success", "invalidated": removed, "cache": catalog_cache.stats()}
@@ -4,6 +4,7 @@ import logging
 import os
 import sys
 from datetime import datetime
+from app.settings import get_settings
 
 def setup_service_logging():
     """Setup logging specifically for SyncService"""
@@ -33,6 +34,9 @@ def setup_service_logging():
 
 def run_sync_service():
     logger = setup_service_logging()
+    # Imported only now: app.db_utils configures logging for app.log on
+    # import, which would otherwise win over the service's own setup
+    from app.upload_journal import JournalApplier, journal_directory
     
     logger.info("🚀 SyncService started successfully")
     logger.info("📁 Log files are being saved in the 'logs' folder")
@@ -42,9 +46,21 @@ def run_sync_service():
         logger.info("🔄 SyncService is now running in background...")
         logger.info("ℹ️  Press Ctrl+C to stop the service")
         
+        applier = None
         while True:
-            # This keeps the service alive
-            # You can add your sync logic here later
+            settings = get_settings()
+            if settings.upload_journal and settings.journal_applier == "service":
+                # Drain journaled uploads into the database (app/upload_journal.py)
+                if applier is None:
+                    logger.info(f"📥 Applying upload journal from {journal_directory(settings)}")
+                    applier = JournalApplier(journal_directory(settings), settings.journal_apply_batch)
+                try:
+                    applier.apply_pending()
+                except Exception as e:
+                    logger.error(f"❌ Applying the upload journal failed: {str(e)}")
+                time.sleep(settings.journal_apply_interval)
+                continue
+
             logger.debug("🔧 SyncService heartbeat - running normally")
             time.sleep(30)  # Check every 30 seconds
             
@@ -1,7 +1,9 @@
 # app/schemas.py
 
-from pydantic import BaseModel
-from typing import Optional
+from decimal import Decimal
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints, field_validator
+from typing import Annotated, List, Optional
+from uuid import UUID
 
 class PairCheckInput(BaseModel):
     ip: str
@@ -20,4 +22,56 @@ class TokenResponse(BaseModel):
 class PairCheckResponse(BaseModel):
     status: str
     message: str
-    pair_successful: bool
\ No newline at end of file
+    pair_successful: bool
+
+# -- /upload-orders ---------------------------------------------------------
+# Validated in one pass before any database work. Numbers may arrive as
+# strings ("2", "10.50") and barcodes as numbers; both are coerced. Everything
+# else about the shape is checked strictly. Unknown keys are ignored so older
+# apps keep working. Quantities and money are Decimal, so NUMERIC columns get
+# exactly what the phone sent.
+
+MAX_CODE_LENGTH = 50
+MAX_BARCODE_LENGTH = 50
+MAX_LINES_PER_ORDER = 5000
+MAX_ORDERS_PER_UPLOAD = 1000
+MAX_QUANTITY = 1_000_000
+MAX_PRICE = 1_000_000_000
+MAX_DIGITS = 18
+DECIMAL_PLACES = 4
+
+Code = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=MAX_CODE_LENGTH)]
+Quantity = Annotated[Decimal, Field(gt=0, le=MAX_QUANTITY, max_digits=MAX_DIGITS, decimal_places=DECIMAL_PLACES)]
+Price = Annotated[Decimal, Field(ge=0, le=MAX_PRICE, max_digits=MAX_DIGITS, decimal_places=DECIMAL_PLACES)]
+
+
+class OrderLineInput(BaseModel):
+    model_config = ConfigDict(extra="ignore", coerce_numbers_to_str=True)
+
+    barcode: Annotated[str, StringConstraints(strip_whitespace=True, min_length=1, max_length=MAX_BARCODE_LENGTH)]
+    quantity: Quantity
+    rate: Optional[Price] = None
+    mrp: Optional[Price] = None
+
+
+class OrderInput(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    order_uuid: Optional[UUID] = None
+    supplier_code: Code
+    otype: Annotated[str, StringConstraints(min_length=1, max_length=10)] = "O"
+    userid: Optional[Code] = None
+    order_date: Optional[Annotated[str, StringConstraints(max_length=32)]] = None
+    products: Annotated[List[OrderLineInput], Field(max_length=MAX_LINES_PER_ORDER)] = []
+
+    @field_validator("order_uuid", mode="before")
+    @classmethod
+    def blank_uuid_is_none(cls, value):
+        # Older apps send "" for orders created before they had UUIDs
+        return None if isinstance(value, str) and not value.strip() else value
+
+
+class OrderUploadInput(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    orders: Annotated[List[OrderInput], Field(max_length=MAX_ORDERS_PER_UPLOAD)] = []
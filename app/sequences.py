@@ -0,0 +1,109 @@
+# app/sequences.py
+# Number allocation for uploaded orders (slno / orderno).
+#
+# Instead of every upload running SELECT MAX() on the order tables and
+# counting up from there - which two devices uploading at once can do with
+# the same result - each upload reserves a contiguous block per sequence in
+# one short transaction on a counter table in the ERP database. The UPDATE
+# takes the counter row's write lock, so concurrent reservations queue for a
+# moment and never overlap.
+#
+# Counters are primed from MAX() of their column the first time they are used
+# after startup (and again after a failed insert), so rows the ERP desktop
+# software numbered itself in the meantime are skipped over.
+
+import logging
+import threading
+
+from app.db_utils import get_db
+
+SEQUENCE_TABLE = "syncanywhere_sequences"
+
+PO_MASTER_SLNO = "po_master_slno"
+PO_ORDERNO = "po_orderno"
+PO_DETAIL_SLNO = "po_detail_slno"
+
+# sequence name -> (table, column) it numbers
+ORDER_SEQUENCES = {
+    PO_MASTER_SLNO: ("acc_purchaseordermaster", "slno"),
+    PO_ORDERNO: ("acc_purchaseordermaster", "orderno"),
+    PO_DETAIL_SLNO: ("acc_purchaseorderdetails", "slno"),
+}
+
+
+class SequenceAllocator:
+    """Reserves blocks of consecutive numbers from counters in the ERP database"""
+
+    def __init__(self, sequences):
+        self.sequences = dict(sequences)
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._synced = set()
+
+    def _ensure_table(self, cursor):
+        try:
+            cursor.execute(f"SELECT COUNT(*) FROM {SEQUENCE_TABLE}")
+            cursor.fetchone()
+        except Exception:
+            logging.info(f"🔢 Creating sequence table {SEQUENCE_TABLE}")
+            cursor.execute(
+                f"CREATE TABLE {SEQUENCE_TABLE} ("
+                "name VARCHAR(64) NOT NULL PRIMARY KEY, "
+                "next_value BIGINT NOT NULL)"
+            )
+        self._table_ready = True
+
+    def _sync(self, cursor, name):
+        """Move a counter past the largest number already in its column"""
+        table, column = self.sequences[name]
+        cursor.execute(f"SELECT MAX({column}) FROM {table}")
+        floor = int(cursor.fetchone()[0] or 0) + 1
+        cursor.execute(f"SELECT next_value FROM {SEQUENCE_TABLE} WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(f"INSERT INTO {SEQUENCE_TABLE} (name, next_value) VALUES (?, ?)", (name, floor))
+        elif int(row[0]) < floor:
+            logging.warning(f"⚠️ Sequence {name} behind {table}.{column}; moving {row[0]} -> {floor}")
+            cursor.execute(f"UPDATE {SEQUENCE_TABLE} SET next_value = ? WHERE name = ?", (floor, name))
+        self._synced.add(name)
+
+    def reserve(self, counts):
+        """Reserve ``counts[name]`` numbers per sequence; returns the first
+        number of each block (blocking - runs on the DB executor)"""
+        counts = {name: count for name, count in counts.items() if count > 0}
+        if not counts:
+            return {}
+
+        first = {}
+        with get_db() as conn:
+            cursor = conn.cursor()
+            try:
+                if not self._table_ready or any(name not in self._synced for name in counts):
+                    with self._lock:
+                        if not self._table_ready:
+                            self._ensure_table(cursor)
+                        for name in counts:
+                            if name not in self._synced:
+                                self._sync(cursor, name)
+                        conn.commit()
+
+                for name in sorted(counts):
+                    # The UPDATE locks the counter row until commit: one step, no overlap
+                    cursor.execute(
+                        f"UPDATE {SEQUENCE_TABLE} SET next_value = next_value + ? WHERE name = ?",
+                        (counts[name], name),
+                    )
+                    cursor.execute(f"SELECT next_value FROM {SEQUENCE_TABLE} WHERE name = ?", (name,))
+                    first[name] = int(cursor.fetchone()[0]) - counts[name]
+                conn.commit()
+            finally:
+                cursor.close()
+        return first
+
+    def invalidate(self):
+        """Re-prime every counter from MAX() on next use (e.g. after a key clash)"""
+        with self._lock:
+            self._synced.clear()
+
+
+order_numbers = SequenceAllocator(ORDER_SEQUENCES)
@@ -0,0 +1,142 @@
+# app/serialization.py
+# Body encodings negotiated per request: JSON (default), MessagePack, CBOR.
+#
+# Binary bodies carry numbers natively - a Decimal price goes out as a
+# MessagePack/CBOR int or float instead of digits in a string the client has
+# to re-parse - and are typically much cheaper to decode on the device. Values
+# are converted exactly like the JSON path (whole Decimals stay ints) so every
+# encoding yields the same data. Both libraries are optional: without them
+# the server simply keeps answering in JSON.
+
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.streaming import json_bytes
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import cbor2
+    HAS_CBOR = True
+except ImportError:
+    HAS_CBOR = False
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+JSON_ENCODING = "json"
+MSGPACK_ENCODING = "msgpack"
+CBOR_ENCODING = "cbor"
+
+MEDIA_TYPES = {
+    JSON_ENCODING: JSON_MEDIA_TYPE,
+    MSGPACK_ENCODING: MSGPACK_MEDIA_TYPE,
+    CBOR_ENCODING: CBOR_MEDIA_TYPE,
+}
+
+# Accept / Content-Type values understood for each encoding
+_MEDIA_ALIASES = {
+    JSON_MEDIA_TYPE: JSON_ENCODING,
+    MSGPACK_MEDIA_TYPE: MSGPACK_ENCODING,
+    "application/x-msgpack": MSGPACK_ENCODING,
+    "application/vnd.msgpack": MSGPACK_ENCODING,
+    CBOR_MEDIA_TYPE: CBOR_ENCODING,
+}
+
+
+class UnsupportedBodyEncoding(Exception):
+    """Raised for request bodies in an encoding this server cannot decode"""
+
+
+def available_body_encodings():
+    encodings = [JSON_ENCODING]
+    if HAS_MSGPACK:
+        encodings.append(MSGPACK_ENCODING)
+    if HAS_CBOR:
+        encodings.append(CBOR_ENCODING)
+    return encodings
+
+
+def _native(value):
+    """Same conversions as streaming.json_default, minus the JSON-only ones"""
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _cbor_native(encoder, value):
+    encoder.encode(_native(value))
+
+
+# cbor2 knows Decimal/datetime (as tagged values most mobile decoders reject),
+# so override them rather than relying on ``default``
+_CBOR_ENCODERS = {Decimal: _cbor_native, datetime: _cbor_native, date: _cbor_native}
+
+
+def _media_type(value):
+    return value.split(";")[0].strip().lower()
+
+
+def negotiate_body_encoding(accept, available=None):
+    """Pick the response encoding from an Accept header; JSON unless a binary
+    type is explicitly preferred"""
+    available = available or available_body_encodings()
+    best, best_q = JSON_ENCODING, 0.0
+    for part in (accept or "").split(","):
+        encoding = _MEDIA_ALIASES.get(_media_type(part))
+        if encoding is None or encoding not in available:
+            continue
+        q = 1.0
+        for param in part.split(";")[1:]:
+            param = param.strip()
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encode_body(obj, encoding=JSON_ENCODING):
+    """Serialize a response payload"""
+    if encoding == MSGPACK_ENCODING:
+        return msgpack.packb(obj, default=_native, use_bin_type=True)
+    if encoding == CBOR_ENCODING:
+        return cbor2.dumps(obj, encoders=_CBOR_ENCODERS)
+    return json_bytes(obj)
+
+
+def decode_body(body, content_type):
+    """Parse a request body according to its Content-Type (JSON by default)"""
+    media_type = _media_type(content_type or "")
+    encoding = _MEDIA_ALIASES.get(media_type, JSON_ENCODING if not media_type or "json" in media_type else None)
+    if encoding is None or encoding not in available_body_encodings():
+        raise UnsupportedBodyEncoding(f"Unsupported Content-Type: {content_type}")
+    if encoding == MSGPACK_ENCODING:
+        return msgpack.unpackb(body, raw=False)
+    if encoding == CBOR_ENCODING:
+        return cbor2.loads(body)
+    return json.loads(body)
+
+
+async def read_body(request):
+    """Decoded request body (JSON, MessagePack or CBOR)"""
+    body = await request.body()
+    try:
+        return decode_body(body, request.headers.get("content-type"))
+    except UnsupportedBodyEncoding:
+        raise
+    except Exception as e:
+        logging.warning(f"❌ Could not decode request body: {str(e)}")
+        raise ValueError(f"Malformed request body: {str(e)}")
@@ -0,0 +1,193 @@
+# app/settings.py
+
+import json
+import os
+import sys
+import logging
+import threading
+import time
+from dataclasses import dataclass, field, fields
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+
+def get_config_path():
+    """Get the best-guess path to config.json for EXE and dev environments"""
+    if getattr(sys, 'frozen', False):
+        # When running from PyInstaller EXE, use the EXE's directory
+        base_path = os.path.dirname(sys.executable)
+    else:
+        # When running normally (script), use script location
+        base_path = os.path.dirname(os.path.abspath(__file__))
+
+    return os.path.join(base_path, "config.json")
+
+# SYNCANYWHERE_CONFIG points the server at another config file (benchmarks, local runs)
+CONFIG_PATH = os.environ.get("SYNCANYWHERE_CONFIG") or get_config_path()
+
+# How often (seconds) get_settings() stats the file to look for edits
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Immutable, typed view of config.json"""
+
+    dsn: Optional[str] = None
+    db_backend: str = "sqlanywhere"   # or "sqlite" for local runs / benchmarks
+    sqlite_path: str = ""
+    ip: str = "127.0.0.1"
+    all_ips: Tuple[str, ...] = ()
+    port: int = 8000
+    auto_start: bool = True
+    log_level: str = "INFO"
+
+    pool_min_size: int = 2
+    pool_max_size: int = 10
+    pool_max_lifetime: float = 1800
+    pool_idle_timeout: float = 300
+    pool_checkout_timeout: float = 30
+    db_executor_size: int = 0  # 0 = same as pool_max_size
+
+    stream_chunk_size: int = 2000   # rows per fetchmany() in streamed downloads
+    page_size_default: int = 5000   # rows per page for ?limit= / ?cursor= downloads
+    page_size_max: int = 50000
+
+    compression_enabled: bool = True
+    compression_min_size: int = 1024          # bytes; smaller bodies go out as-is
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    compression_zstd_level: int = 3
+    compression_offload_size: int = 262144    # compress on a worker thread above this
+
+    catalog_cache_enabled: bool = True
+    catalog_cache_ttl: float = 300
+    catalog_cache_max_mb: float = 256
+
+    sync_state_path: str = "sync_state.db"
+    delta_refresh_interval: float = 120   # max age (s) of the change scan behind ?since=
+
+    export_dir: str = "exports"   # prebuilt SQLite catalogs for device provisioning
+    export_keep: int = 2          # newest exports kept so interrupted downloads can resume
+    merkle_chunk_rows: int = 1000  # target rows per chunk of /data-download/hashes
+
+    upload_batch_size: int = 500   # rows per executemany() in /upload-orders
+    upload_max_lines: int = 20000  # order lines accepted per upload (0 = no limit)
+    upload_barcode_check: str = "flag"   # "off", "flag" or "reject" unknown barcodes
+    upload_coalesce: bool = True            # group commit across concurrent uploads
+    upload_coalesce_window_ms: float = 5
+    upload_coalesce_max_orders: int = 500
+    upload_journal: bool = False       # acknowledge uploads once journaled, apply in background
+    journal_dir: str = "journal"
+    journal_segment_mb: float = 16
+    journal_apply_interval: float = 1.0
+    journal_apply_batch: int = 50      # receipts per applier transaction
+    journal_applier: str = "service"   # "service" (SyncService) or "server"
+
+    network_refresh_interval: float = 300
+    network_change_check_interval: float = 5
+
+    # Raw file contents, read-only, for keys without a typed field
+    raw: MappingProxyType = field(default_factory=lambda: MappingProxyType({}), compare=False)
+    path: str = ""
+    mtime: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data, path="", mtime=0.0):
+        """Build settings from a parsed config dict, coercing known fields"""
+        values = {}
+        for f in fields(cls):
+            if f.name in ("raw", "path", "mtime") or f.name not in data:
+                continue
+            value = data[f.name]
+            if f.name == "all_ips":
+                value = tuple(value or ())
+            elif f.type is int:
+                value = int(value)
+            elif f.type is float:
+                value = float(value)
+            elif f.type is bool:
+                value = bool(value)
+            values[f.name] = value
+        return cls(raw=MappingProxyType(dict(data)), path=path, mtime=mtime, **values)
+
+    def get(self, key, default=None):
+        """dict-style access to any config key"""
+        return self.raw.get(key, default)
+
+
+_settings = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def load_settings(path=None):
+    """Read and parse config.json into a Settings object (no caching)"""
+    path = path or CONFIG_PATH
+    if not os.path.exists(path):
+        raise Exception(f"❌ Config file not found at: {path}")
+    mtime = os.stat(path).st_mtime
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return Settings.from_dict(data, path=path, mtime=mtime)
+
+
+def get_settings():
+    """Return the cached settings, reloading only when config.json changed on disk"""
+    global _settings, _last_check
+    now = time.monotonic()
+    current = _settings
+    if current is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return current
+
+    with _lock:
+        current = _settings
+        _last_check = now
+        try:
+            mtime = os.stat(CONFIG_PATH).st_mtime
+        except OSError:
+            mtime = None
+
+        if current is not None and (mtime is None or mtime == current.mtime):
+            # Unchanged, or the file vanished - keep serving what we have
+            return current
+
+        try:
+            _settings = load_settings(CONFIG_PATH)
+        except Exception as e:
+            if current is None:
+                logging.error(f"❌ Error loading config from {CONFIG_PATH}: {e}")
+                raise Exception(f"Config file error: {e}")
+            logging.error(f"❌ Config reload failed, keeping previous settings: {e}")
+            return current
+
+        if current is None:
+            logging.info(f"📋 Loaded config from {CONFIG_PATH}: DSN={_settings.dsn or 'NOT SET'}")
+        else:
+            logging.info(f"🔄 Reloaded config from {CONFIG_PATH} (file changed)")
+        return _settings
+
+
+def reload_settings():
+    """Re-read config.json now, regardless of its mtime"""
+    global _settings, _last_check
+    with _lock:
+        _settings = load_settings(CONFIG_PATH)
+        _last_check = time.monotonic()
+        return _settings
+
+
+def update_config_file(updates):
+    """Merge ``updates`` into config.json atomically and reload settings.
+
+    Only meant for startup/maintenance - never call this on a request path.
+    """
+    with _lock:
+        with open(CONFIG_PATH, 'r') as f:
+            data = json.load(f)
+        data.update(updates)
+        tmp_path = CONFIG_PATH + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, CONFIG_PATH)
+    return reload_settings()
@@ -0,0 +1,179 @@
+# app/sqlite_export.py
+# Prebuilt SQLite catalog files for provisioning new handhelds.
+#
+# Instead of downloading the JSON catalog and inserting every row on the
+# phone, a new device fetches one SQLite file that already holds master_data
+# and product_data with their indexes, and swaps it in. The file is built once
+# per catalog version (the delta-sync token), kept on disk and served as a
+# static file, so interrupted downloads resume with HTTP Range requests.
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from app.datasets import get_datasets
+from app.db_utils import get_db
+from app.settings import get_settings
+
+EXPORT_MEDIA_TYPE = "application/vnd.sqlite3"
+EXPORT_PREFIX = "catalog-"
+EXPORT_SUFFIX = ".sqlite"
+
+_TOKEN_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class ExportNotFound(Exception):
+    """Raised when a requested export version is no longer on disk"""
+
+
+def export_filename(token):
+    return f"{EXPORT_PREFIX}{token}{EXPORT_SUFFIX}"
+
+
+def write_export(path, token, datasets=None, chunk_size=5000):
+    """Copy ``datasets`` (default: all registered) from the ERP database into
+    a new SQLite file at ``path``.
+
+    Rows are streamed with fetchmany(); an index per key field is created
+    after the bulk insert, which is much cheaper than maintaining it row by
+    row. Returns per-dataset row counts.
+    """
+    datasets = datasets or get_datasets()
+    counts = {}
+    out = sqlite3.connect(path)
+    try:
+        out.execute("PRAGMA journal_mode=OFF")
+        out.execute("PRAGMA synchronous=OFF")
+        out.execute("CREATE TABLE sync_meta (name TEXT PRIMARY KEY, value TEXT)")
+        with get_db() as conn:
+            cursor = conn.cursor()
+            try:
+                for dataset in datasets:
+                    columns = ", ".join(dataset.fields)
+                    out.execute(f"CREATE TABLE {dataset.name} ({columns})")
+                    insert = (
+                        f"INSERT INTO {dataset.name} ({columns}) "
+                        f"VALUES ({', '.join('?' for _ in dataset.fields)})"
+                    )
+                    cursor.execute(dataset.query)
+                    count = 0
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        if not rows:
+                            break
+                        out.executemany(insert, rows)
+                        count += len(rows)
+                    counts[dataset.name] = count
+            finally:
+                cursor.close()
+
+        # Phones look rows up by their key fields (code, barcode, ...)
+        for dataset in datasets:
+            for field in dataset.key_fields:
+                out.execute(f"CREATE INDEX ix_{dataset.name}_{field} ON {dataset.name} ({field})")
+        out.executemany(
+            "INSERT INTO sync_meta (name, value) VALUES (?, ?)",
+            [("sync_token", token), ("created_at", time.strftime("%Y-%m-%dT%H:%M:%S"))],
+        )
+        out.commit()
+        # Standalone file: no WAL/journal next to it, compact pages
+        out.execute("VACUUM")
+    finally:
+        out.close()
+    return counts
+
+
+class ExportStore:
+    """Directory of catalog exports, one file per catalog version"""
+
+    def __init__(self, directory, keep=2):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path_for(self, token):
+        if not token or not _TOKEN_RE.match(token):
+            raise ExportNotFound(f"Invalid export version: {token!r}")
+        return os.path.join(self.directory, export_filename(token))
+
+    def existing(self, token):
+        """Path of an already built export, or raise ExportNotFound"""
+        path = self.path_for(token)
+        if not os.path.exists(path):
+            raise ExportNotFound(f"Export {token} is no longer available - download the current one")
+        return path
+
+    def get_or_build(self, token):
+        """Path of the export for ``token``, building it on first request
+        (blocking - call from the DB executor)"""
+        path = self.path_for(token)
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            if os.path.exists(path):
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            started = time.perf_counter()
+            try:
+                counts = write_export(tmp_path, token, chunk_size=get_settings().stream_chunk_size)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            # Only complete files ever appear under the final name
+            os.replace(tmp_path, path)
+            logging.info(
+                f"💾 Built SQLite export {os.path.basename(path)} in {time.perf_counter() - started:.2f}s: "
+                f"{os.path.getsize(path)} bytes, {counts}"
+            )
+            self.prune(keep_path=path)
+        return path
+
+    def prune(self, keep_path=None):
+        """Delete all but the ``keep`` newest exports"""
+        try:
+            names = [
+                name for name in os.listdir(self.directory)
+                if name.startswith(EXPORT_PREFIX) and name.endswith(EXPORT_SUFFIX)
+            ]
+        except FileNotFoundError:
+            return
+        paths = sorted(
+            (os.path.join(self.directory, name) for name in names),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for path in paths[max(1, self.keep):]:
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                logging.info(f"🧹 Removed old SQLite export {os.path.basename(path)}")
+            except OSError as e:
+                # Possibly still being served on Windows; retry on the next build
+                logging.warning(f"⚠️ Could not remove {path}: {str(e)}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_export_store():
+    """Process-wide ExportStore in ``export_dir`` (relative to config.json)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                settings = get_settings()
+                directory = settings.export_dir
+                if not os.path.isabs(directory) and settings.path:
+                    directory = os.path.join(os.path.dirname(settings.path), directory)
+                logging.info(f"🗂️ SQLite export directory: {directory}")
+                _store = ExportStore(directory, keep=settings.export_keep)
+    return _store
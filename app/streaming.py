@@ -0,0 +1,146 @@
+# app/streaming.py
+# NDJSON streaming for large downloads: rows go out in fetchmany() chunks so
+# server memory stays flat no matter how big the catalog is.
+
+import json
+import logging
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import anyio
+
+from app.db_utils import get_db, run_db
+from app.nesting import Nester
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+DEFAULT_CHUNK_SIZE = 2000
+
+_END = object()
+
+
+def json_default(value):
+    """json.dumps fallback for the types sqlanydb returns"""
+    if isinstance(value, Decimal):
+        # Same as FastAPI's encoder: whole numbers stay ints, so clients see
+        # identical JSON whichever download path served them
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=json_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_bytes(obj):
+    """Compact UTF-8 JSON, encoded the same way FastAPI's JSONResponse does"""
+    return _encoder.encode(obj).encode("utf-8")
+
+
+def ndjson_line(obj):
+    return (_encoder.encode(obj) + "\n").encode("utf-8")
+
+
+def wants_ndjson(request):
+    """True if the client asked for a streamed download"""
+    if request.query_params.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def iter_dataset_ndjson(datasets, chunk_size=DEFAULT_CHUNK_SIZE, nested=False):
+    """Blocking generator yielding NDJSON byte chunks for ``datasets``.
+
+    ``datasets`` is a sequence of ``Dataset`` entries. Output is one
+    ``start`` line, one ``row`` line per record and a closing ``end`` line
+    with per-dataset counts. One pooled connection is held for the stream.
+    With ``nested``, datasets that support it emit one line per parent
+    (their queries must already be ordered, see nesting.ordered_for_nesting).
+    """
+    counts = {}
+    started = time.perf_counter()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
+            # Run the first query before the start line goes out, so a broken
+            # query fails the request with a 500 instead of a truncated 200
+            first_rows = None
+            if datasets:
+                cursor.execute(datasets[0].query)
+                first_rows = cursor.fetchmany(chunk_size)
+            yield ndjson_line({
+                "type": "start",
+                "status": "success",
+                "datasets": [dataset.name for dataset in datasets],
+            })
+            try:
+                for i, dataset in enumerate(datasets):
+                    name, fields = dataset.name, dataset.fields
+                    if i:
+                        cursor.execute(dataset.query)
+                        rows = cursor.fetchmany(chunk_size)
+                    else:
+                        rows = first_rows
+                    nester = Nester(fields, dataset.nesting) if nested and dataset.nesting else None
+                    count = 0
+                    while rows:
+                        if nester is not None:
+                            records = nester.feed(rows)
+                        else:
+                            records = [dict(zip(fields, row)) for row in rows]
+                        count += len(records)
+                        yield b"".join(
+                            ndjson_line({"type": "row", "dataset": name, "data": record})
+                            for record in records
+                        )
+                        rows = cursor.fetchmany(chunk_size)
+                    if nester is not None:
+                        records = nester.finish()
+                        count += len(records)
+                        yield b"".join(
+                            ndjson_line({"type": "row", "dataset": name, "data": record})
+                            for record in records
+                        )
+                    counts[name] = count
+            except Exception as e:
+                # Headers are already out, so report the failure in-band
+                logging.error(f"❌ Streamed download failed: {str(e)}")
+                yield ndjson_line({"type": "error", "detail": f"Download failed: {str(e)}"})
+                return
+            yield ndjson_line({"type": "end", "counts": counts})
+        finally:
+            cursor.close()
+    logging.info(f"✅ Streamed download finished in {time.perf_counter() - started:.2f}s: {counts}")
+
+
+def _next_chunk(gen):
+    return next(gen, _END)
+
+
+async def prime_db_stream(gen):
+    """Pull the first chunk now so connection and first-query errors surface before headers are sent"""
+    try:
+        first = await run_db(_next_chunk, gen)
+    except BaseException:
+        gen.close()
+        raise
+    return first
+
+
+async def iterate_db_stream(gen, first=_END):
+    """Drive a blocking generator on the DB executor, one chunk at a time"""
+    try:
+        if first is not _END:
+            yield first
+        while True:
+            chunk = await run_db(_next_chunk, gen)
+            if chunk is _END:
+                break
+            yield chunk
+    finally:
+        # Client may have disconnected; still release the pooled connection
+        with anyio.CancelScope(shield=True):
+            await run_db(gen.close)
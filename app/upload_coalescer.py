@@ -0,0 +1,164 @@
+# app/upload_coalescer.py
+# Group commit for /upload-orders.
+#
+# At closing time many devices upload at once. Instead of one transaction
+# per request - each reserving numbers, taking locks and committing on its
+# own - requests that arrive within ``upload_coalesce_window_ms`` of each
+# other, or while the previous group is still being written, are written
+# together: one number reservation, one batched insert, one commit. Each
+# request then gets back only its own orders' results.
+#
+# Groups are written one at a time, so there is never more than one upload
+# transaction holding locks in the ERP database.
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from app.db_utils import run_db
+from app.orders import insert_orders
+from app.settings import get_settings
+
+
+def split_result(result, counts, batch):
+    """Per-request results out of one insert_orders() result for a group"""
+    results = []
+    start = 0
+    for count in counts:
+        own = result["results"][start:start + count]
+        start += count
+        written = [order for order in own if not order["duplicate"]]
+        results.append({
+            "orders": len(written),
+            "lines": sum(order["lines"] for order in written),
+            "duplicates": len(own) - len(written),
+            "results": own,
+            "timings_ms": result["timings_ms"],
+            "batch": batch,
+        })
+    return results
+
+
+def write_group(order_lists):
+    """Write a group of uploads in one transaction (blocking - runs on the DB
+    executor); falls back to one transaction per upload if that fails, so a
+    single bad upload only fails itself. Returns a result or an exception
+    per upload."""
+    counts = [len(orders) for orders in order_lists]
+    batch = {"requests": len(order_lists), "orders": sum(counts)}
+    if len(order_lists) > 1:
+        try:
+            result = insert_orders([order for orders in order_lists for order in orders])
+        except Exception as e:
+            logging.warning(f"⚠️ Group of {len(order_lists)} uploads failed ({str(e)}); writing them one by one")
+        else:
+            return split_result(result, counts, batch)
+
+    outcomes = []
+    for orders in order_lists:
+        try:
+            result = insert_orders(orders)
+        except Exception as e:
+            outcomes.append(e)
+        else:
+            outcomes.append(split_result(result, [len(orders)], {"requests": 1, "orders": len(orders)})[0])
+    return outcomes
+
+
+class UploadCoalescer:
+    """Collects concurrent uploads into groups written by a single writer task"""
+
+    def __init__(self):
+        self._queue = deque()       # (orders, future)
+        self._queued_orders = 0
+        self._full = asyncio.Event()
+        self._writer = None
+        self.groups = 0
+        self.requests = 0
+        self.orders = 0
+        self.largest_requests = 0
+        self.largest_orders = 0
+        self.recent = deque(maxlen=100)   # (requests, orders) of the latest groups
+
+    async def submit(self, orders):
+        """Queue one request's (validated) orders; returns its own result"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((orders, future))
+        self._queued_orders += len(orders)
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_groups())
+        elif self._queued_orders >= get_settings().upload_coalesce_max_orders:
+            self._full.set()
+        return await future
+
+    def _take_group(self, max_orders):
+        group = []
+        orders = 0
+        # At least one request, however big
+        while self._queue and (not group or orders + len(self._queue[0][0]) <= max_orders):
+            item = self._queue.popleft()
+            group.append(item)
+            orders += len(item[0])
+        self._queued_orders -= orders
+        return group
+
+    async def _write_groups(self):
+        while self._queue:
+            settings = get_settings()
+            window = settings.upload_coalesce_window_ms / 1000
+            if window > 0 and self._queued_orders < settings.upload_coalesce_max_orders:
+                # Give other devices' uploads a moment to join this group
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), window)
+                except asyncio.TimeoutError:
+                    pass
+
+            group = self._take_group(max(1, settings.upload_coalesce_max_orders))
+            started = time.perf_counter()
+            try:
+                outcomes = await run_db(write_group, [orders for orders, _ in group])
+            except Exception as e:
+                outcomes = [e] * len(group)
+
+            order_count = sum(len(orders) for orders, _ in group)
+            self._record(len(group), order_count)
+            logging.info(
+                f"📦 Group commit: {len(group)} uploads / {order_count} orders "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+            )
+            for (_, future), outcome in zip(group, outcomes):
+                # A client that gave up still gets its orders written; its
+                # retry is answered from the upload ledger
+                if future.cancelled():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    def _record(self, requests, orders):
+        self.groups += 1
+        self.requests += requests
+        self.orders += orders
+        self.largest_requests = max(self.largest_requests, requests)
+        self.largest_orders = max(self.largest_orders, orders)
+        self.recent.append((requests, orders))
+
+    def stats(self):
+        """Achieved group sizes, for monitoring"""
+        return {
+            "groups": self.groups,
+            "requests": self.requests,
+            "orders": self.orders,
+            "avg_requests_per_group": round(self.requests / self.groups, 2) if self.groups else 0,
+            "avg_orders_per_group": round(self.orders / self.groups, 2) if self.groups else 0,
+            "largest_group_requests": self.largest_requests,
+            "largest_group_orders": self.largest_orders,
+            "recent_groups": [{"requests": r, "orders": o} for r, o in self.recent],
+            "queued_requests": len(self._queue),
+        }
+
+
+upload_coalescer = UploadCoalescer()
@@ -0,0 +1,87 @@
+# app/upload_dedupe.py
+# Idempotent order uploads.
+#
+# Phones give every order a UUID (``order_uuid``) when it is created. The
+# numbers assigned to it are recorded in a table in the ERP database, in the
+# same transaction as the order rows themselves, so an order is either
+# written and recorded or neither. When an upload is retried after a timeout,
+# its orders are found by primary key and answered with their original
+# numbers - nothing is written twice.
+
+import logging
+import threading
+
+UPLOAD_TABLE = "syncanywhere_order_uploads"
+
+# Parameters per IN (...) lookup
+LOOKUP_CHUNK = 500
+
+
+class UploadLedger:
+    """Order UUID -> (slno, orderno) of every order already written"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def ensure_table(self, conn):
+        if self._table_ready:
+            return
+        with self._lock:
+            if self._table_ready:
+                return
+            cursor = conn.cursor()
+            try:
+                try:
+                    cursor.execute(f"SELECT COUNT(*) FROM {UPLOAD_TABLE}")
+                    cursor.fetchone()
+                except Exception:
+                    logging.info(f"🧾 Creating upload ledger table {UPLOAD_TABLE}")
+                    conn.rollback()
+                    cursor.execute(
+                        f"CREATE TABLE {UPLOAD_TABLE} ("
+                        "order_uuid VARCHAR(36) NOT NULL PRIMARY KEY, "
+                        "slno BIGINT NOT NULL, "
+                        "orderno BIGINT NOT NULL, "
+                        "line_count INTEGER NOT NULL, "
+                        "uploaded_at TIMESTAMP NOT NULL)"
+                    )
+                    conn.commit()
+            finally:
+                cursor.close()
+            self._table_ready = True
+
+    def lookup(self, conn, order_uuids):
+        """{order_uuid: (slno, orderno, lines)} for the UUIDs already recorded,
+        one primary-key lookup per chunk of UUIDs"""
+        self.ensure_table(conn)
+        order_uuids = list(order_uuids)
+        found = {}
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(order_uuids), LOOKUP_CHUNK):
+                chunk = order_uuids[start:start + LOOKUP_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(
+                    f"SELECT order_uuid, slno, orderno, line_count FROM {UPLOAD_TABLE} "
+                    f"WHERE order_uuid IN ({placeholders})",
+                    chunk,
+                )
+                for order_uuid, slno, orderno, lines in cursor.fetchall():
+                    found[order_uuid] = (int(slno), int(orderno), int(lines))
+        finally:
+            cursor.close()
+        return found
+
+    def record(self, cursor, rows, uploaded_at):
+        """Record ``(order_uuid, slno, orderno, lines)`` rows; call inside the
+        transaction that inserts the orders"""
+        if rows:
+            cursor.executemany(
+                f"INSERT INTO {UPLOAD_TABLE} (order_uuid, slno, orderno, line_count, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [row + (uploaded_at,) for row in rows],
+            )
+
+
+upload_ledger = UploadLedger()
@@ -0,0 +1,414 @@
+# app/upload_journal.py
+# Durable upload journal: acknowledge order uploads as soon as they are on
+# disk, write them into the ERP database in the background.
+#
+# With "upload_journal": true in config.json, /upload-orders validates the
+# upload, appends it to an append-only journal file (fsync'd, one CRC32 per
+# record) and answers with a receipt id. JournalApplier - run by SyncService,
+# or by the server itself with "journal_applier": "server" - drains the
+# journal into the database in batches and records each receipt's outcome,
+# which GET /upload-orders/{receipt_id} reports.
+#
+# Layout of ``journal_dir``:
+#   uploads-000001.journal ...  segments; the server only appends to the
+#                               newest, and starts a new one at startup
+#   receipts.db                 receipt statuses and the applier's position
+#
+# Record: b"SAJ1" | payload length (u32, big endian) | crc32 (u32) | JSON.
+# Every order gets an order_uuid before it is journaled (derived from the
+# receipt id if the phone sent none), so re-applying a record after a crash
+# is answered from the upload ledger (app/upload_dedupe.py) instead of
+# writing the orders twice.
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import namedtuple
+
+from app.orders import InvalidOrders, insert_orders
+from app.settings import get_settings
+
+RECORD_MAGIC = b"SAJ1"
+RECORD_HEADER = struct.Struct(">4sII")
+SEGMENT_PATTERN = re.compile(r"^uploads-(\d{6})\.journal$")
+RECEIPTS_FILE = "receipts.db"
+
+RECEIPT_PENDING = "pending"
+RECEIPT_APPLIED = "applied"
+RECEIPT_FAILED = "failed"
+
+CORRUPT_RECORD_ERROR = "Upload was damaged in the server's journal; please upload again"
+
+# Attempts before a receipt the database keeps refusing is marked failed
+MAX_APPLY_ATTEMPTS = 5
+
+# Payloads start with their receipt id (see UploadJournal.append), which is
+# how a record that fails its checksum still gets a "failed" receipt
+RECEIPT_ID_PREFIX = re.compile(rb'^\{"receipt_id":"([0-9a-f]{32})"')
+
+# ``end``: offset just past the record; ``payload`` is None for a corrupt
+# record, whose ``receipt_id`` is then salvaged if possible (else None)
+JournalRecord = namedtuple("JournalRecord", ["end", "payload", "receipt_id"])
+
+
+class UnknownReceipt(Exception):
+    """Raised for receipt ids the journal has never seen"""
+
+
+def segment_name(number):
+    return f"uploads-{number:06d}.journal"
+
+
+def list_segments(directory):
+    """Segment numbers present in ``directory``, oldest first"""
+    numbers = []
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+def encode_record(payload):
+    data = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    return RECORD_HEADER.pack(RECORD_MAGIC, len(data), zlib.crc32(data)) + data
+
+
+def read_records(path, offset=0, limit=None):
+    """Complete records of a segment from ``offset``, as JournalRecords.
+
+    A record that fails its checksum is returned with payload None. Reading
+    stops at a torn tail (a record still being written, or cut off by a
+    crash before it was acknowledged).
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    records = []
+    position = 0
+    while limit is None or len(records) < limit:
+        if len(data) - position < RECORD_HEADER.size:
+            break
+        magic, length, checksum = RECORD_HEADER.unpack_from(data, position)
+        start = position + RECORD_HEADER.size
+        if magic != RECORD_MAGIC or len(data) - start < length:
+            break
+        body = data[start:start + length]
+        position = start + length
+        payload = None
+        if zlib.crc32(body) == checksum:
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                pass
+        if payload is None:
+            logging.error(f"❌ Corrupt journal record at {path}:{offset + start - RECORD_HEADER.size}")
+            match = RECEIPT_ID_PREFIX.match(body)
+            receipt_id = match.group(1).decode("ascii") if match else None
+        else:
+            receipt_id = payload.get("receipt_id")
+        records.append(JournalRecord(offset + position, payload, receipt_id))
+    return records
+
+
+def assign_order_uuids(orders, receipt_id):
+    """Give every order without an order_uuid one derived from the receipt"""
+    namespace = uuid.UUID(receipt_id)
+    for index, order in enumerate(orders):
+        if isinstance(order, dict) and not order.get("order_uuid"):
+            order["order_uuid"] = str(uuid.uuid5(namespace, str(index)))
+    return orders
+
+
+def _connect_receipts(directory):
+    conn = sqlite3.connect(os.path.join(directory, RECEIPTS_FILE), timeout=30, check_same_thread=False)
+    # Written by SyncService, read by the server
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS receipts (
+            receipt_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            userid TEXT,
+            received_at TEXT,
+            applied_at TEXT,
+            orders INTEGER,
+            error TEXT,
+            results TEXT
+        );
+        CREATE TABLE IF NOT EXISTS applier_position (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            segment INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        );
+    """)
+    return conn
+
+
+class UploadJournal:
+    """Appending side, used by the server"""
+
+    def __init__(self, directory, segment_bytes):
+        self.directory = directory
+        self.segment_bytes = max(1, segment_bytes)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = None
+        # Receipts appended but possibly not applied yet; rebuilt from the
+        # segments still on disk (the applier deletes them once applied)
+        self._pending = set()
+        for number in list_segments(directory):
+            for record in read_records(os.path.join(directory, segment_name(number))):
+                if record.receipt_id:
+                    self._pending.add(record.receipt_id)
+        self._receipts = _connect_receipts(directory)
+        self._receipts_lock = threading.Lock()
+
+    def _roll(self):
+        """Start a new segment; earlier ones are never appended to again"""
+        if self._file is not None:
+            self._file.close()
+        numbers = list_segments(self.directory)
+        self._segment = (numbers[-1] if numbers else 0) + 1
+        path = os.path.join(self.directory, segment_name(self._segment))
+        self._file = open(path, "ab")
+        logging.info(f"📓 Upload journal segment {path}")
+
+    def append(self, userid, orders):
+        """Journal an upload durably and return its receipt id (blocking)"""
+        receipt_id = uuid.uuid4().hex
+        record = encode_record({
+            "receipt_id": receipt_id,
+            "userid": userid,
+            "received_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "orders": assign_order_uuids(orders, receipt_id),
+        })
+        with self._lock:
+            # Always a fresh segment after startup: an older one may end in a
+            # torn record, and nothing may be appended behind it
+            if self._file is None or self._file.tell() + len(record) > self.segment_bytes and self._file.tell():
+                self._roll()
+            self._file.write(record)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._pending.add(receipt_id)
+        return receipt_id
+
+    def status(self, receipt_id):
+        """Status dict for a receipt; raises UnknownReceipt"""
+        with self._receipts_lock:
+            row = self._receipts.execute(
+                "SELECT status, received_at, applied_at, orders, error, results FROM receipts WHERE receipt_id = ?",
+                (receipt_id,),
+            ).fetchone()
+        if row is not None:
+            status, received_at, applied_at, orders, error, results = row
+            self._pending.discard(receipt_id)
+            return {
+                "receipt_id": receipt_id,
+                "status": status,
+                "received_at": received_at,
+                "applied_at": applied_at,
+                "orders": orders,
+                "error": error,
+                "results": json.loads(results) if results else None,
+            }
+        if receipt_id in self._pending:
+            return {"receipt_id": receipt_id, "status": RECEIPT_PENDING}
+        raise UnknownReceipt(f"Unknown receipt {receipt_id!r}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class JournalApplier:
+    """Draining side: writes journaled uploads into the database"""
+
+    def __init__(self, directory, batch_receipts=50):
+        self.directory = directory
+        self.batch_receipts = max(1, batch_receipts)
+        os.makedirs(directory, exist_ok=True)
+        self._receipts = _connect_receipts(directory)
+        self._attempts = {}
+
+    def _position(self):
+        row = self._receipts.execute("SELECT segment, offset FROM applier_position WHERE id = 1").fetchone()
+        return row if row else (None, 0)
+
+    def _save(self, segment, offset, outcomes):
+        """Record receipt outcomes and the new position in one transaction"""
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._receipts:
+            self._receipts.executemany(
+                "INSERT OR REPLACE INTO receipts "
+                "(receipt_id, status, userid, received_at, applied_at, orders, error, results) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (payload["receipt_id"], status, payload.get("userid"), payload.get("received_at"),
+                     now, len(payload.get("orders") or ()), error,
+                     json.dumps(results) if results is not None else None)
+                    for payload, status, error, results in outcomes
+                ],
+            )
+            self._receipts.execute(
+                "INSERT OR REPLACE INTO applier_position (id, segment, offset) VALUES (1, ?, ?)",
+                (segment, offset),
+            )
+
+    def _apply_one(self, payload):
+        """(status, error, results) for one receipt applied on its own"""
+        receipt_id = payload["receipt_id"]
+        try:
+            # Checked against upload_max_lines when it was journaled
+            result = insert_orders(payload.get("orders") or [], check_limit=False)
+        except InvalidOrders as e:
+            return RECEIPT_FAILED, str(e), None
+        except Exception as e:
+            attempts = self._attempts.get(receipt_id, 0) + 1
+            self._attempts[receipt_id] = attempts
+            if attempts < MAX_APPLY_ATTEMPTS:
+                # Database busy or down: keep the receipt and try again later
+                raise
+            logging.error(f"❌ Giving up on receipt {receipt_id} after {attempts} attempts: {str(e)}")
+            return RECEIPT_FAILED, str(e), None
+        self._attempts.pop(receipt_id, None)
+        return RECEIPT_APPLIED, None, result["results"]
+
+    def _apply_batch(self, payloads):
+        """Outcomes for a batch: one insert_orders() call for all of it, or
+        receipt by receipt if that fails (to isolate the bad one)"""
+        orders = []
+        for payload in payloads:
+            orders.extend(payload.get("orders") or [])
+        if len(payloads) > 1:
+            try:
+                # Each upload was checked against upload_max_lines on its own
+                results = insert_orders(orders, check_limit=False)["results"]
+            except Exception as e:
+                logging.warning(f"⚠️ Batch of {len(payloads)} receipts failed ({str(e)}); applying one by one")
+            else:
+                outcomes = []
+                start = 0
+                for payload in payloads:
+                    count = len(payload.get("orders") or [])
+                    outcomes.append((payload, RECEIPT_APPLIED, None, results[start:start + count]))
+                    start += count
+                return outcomes
+        return [(payload, *self._apply_one(payload)) for payload in payloads]
+
+    def apply_pending(self):
+        """Apply everything journaled so far; returns the number of receipts
+        handled (blocking)"""
+        handled = 0
+        while True:
+            segments = list_segments(self.directory)
+            if not segments:
+                return handled
+            segment, offset = self._position()
+            if segment not in segments:
+                # First run, or the saved segment was finished and removed
+                later = [n for n in segments if segment is None or n > segment]
+                segment, offset = (later or segments)[0], 0
+            for finished in segments:
+                if finished < segment:
+                    # Left behind by a crash between saving and removing
+                    os.remove(os.path.join(self.directory, segment_name(finished)))
+
+            path = os.path.join(self.directory, segment_name(segment))
+            records = read_records(path, offset, limit=self.batch_receipts)
+            if not records:
+                later = [n for n in segments if n > segment]
+                if not later:
+                    return handled
+                # The server has moved on to a newer segment: this one is done
+                self._save(later[0], 0, [])
+                os.remove(path)
+                logging.info(f"🧹 Removed applied journal segment {path}")
+                continue
+
+            payloads = [record.payload for record in records if record.payload]
+            started = time.perf_counter()
+            outcomes = self._apply_batch(payloads) if payloads else []
+            outcomes.extend(
+                ({"receipt_id": record.receipt_id}, RECEIPT_FAILED, CORRUPT_RECORD_ERROR, None)
+                for record in records
+                if record.payload is None and record.receipt_id
+            )
+            self._save(segment, records[-1].end, outcomes)
+            handled += len(outcomes)
+            failed = sum(1 for outcome in outcomes if outcome[1] == RECEIPT_FAILED)
+            logging.info(
+                f"📥 Applied {len(outcomes) - failed} journaled uploads ({failed} failed) "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+
+    def close(self):
+        self._receipts.close()
+
+
+def journal_directory(settings=None):
+    """``journal_dir`` resolved relative to config.json"""
+    settings = settings or get_settings()
+    directory = settings.journal_dir
+    if not os.path.isabs(directory) and settings.path:
+        directory = os.path.join(os.path.dirname(settings.path), directory)
+    return directory
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_upload_journal():
+    """Process-wide UploadJournal in ``journal_dir``"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                settings = get_settings()
+                directory = journal_directory(settings)
+                logging.info(f"🗂️ Upload journal directory: {directory}")
+                _journal = UploadJournal(directory, int(settings.journal_segment_mb * 1024 * 1024))
+    return _journal
+
+
+class ApplierThread:
+    """Runs a JournalApplier every ``journal_apply_interval`` seconds"""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        settings = get_settings()
+        applier = JournalApplier(journal_directory(settings), settings.journal_apply_batch)
+        try:
+            while not self._stop.is_set():
+                try:
+                    applier.apply_pending()
+                except Exception as e:
+                    logging.error(f"❌ Applying the upload journal failed: {str(e)}")
+                self._stop.wait(get_settings().journal_apply_interval)
+        finally:
+            applier.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="journal-applier", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
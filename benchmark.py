@@ -0,0 +1,153 @@
+# benchmark.py - Load/profile the sync endpoints against a seeded SQLite stand-in
+#
+#   python benchmark.py --batches 200000 --runs 5
+#   python benchmark.py --batches 50000 --profile
+#
+# No SQL Anywhere licence needed: the server is pointed at a temporary config
+# with "db_backend": "sqlite" and a database seeded by app.db_backends.
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_environment(workdir, batches):
+    """Seed a SQLite database and point the app at it via SYNCANYWHERE_CONFIG"""
+    from app.db_backends import SQLiteBackend
+
+    db_path = os.path.join(workdir, "bench.db")
+    started = time.perf_counter()
+    counts = SQLiteBackend(db_path).seed(batches=batches)
+    print(f"🌱 Seeded {counts} in {time.perf_counter() - started:.1f}s")
+
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({
+            "port": 8000,
+            "db_backend": "sqlite",
+            "sqlite_path": db_path,
+            "pool_min_size": 2,
+            "pool_max_size": 4,
+        }, f, indent=2)
+    os.environ["SYNCANYWHERE_CONFIG"] = config_path
+
+
+def timed(label, func, runs):
+    """Call ``func`` ``runs`` times and print latency stats; returns the last result"""
+    samples = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"⏱️  {label:<32} median {statistics.median(samples):9.1f}ms"
+          f"   min {min(samples):9.1f}ms   max {max(samples):9.1f}ms")
+    return result
+
+
+def run_benchmarks(client, runs):
+    login = client.post("/login", json={"userid": "user1", "password": "pass1"})
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+    timed("POST /login", lambda: client.post("/login", json={"userid": "user1", "password": "pass1"}), runs)
+
+    response = timed("GET /data-download", lambda: client.get("/data-download", headers=headers), runs)
+    print(f"   📦 body size: {len(response.content) / 1024 / 1024:.2f} MB")
+
+    upload = {
+        "orders": [
+            {
+                "supplier_code": "M000001",
+                "userid": "user1",
+                "order_date": "2026-01-01",
+                "products": [
+                    {"barcode": str(8900000000000 + line), "quantity": 2, "rate": 10.5, "mrp": 12.0}
+                    for line in range(80)
+                ],
+            }
+            for _ in range(40)
+        ]
+    }
+    timed("POST /upload-orders (40x80)", lambda: client.post("/upload-orders", json=upload, headers=headers), runs)
+
+    benchmark_encodings(client, headers, upload, runs)
+    benchmark_validation(upload, runs)
+
+
+def benchmark_validation(upload, runs):
+    """Cost of validating an upload against the order schemas, per 1k lines"""
+    from app.orders import validate_upload
+
+    lines = sum(len(order["products"]) for order in upload["orders"])
+    samples = []
+    for _ in range(max(runs, 20)):
+        started = time.perf_counter()
+        validate_upload(upload)
+        samples.append((time.perf_counter() - started) * 1000)
+    median = statistics.median(samples)
+    print(f"⏱️  {'validate upload (' + str(lines) + ' lines)':<32} median {median:9.2f}ms"
+          f"   per 1k lines {median * 1000 / lines:7.3f}ms")
+
+
+def benchmark_encodings(client, headers, upload, runs):
+    """Compare JSON / MessagePack / CBOR bodies: size, encode and decode cost"""
+    from app.routes.sync import build_download_payload
+    from app.serialization import MEDIA_TYPES, available_body_encodings, decode_body, encode_body
+
+    payload = build_download_payload()
+    for encoding in available_body_encodings():
+        media_type = MEDIA_TYPES[encoding]
+        body = timed(f"encode download ({encoding})", lambda: encode_body(payload, encoding), runs)
+        timed(f"decode download ({encoding})", lambda: decode_body(body, media_type), runs)
+        print(f"   📦 {encoding} body size: {len(body) / 1024 / 1024:.2f} MB")
+        timed(
+            f"GET /data-download ({encoding})",
+            lambda: client.get("/data-download", headers={**headers, "Accept": media_type}),
+            runs,
+        )
+        upload_body = encode_body(upload, encoding)
+        timed(
+            f"POST /upload-orders ({encoding})",
+            lambda: client.post(
+                "/upload-orders", content=upload_body,
+                headers={**headers, "Content-Type": media_type, "Accept": media_type},
+            ),
+            runs,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SyncAnywhere endpoints on SQLite")
+    parser.add_argument("--batches", type=int, default=100000, help="acc_productbatch rows to seed")
+    parser.add_argument("--runs", type=int, default=5, help="repetitions per endpoint")
+    parser.add_argument("--profile", action="store_true", help="print a cProfile summary")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_environment(workdir, args.batches)
+
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        profiler = cProfile.Profile() if args.profile else None
+        with TestClient(app) as client:
+            if profiler:
+                profiler.enable()
+            run_benchmarks(client, args.runs)
+            if profiler:
+                profiler.disable()
+
+        if profiler:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+
+if __name__ == "__main__":
+    main()
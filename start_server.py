@@ -10,7 +10,7 @@ import time
 import socket
 import platform
 import ctypes
-from app.db_utils import get_all_local_ips, get_best_local_ip
+from app.network_utils import get_all_local_ips, get_best_local_ip
 
 APP_PORT = 8000
 APP_NAME = "SyncAnywhere"
@@ -209,103 +209,14 @@ def setup_startup_logging():
 
 def get_comprehensive_ip_list():
     """Get ALL possible IP addresses this machine can be reached at"""
-    ips = []
     logger = logging.getLogger(__name__)
     
     logger.info("🔍 Detecting all available network interfaces...")
     
-    # Method 1: Windows ipconfig
-    if platform.system() == "Windows":
-        try:
-            result = subprocess.run(['ipconfig'], capture_output=True, text=True, timeout=10)
-            lines = result.stdout.split('\n')
-            for line in lines:
-                line = line.strip()
-                if 'IPv4 Address' in line and ':' in line:
-                    ip = line.split(':')[1].strip()
-                    if not ip.startswith('127.') and not ip.startswith('169.254.') and ip not in ips:
-                        ips.append(ip)
-                        logger.info(f"   📡 Found via ipconfig: {ip}")
-        except Exception as e:
-            logger.warning(f"⚠️ ipconfig method failed: {e}")
-    
-    # Method 2: Linux/Mac ifconfig
-    elif platform.system() in ["Linux", "Darwin"]:
-        try:
-            result = subprocess.run(['ifconfig'], capture_output=True, text=True, timeout=10)
-            lines = result.stdout.split('\n')
-            for line in lines:
-                if 'inet ' in line and 'netmask' in line:
-                    parts = line.strip().split()
-                    if len(parts) >= 2:
-                        ip = parts[1]
-                        if not ip.startswith('127.') and not ip.startswith('169.254.') and ip not in ips:
-                            ips.append(ip)
-                            logger.info(f"   📡 Found via ifconfig: {ip}")
-        except Exception as e:
-            logger.warning(f"⚠️ ifconfig method failed: {e}")
-    
-    # Method 3: Use existing function from db_utils
-    try:
-        existing_ips = get_all_local_ips()
-        for ip in existing_ips:
-            if ip not in ips:
-                ips.append(ip)
-                logger.info(f"   📡 Found via db_utils: {ip}")
-    except Exception as e:
-        logger.warning(f"⚠️ db_utils method failed: {e}")
-    
-    # Method 4: Socket connection method
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            s.connect(("8.8.8.8", 80))
-            primary_ip = s.getsockname()[0]
-            if primary_ip not in ips and not primary_ip.startswith('127.'):
-                ips.append(primary_ip)
-                logger.info(f"   📡 Found via socket: {primary_ip}")
-    except Exception as e:
-        logger.warning(f"⚠️ socket method failed: {e}")
-    
-    # Method 5: Hostname method
-    try:
-        hostname = socket.gethostname()
-        host_ip = socket.gethostbyname(hostname)
-        if host_ip not in ips and not host_ip.startswith('127.'):
-            ips.append(host_ip)
-            logger.info(f"   📡 Found via hostname: {host_ip}")
-    except Exception as e:
-        logger.warning(f"⚠️ hostname method failed: {e}")
-    
-    # Method 6: Try to get all local addresses using socket
-    try:
-        hostname = socket.gethostname()
-        for info in socket.getaddrinfo(hostname, None):
-            ip = info[4][0]
-            if not ip.startswith('127.') and not ip.startswith('::') and ip not in ips:
-                ips.append(ip)
-                logger.info(f"   📡 Found via getaddrinfo: {ip}")
-    except Exception as e:
-        logger.warning(f"⚠️ getaddrinfo method failed: {e}")
-    
-    # Remove any duplicates and sort
-    ips = list(set(ips))
-    
-    # Sort IPs prioritizing common ranges
-    def ip_priority(ip):
-        if ip.startswith('192.168.1.'):
-            return 1
-        elif ip.startswith('192.168.0.'):
-            return 2  
-        elif ip.startswith('192.168.'):
-            return 3
-        elif ip.startswith('10.'):
-            return 4
-        elif ip.startswith('172.'):
-            return 5
-        else:
-            return 6
-    
-    ips.sort(key=ip_priority)
+    # Probes run once (concurrently) and are cached for every later caller
+    ips = get_all_local_ips()
+    for ip in ips:
+        logger.info(f"   📡 Found: {ip}")
     
     logger.info(f"✅ Total IPs found: {len(ips)}")
     return ips
@@ -0,0 +1,88 @@
+# tests/conftest.py
+# Every test runs against a small seeded SQLite database (app/db_backends.py)
+# through a throwaway config.json, so no SQL Anywhere server is needed.
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="syncanywhere-tests-")
+TEST_DB = os.path.join(TEST_DIR, "erp.db")
+TEST_CONFIG = os.path.join(TEST_DIR, "config.json")
+
+with open(TEST_CONFIG, "w") as f:
+    json.dump({
+        "db_backend": "sqlite",
+        "sqlite_path": TEST_DB,
+        "pool_min_size": 1,
+        "pool_max_size": 2,
+        "sync_state_path": os.path.join(TEST_DIR, "sync_state.db"),
+        "journal_dir": os.path.join(TEST_DIR, "journal"),
+    }, f)
+os.environ["SYNCANYWHERE_CONFIG"] = TEST_CONFIG
+
+# app.db_utils calls basicConfig(filename="app.log") on import; a handler on
+# the root logger turns that into a no-op instead of a file in the checkout
+logging.getLogger().addHandler(logging.NullHandler())
+
+from app.datasets import PRODUCT_DATASET, get_dataset  # noqa: E402
+from app.db_backends import SQLiteBackend  # noqa: E402
+from app.delta_sync import ChangeTracker  # noqa: E402
+
+SQLiteBackend(TEST_DB).seed(batches=60, masters=5, users=1)
+
+
+@pytest.fixture
+def erp_db():
+    """Connection to the seeded test database (rolled back afterwards)"""
+    conn = sqlite3.connect(TEST_DB, timeout=30)
+    yield conn
+    conn.rollback()
+    conn.close()
+
+
+@pytest.fixture
+def hash_product(erp_db):
+    """Code of a product whose code contains "#" (row keys are JSON, and a
+    "#" must survive them); removed again afterwards"""
+    code = "A#1"
+    erp_db.execute("INSERT INTO acc_product (code, name) VALUES (?, 'HASH PRODUCT')", (code,))
+    erp_db.commit()
+    yield code
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ?", (code,))
+    erp_db.execute("DELETE FROM acc_product WHERE code = ?", (code,))
+    erp_db.commit()
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    """ChangeTracker over the products dataset, after its first scan"""
+    tracker = ChangeTracker(str(tmp_path / "sync_state.db"), (get_dataset(PRODUCT_DATASET),))
+    tracker.refresh()
+    return tracker
+
+
+def add_batch(conn, code, barcode, price=10):
+    conn.execute(
+        "INSERT INTO acc_productbatch (productcode, barcode, quantity, salesprice, bmrp, cost) "
+        "VALUES (?, ?, 1, ?, 12, 8)",
+        (code, barcode, price),
+    )
+    conn.commit()
+
+
+@pytest.fixture
+def batches(erp_db):
+    """``add(code, barcode, price=10)`` inserting a committed batch row"""
+    return lambda code, barcode, price=10: add_batch(erp_db, code, barcode, price)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    from app.db_utils import close_pool
+    close_pool()
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
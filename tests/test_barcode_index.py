@@ -0,0 +1,82 @@
+# tests/test_barcode_index.py
+from app.barcode_index import BarcodeCatalog, BarcodeIndex
+
+
+def barcode(i):
+    return f"89{i:011d}"
+
+
+def test_upsert_get_and_update():
+    index = BarcodeIndex()
+    index.upsert("8901", "P1", 10.5, None)
+    assert index.get("8901") == ("P1", 10.5, None)
+    assert "8902" not in index
+
+    index.upsert("8901", "P2", 11, 12)
+    assert index.get("8901") == ("P2", 11.0, 12.0)
+    assert len(index) == 1
+
+
+def test_growth_keeps_every_entry():
+    index = BarcodeIndex(capacity=4)
+    slots = len(index._slots)
+    for i in range(5000):
+        index.upsert(barcode(i), f"P{i % 7}", i, None)
+    assert len(index._slots) > slots
+    assert len(index) == 5000
+    assert all(index.get(barcode(i)) == (f"P{i % 7}", float(i), None) for i in range(5000))
+    assert index.unknown([barcode(1), "nope", barcode(4999)]) == ["nope"]
+
+
+def test_remove_checks_owner():
+    index = BarcodeIndex()
+    index.upsert("8901", "P2")
+    # A late delete of the barcode's old product must not drop it
+    index.remove("8901", "P1")
+    assert index.get("8901") == ("P2", None, None)
+    index.remove("8901", "P2")
+    assert index.get("8901") is None
+    assert (len(index), index.deleted) == (0, 1)
+
+    # Coming back reuses the entry
+    index.upsert("8901", "P3")
+    assert index.get("8901") == ("P3", None, None)
+    assert (len(index), index.deleted) == (1, 0)
+
+
+def test_rehash_compacts_deleted_entries():
+    index = BarcodeIndex(capacity=4)
+    for i in range(1000):
+        index.upsert(barcode(i), "P", i, i + 1)
+    for i in range(1000):
+        if i % 10:
+            index.remove(barcode(i))
+    assert (len(index), index.deleted) == (100, 900)
+    blob = len(index._blob)
+
+    # Inserting until the table is full again triggers the rehash
+    i = 1000
+    while index.deleted:
+        index.upsert(barcode(i), "Q")
+        i += 1
+
+    assert len(index._codes) == len(index)
+    assert len(index._blob) < blob
+    assert all(index.get(barcode(j)) == ("P", float(j), float(j + 1)) for j in range(0, 1000, 10))
+    assert all(index.get(barcode(j)) is None for j in range(1000) if j % 10)
+    assert all(index.get(barcode(j)) == ("Q", None, None) for j in range(1000, i))
+
+
+def test_catalog_follows_tracker_changes(hash_product, tracker, batches, erp_db):
+    catalog = BarcodeCatalog()
+    catalog.index = BarcodeIndex()
+    tracker.add_listener(catalog.on_changes)
+
+    batches(hash_product, "HASH-1", price=10)
+    tracker.refresh()
+    assert catalog.index.get("HASH-1") == (hash_product, 8.0, 12.0)
+
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ?", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+    assert catalog.index.get("HASH-1") is None
@@ -0,0 +1,85 @@
+# tests/test_delta_sync.py
+import pytest
+
+from app.datasets import PRODUCT_DATASET
+from app.delta_sync import InvalidSyncToken, decode_token, encode_token
+
+
+def changes(tracker, token):
+    return tracker.changes_since(token, [PRODUCT_DATASET])["datasets"][PRODUCT_DATASET]
+
+
+def test_token_round_trip():
+    assert decode_token(encode_token("abc123", 7)) == ("abc123", 7)
+    with pytest.raises(InvalidSyncToken):
+        decode_token("garbage")
+
+
+def test_insert_update_delete(hash_product, tracker, batches, erp_db):
+    token = tracker.current_token()
+    assert tracker.refresh() == decode_token(token)[1]   # nothing changed, no new version
+
+    batches(hash_product, "HASH-1")
+    tracker.refresh()
+    delta = changes(tracker, token)
+    assert {(row["code"], row["barcode"]) for row in delta["upserts"]} == {(hash_product, "HASH-1")}
+    # Its batchless row (LEFT JOIN, NULL barcode) is gone now
+    assert delta["deletes"] == [{"code": hash_product, "barcode": None}]
+
+    token = tracker.current_token()
+    erp_db.execute("UPDATE acc_productbatch SET salesprice = 11 WHERE productcode = ?", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+    assert [row["salesprice"] for row in changes(tracker, token)["upserts"]] == [11]
+
+    token = tracker.current_token()
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ?", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+    delta = changes(tracker, token)
+    assert delta["deletes"] == [{"code": hash_product, "barcode": "HASH-1"}]
+    # The product itself is still there, without batches
+    assert delta["upserts"] == [{
+        "code": hash_product, "name": "HASH PRODUCT", "barcode": None,
+        "quantity": None, "salesprice": None, "bmrp": None, "cost": None,
+    }]
+
+
+def test_duplicate_rows_share_a_key(hash_product, tracker, batches, erp_db):
+    batches(hash_product, "HASH-1")
+    tracker.refresh()
+
+    token = tracker.current_token()
+    batches(hash_product, "HASH-1", price=20)
+    tracker.refresh()
+    delta = changes(tracker, token)
+    assert sorted(row["salesprice"] for row in delta["upserts"]) == [10, 20]
+    assert delta["deletes"] == []
+
+    # One of the two goes away: the key is re-sent with the row that is left
+    token = tracker.current_token()
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ? AND salesprice = 20", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+    delta = changes(tracker, token)
+    assert [row["salesprice"] for row in delta["upserts"]] == [10]
+    assert delta["deletes"] == []
+
+
+def test_token_from_another_epoch_resets(tracker):
+    result = tracker.changes_since(encode_token("other", 1), [PRODUCT_DATASET])
+    assert result["reset"]
+    assert result["datasets"][PRODUCT_DATASET]["deletes"] == []
+    assert len(result["datasets"][PRODUCT_DATASET]["upserts"]) == len(tracker.row_hashes(PRODUCT_DATASET)[1])
+
+
+def test_listeners_get_row_keys(hash_product, tracker, batches, erp_db):
+    seen = []
+    tracker.add_listener(lambda version, summary: seen.append(summary[PRODUCT_DATASET]))
+    batches(hash_product, "HASH-1")
+    tracker.refresh()
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ?", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+    assert [key for key, _ in seen[0]["upserted"]] == [f'["{hash_product}","HASH-1"]']
+    assert seen[1]["deleted"] == [f'["{hash_product}","HASH-1"]']
@@ -0,0 +1,72 @@
+# tests/test_merkle.py
+from app.datasets import PRODUCT_DATASET
+from app.merkle import HASH_MASK, HashTree, build_levels, leaf_hash, row_code
+
+
+def tree_for(tracker, chunk_rows=10):
+    tree = HashTree(tracker, PRODUCT_DATASET, chunk_rows)
+    tracker.add_listener(tree.on_changes)
+    return tree
+
+
+def test_build_levels_carries_odd_node():
+    levels = build_levels(["a", "b", "c"])
+    assert len(levels) == 3
+    assert levels[1][1] == "c"
+    assert levels[-1] == [build_levels(levels[1])[-1][0]]
+
+
+def test_chunks_match_client_side_hashes(tracker):
+    tree = tree_for(tracker)
+    snapshot = tree.snapshot()
+    _, hashes = tracker.row_hashes(PRODUCT_DATASET)
+    assert sum(chunk["rows"] for chunk in snapshot["chunks"]) == len(hashes)
+
+    for chunk in snapshot["chunks"]:
+        keys = [
+            key for key in hashes
+            if (chunk["code_from"] is None or row_code(key) >= chunk["code_from"])
+            and (chunk["code_to"] is None or row_code(key) < chunk["code_to"])
+        ]
+        total = sum(int(hashes[key], 16) for key in keys) & HASH_MASK
+        assert chunk["hash"] == leaf_hash(len(keys), total)
+
+
+def test_boundaries_follow_the_database_order(tracker):
+    tree = HashTree(tracker, PRODUCT_DATASET, chunk_rows=1)
+    _, hashes = tracker.row_hashes(PRODUCT_DATASET)
+    codes = sorted({row_code(key) for key in hashes}, reverse=True)
+    tree._partition(hashes, codes)
+    # Chunk 0 starts at the database's first code, whatever Python thinks
+    assert tree.starts == codes[1:]
+
+
+def test_incremental_updates_match_a_rebuild(hash_product, tracker, batches, erp_db):
+    tree = tree_for(tracker)
+    tree.snapshot()
+    layout = tree.layout
+
+    erp_db.execute("UPDATE acc_productbatch SET salesprice = salesprice + 1 WHERE rowid = 3")
+    erp_db.commit()
+    tracker.refresh()
+    assert tree.layout == layout
+
+    fresh = HashTree(tracker, PRODUCT_DATASET, 10)
+    fresh.ensure_built()
+    assert (tree.counts, tree.sums) == (fresh.counts, fresh.sums)
+
+
+def test_code_with_hash_sign(hash_product, tracker, batches, erp_db):
+    tree = tree_for(tracker)
+    before = tree.snapshot()
+    assert before["chunks"][0]["code_from"] is None
+
+    batches(hash_product, "HASH-1")
+    tracker.refresh()
+    erp_db.execute("DELETE FROM acc_productbatch WHERE productcode = ?", (hash_product,))
+    erp_db.commit()
+    tracker.refresh()
+
+    after = tree.snapshot()
+    fresh = HashTree(tracker, PRODUCT_DATASET, 10)
+    assert after["root"] == fresh.snapshot()["root"]
@@ -0,0 +1,32 @@
+# tests/test_orders.py
+import dataclasses
+from decimal import Decimal
+
+from app import orders as orders_module
+from app.orders import insert_orders
+
+
+def test_lines_are_written_in_batches(monkeypatch, erp_db):
+    settings = dataclasses.replace(orders_module.get_settings(), upload_batch_size=2)
+    monkeypatch.setattr(orders_module, "get_settings", lambda: settings)
+    orders = [
+        {"supplier_code": "M000001", "products": [
+            {"barcode": f"89000000000{i}{j}", "quantity": j + 1, "rate": "10.50"} for j in range(3)
+        ]}
+        for i in range(2)
+    ]
+
+    result = insert_orders(orders)
+    assert (result["orders"], result["lines"]) == (2, 6)
+    erp_db.rollback()
+    for order, written in zip(orders, result["results"]):
+        lines = erp_db.execute(
+            "SELECT slno, barcode, qty, rate FROM acc_purchaseorderdetails WHERE masterslno = ? ORDER BY slno",
+            (written["slno"],),
+        ).fetchall()
+        assert [(barcode, Decimal(str(qty)), Decimal(str(rate))) for _, barcode, qty, rate in lines] == [
+            (line["barcode"], Decimal(line["quantity"]), Decimal("10.50")) for line in order["products"]
+        ]
+        # Line numbers stay consecutive across executemany() batches
+        assert [slno for slno, *_ in lines] == list(range(lines[0][0], lines[0][0] + 3))
+    assert result["results"][1]["slno"] == result["results"][0]["slno"] + 1
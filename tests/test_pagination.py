@@ -0,0 +1,90 @@
+# tests/test_pagination.py
+from collections import Counter
+
+import pytest
+
+from app.datasets import PRODUCT_DATASET, PRODUCT_ORDER, get_dataset, validate_dataset
+from app.pagination import (
+    InvalidCursor, decode_cursor, encode_cursor, fetch_page, keyset_condition, keyset_params,
+)
+
+
+@pytest.fixture
+def products():
+    return get_dataset(PRODUCT_DATASET)
+
+
+@pytest.fixture
+def duplicate_batch(erp_db):
+    """A second, identical batch row for the first product"""
+    code = erp_db.execute("SELECT MIN(productcode) FROM acc_productbatch").fetchone()[0]
+    erp_db.execute(
+        "INSERT INTO acc_productbatch SELECT * FROM acc_productbatch WHERE rowid = "
+        "(SELECT MIN(rowid) FROM acc_productbatch WHERE productcode = ?)",
+        (code,),
+    )
+    erp_db.commit()
+    yield code
+    erp_db.execute("DELETE FROM acc_productbatch WHERE rowid = (SELECT MAX(rowid) FROM acc_productbatch)")
+    erp_db.commit()
+
+
+def download_all(dataset, limit, **bounds):
+    rows, pages, cursor = [], [], None
+    while True:
+        page, cursor = fetch_page(dataset, cursor, limit=limit, **bounds)
+        rows.extend(page)
+        pages.append(page)
+        if cursor is None:
+            return rows, pages
+
+
+def test_cursor_round_trip(products):
+    cursor = encode_cursor(("P0000003",), "P0000010", products.name)
+    assert decode_cursor(cursor, products) == (("P0000003",), "P0000010")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor(("P0000003",), None, "master_data"),
+    encode_cursor(("P0000003", "8900000000001"), None, PRODUCT_DATASET),
+])
+def test_invalid_cursors(products, cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, products)
+
+
+def test_keyset_condition():
+    assert keyset_condition(("a", "b")) == "((a > ?) OR (a = ? AND b > ?))"
+    assert keyset_params(("x", "y")) == ["x", "x", "y"]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5, 1000])
+def test_pages_cover_every_row_once(products, duplicate_batch, limit):
+    full, _ = download_all(products, 100000)
+    paged, pages = download_all(products, limit)
+    assert Counter(paged) == Counter(full)
+    assert sum(1 for row in paged if row[0] == duplicate_batch) == 4
+
+    # No product is split across pages
+    code = products.fields.index("code")
+    seen = Counter(c for page in pages for c in {row[code] for row in page})
+    assert max(seen.values()) == 1
+
+
+def test_product_bigger_than_a_page_comes_whole(products, duplicate_batch):
+    page, cursor = fetch_page(products, limit=1)
+    assert [row[0] for row in page] == [duplicate_batch] * 4
+    assert decode_cursor(cursor, products)[0] == (duplicate_batch,)
+
+
+def test_code_range(products):
+    rows, _ = download_all(products, 2, code_from="P0000002", code_to="P0000005")
+    assert sorted({row[0] for row in rows}) == ["P0000002", "P0000003", "P0000004"]
+
+
+def test_non_unique_keys_cannot_page_by_full_key(products):
+    validate_dataset(products)
+    with pytest.raises(Exception, match="unique"):
+        validate_dataset(products._replace(page_keys=PRODUCT_ORDER))
+    validate_dataset(products._replace(page_keys=PRODUCT_ORDER, unique_key=True))
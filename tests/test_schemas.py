@@ -0,0 +1,66 @@
+# tests/test_schemas.py
+import dataclasses
+from decimal import Decimal
+
+import pytest
+
+from app import orders as orders_module
+from app.orders import InvalidOrders, validate_orders, validate_upload
+
+
+def upload(*lines, **order):
+    return {"orders": [{"supplier_code": "M000001", "products": list(lines), **order}]}
+
+
+def test_numbers_are_coerced():
+    orders = validate_upload(upload({"barcode": 8901234567890, "quantity": "2", "rate": 10.1, "mrp": "12.50"}))
+    line = orders[0].products[0]
+    assert line.barcode == "8901234567890"
+    assert (line.quantity, line.rate, line.mrp) == (Decimal("2"), Decimal("10.1"), Decimal("12.50"))
+
+
+def test_blank_order_uuid_is_none():
+    assert validate_upload(upload({"barcode": "1", "quantity": 1}, order_uuid=""))[0].order_uuid is None
+    with pytest.raises(InvalidOrders, match="order_uuid"):
+        validate_upload(upload({"barcode": "1", "quantity": 1}, order_uuid="not-a-uuid"))
+
+
+def test_unknown_keys_are_ignored():
+    orders = validate_upload({"orders": [{"supplier_code": "S", "legacy": 1, "products": [
+        {"barcode": "1", "quantity": 1, "note": "x"},
+    ]}], "device": "abc"})
+    assert orders[0].otype == "O"
+
+
+@pytest.mark.parametrize("line, field", [
+    ({"quantity": 1}, "barcode"),
+    ({"barcode": "", "quantity": 1}, "barcode"),
+    ({"barcode": "1", "quantity": 0}, "quantity"),
+    ({"barcode": "1", "quantity": "nan"}, "quantity"),
+    ({"barcode": "1", "quantity": 1.23456}, "quantity"),
+    ({"barcode": "1", "quantity": 1, "rate": -1}, "rate"),
+    ({"barcode": "1", "quantity": 1, "mrp": 1e20}, "mrp"),
+])
+def test_bad_lines_are_rejected(line, field):
+    with pytest.raises(InvalidOrders, match=rf"orders\[0\]\.products\[0\]\.{field}"):
+        validate_upload(upload(line))
+
+
+def test_missing_supplier_is_rejected():
+    with pytest.raises(InvalidOrders, match=r"orders\[0\]\.supplier_code"):
+        validate_upload({"orders": [{"products": []}]})
+
+
+def test_line_limit(monkeypatch):
+    settings = dataclasses.replace(orders_module.get_settings(), upload_max_lines=2)
+    monkeypatch.setattr(orders_module, "get_settings", lambda: settings)
+    lines = [{"barcode": str(i), "quantity": 1} for i in range(3)]
+    with pytest.raises(InvalidOrders, match="at most 2"):
+        validate_upload(upload(*lines))
+    with pytest.raises(InvalidOrders, match="at most 2"):
+        validate_orders(upload(*lines)["orders"])
+
+
+def test_validated_orders_pass_through():
+    orders = validate_upload(upload({"barcode": "1", "quantity": 1}))
+    assert validate_orders(orders) is orders
@@ -0,0 +1,65 @@
+# tests/test_sequences.py
+import threading
+import uuid
+
+import pytest
+
+from app.sequences import SequenceAllocator
+
+
+@pytest.fixture
+def numbered(erp_db):
+    """A table to number and an allocator with a fresh counter for its column"""
+    table = "test_numbered_" + uuid.uuid4().hex[:8]
+    erp_db.execute(f"CREATE TABLE {table} (n INTEGER)")
+    erp_db.execute(f"INSERT INTO {table} (n) VALUES (41)")
+    erp_db.commit()
+    yield table, SequenceAllocator({"test_seq": (table, "n")})
+    erp_db.execute(f"DROP TABLE {table}")
+    erp_db.execute("DELETE FROM syncanywhere_sequences WHERE name = 'test_seq'")
+    erp_db.commit()
+
+
+def test_blocks_follow_the_column_and_each_other(numbered):
+    _, allocator = numbered
+    assert allocator.reserve({"test_seq": 3}) == {"test_seq": 42}
+    assert allocator.reserve({"test_seq": 2}) == {"test_seq": 45}
+    # Nothing asked for, nothing reserved
+    assert allocator.reserve({"test_seq": 0}) == {}
+
+
+def test_concurrent_reservations_never_overlap(numbered):
+    _, allocator = numbered
+    blocks = []
+    errors = []
+
+    def reserve():
+        try:
+            for _ in range(5):
+                first = allocator.reserve({"test_seq": 4})["test_seq"]
+                blocks.append(range(first, first + 4))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reserve) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    numbers = sorted(n for block in blocks for n in block)
+    assert numbers == list(range(42, 42 + 6 * 5 * 4))
+
+
+def test_invalidate_skips_rows_numbered_elsewhere(numbered, erp_db):
+    table, allocator = numbered
+    assert allocator.reserve({"test_seq": 1}) == {"test_seq": 42}
+
+    # The ERP desktop software numbered rows itself in the meantime
+    erp_db.execute(f"INSERT INTO {table} (n) VALUES (100)")
+    erp_db.commit()
+    assert allocator.reserve({"test_seq": 1}) == {"test_seq": 43}
+
+    allocator.invalidate()
+    assert allocator.reserve({"test_seq": 1}) == {"test_seq": 101}
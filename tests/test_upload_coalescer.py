@@ -0,0 +1,84 @@
+# tests/test_upload_coalescer.py
+import asyncio
+import dataclasses
+
+from app import upload_coalescer as coalescer_module
+from app.orders import InvalidOrders
+from app.upload_coalescer import UploadCoalescer, split_result, write_group
+
+
+def order(quantity=2):
+    return {"supplier_code": "M000001", "products": [{"barcode": "8900000000001", "quantity": quantity}]}
+
+
+def order_count(erp_db):
+    return erp_db.execute("SELECT COUNT(*) FROM acc_purchaseordermaster").fetchone()[0]
+
+
+def test_split_result_gives_each_request_its_own_orders():
+    results = [
+        {"order_uuid": None, "slno": 1, "orderno": 10, "lines": 2, "duplicate": False},
+        {"order_uuid": "u", "slno": 0, "orderno": 5, "lines": 1, "duplicate": True},
+        {"order_uuid": None, "slno": 2, "orderno": 11, "lines": 3, "duplicate": False},
+    ]
+    batch = {"requests": 2, "orders": 3}
+    first, second = split_result({"results": results, "timings_ms": {}}, [2, 1], batch)
+    assert (first["orders"], first["lines"], first["duplicates"]) == (1, 2, 1)
+    assert first["results"] == results[:2]
+    assert (second["orders"], second["lines"], second["duplicates"]) == (1, 3, 0)
+    assert second["results"] == results[2:]
+    assert first["batch"] is batch
+
+
+def test_bad_upload_only_fails_itself(erp_db):
+    before = order_count(erp_db)
+    good, bad = write_group([[order()], [order(quantity=0)]])
+    assert isinstance(bad, InvalidOrders)
+    assert (good["orders"], good["batch"]) == (1, {"requests": 1, "orders": 1})
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 1
+
+
+def coalesce(monkeypatch, uploads, **overrides):
+    """Submit ``uploads`` at once; returns their results and the group sizes"""
+    settings = dataclasses.replace(coalescer_module.get_settings(), **overrides)
+    monkeypatch.setattr(coalescer_module, "get_settings", lambda: settings)
+    groups = []
+
+    def recording_write_group(order_lists):
+        groups.append([len(orders) for orders in order_lists])
+        return write_group(order_lists)
+
+    monkeypatch.setattr(coalescer_module, "write_group", recording_write_group)
+    coalescer = UploadCoalescer()
+
+    async def submit_all():
+        return await asyncio.gather(*(coalescer.submit(orders) for orders in uploads))
+
+    return asyncio.run(submit_all()), groups, coalescer
+
+
+def test_concurrent_uploads_share_one_group(monkeypatch, erp_db):
+    before = order_count(erp_db)
+    results, groups, coalescer = coalesce(
+        monkeypatch, [[order()], [order(), order()], [order()]], upload_coalesce_window_ms=20,
+    )
+    assert groups == [[1, 2, 1]]
+    assert [result["orders"] for result in results] == [1, 2, 1]
+    assert {result["batch"]["requests"] for result in results} == {3}
+    # One reservation: the requests' numbers follow each other
+    slnos = [r["slno"] for result in results for r in result["results"]]
+    assert slnos == list(range(slnos[0], slnos[0] + 4))
+    assert coalescer.stats()["largest_group_requests"] == 3
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 4
+
+
+def test_groups_are_capped_at_max_orders(monkeypatch):
+    results, groups, coalescer = coalesce(
+        monkeypatch, [[order()], [order()], [order()]],
+        upload_coalesce_window_ms=20, upload_coalesce_max_orders=2,
+    )
+    assert groups == [[1, 1], [1]]
+    assert [result["batch"]["requests"] for result in results] == [2, 2, 1]
+    assert coalescer.stats()["groups"] == 2
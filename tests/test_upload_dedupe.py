@@ -0,0 +1,99 @@
+# tests/test_upload_dedupe.py
+import uuid
+
+from app import orders as orders_module
+from app import upload_dedupe
+from app.db_utils import get_db
+from app.orders import insert_orders
+from app.upload_dedupe import UploadLedger
+
+
+def order(order_uuid=None, quantity=2):
+    return {
+        "supplier_code": "M000001",
+        "order_uuid": order_uuid,
+        "products": [{"barcode": "8900000000001", "quantity": quantity}],
+    }
+
+
+def order_count(erp_db):
+    return erp_db.execute("SELECT COUNT(*) FROM acc_purchaseordermaster").fetchone()[0]
+
+
+def numbers(result):
+    return [(r["order_uuid"], r["slno"], r["orderno"], r["lines"]) for r in result["results"]]
+
+
+def test_lookup_spans_chunks(monkeypatch):
+    monkeypatch.setattr(upload_dedupe, "LOOKUP_CHUNK", 2)
+    ledger = UploadLedger()
+    rows = [(str(uuid.uuid4()), 1000 + i, 2000 + i, i + 1) for i in range(5)]
+    with get_db() as conn:
+        ledger.ensure_table(conn)
+        cursor = conn.cursor()
+        ledger.record(cursor, rows, "2026-01-01 00:00:00")
+        cursor.close()
+        conn.commit()
+        found = ledger.lookup(conn, [row[0] for row in rows] + [str(uuid.uuid4())])
+    assert found == {order_uuid: (slno, orderno, lines) for order_uuid, slno, orderno, lines in rows}
+
+
+def test_reupload_returns_the_original_numbers(erp_db):
+    uuids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    first = insert_orders([order(uuids[0]), order(uuids[1], quantity=3)])
+    before = order_count(erp_db)
+
+    again = insert_orders([order(uuids[0]), order(uuids[1], quantity=3)])
+    assert (again["orders"], again["duplicates"]) == (0, 2)
+    assert numbers(again) == numbers(first)
+    assert [r["duplicate"] for r in again["results"]] == [True, True]
+    erp_db.rollback()
+    assert order_count(erp_db) == before
+
+
+def test_partial_reupload_writes_only_new_orders(erp_db):
+    known = str(uuid.uuid4())
+    first = insert_orders([order(known)])
+    before = order_count(erp_db)
+
+    # No UUID means no dedupe: written every time
+    result = insert_orders([order(known), order(str(uuid.uuid4())), order()])
+    assert (result["orders"], result["duplicates"]) == (2, 1)
+    assert numbers(result)[0] == numbers(first)[0]
+    assert [r["duplicate"] for r in result["results"]] == [True, False, False]
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 2
+
+
+def test_uuid_repeated_in_one_upload_is_written_once(erp_db):
+    order_uuid = str(uuid.uuid4())
+    before = order_count(erp_db)
+    result = insert_orders([order(order_uuid), order(order_uuid)])
+    assert (result["orders"], result["duplicates"]) == (1, 1)
+    first, second = result["results"]
+    assert (first["slno"], first["orderno"]) == (second["slno"], second["orderno"])
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 1
+
+
+def test_concurrent_retry_is_answered_from_the_ledger(monkeypatch, erp_db):
+    order_uuid = str(uuid.uuid4())
+    first = insert_orders([order(order_uuid)])
+    before = order_count(erp_db)
+
+    # The retry checked the ledger just before the first attempt committed
+    lookup = upload_dedupe.upload_ledger.lookup
+    calls = []
+
+    def stale_lookup(conn, order_uuids):
+        calls.append(order_uuids)
+        return {} if len(calls) == 1 else lookup(conn, order_uuids)
+
+    monkeypatch.setattr(orders_module.upload_ledger, "lookup", stale_lookup)
+    result = insert_orders([order(order_uuid)])
+    # Stale check, the check after the key clash, then the restarted upload
+    assert len(calls) == 3
+    assert result["duplicates"] == 1
+    assert numbers(result) == numbers(first)
+    erp_db.rollback()
+    assert order_count(erp_db) == before
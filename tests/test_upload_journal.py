@@ -0,0 +1,198 @@
+# tests/test_upload_journal.py
+import dataclasses
+import os
+import uuid
+
+from app import orders as orders_module
+from app import upload_journal
+from app.upload_journal import (
+    RECEIPT_APPLIED, RECEIPT_FAILED, RECORD_HEADER, JournalApplier, UploadJournal, encode_record,
+    list_segments, read_records, segment_name,
+)
+
+
+def order(barcode="8900000000001", quantity=2):
+    return {"supplier_code": "M000001", "products": [{"barcode": barcode, "quantity": quantity}]}
+
+
+def order_count(erp_db):
+    return erp_db.execute("SELECT COUNT(*) FROM acc_purchaseordermaster").fetchone()[0]
+
+
+def write(path, *chunks):
+    with open(path, "ab") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def test_records_round_trip(tmp_path):
+    path = tmp_path / segment_name(1)
+    records = [encode_record({"receipt_id": str(i), "orders": []}) for i in range(3)]
+    write(path, *records)
+
+    read = read_records(path)
+    assert [record.payload["receipt_id"] for record in read] == ["0", "1", "2"]
+    ends = [len(records[0]), len(records[0]) + len(records[1]), os.path.getsize(path)]
+    assert [record.end for record in read] == ends
+
+    # Resuming from a saved offset, a batch at a time
+    assert [record.receipt_id for record in read_records(path, ends[0], limit=1)] == ["1"]
+    assert read_records(path, ends[2]) == []
+
+
+def test_torn_tail_is_not_read(tmp_path):
+    path = tmp_path / segment_name(1)
+    complete = encode_record({"receipt_id": "a"})
+    torn = encode_record({"receipt_id": "b"})
+    write(path, complete, torn[:-3])
+    assert read_records(path) == [(len(complete), {"receipt_id": "a"}, "a")]
+
+    # Only the header made it to disk
+    path = tmp_path / segment_name(2)
+    write(path, complete, torn[:RECORD_HEADER.size - 1])
+    assert read_records(path) == [(len(complete), {"receipt_id": "a"}, "a")]
+
+
+def test_checksum_mismatch_is_skipped(tmp_path):
+    path = tmp_path / segment_name(1)
+    first = bytearray(encode_record({"receipt_id": "a"}))
+    first[-2] ^= 0xFF
+    second = encode_record({"receipt_id": "b"})
+    write(path, bytes(first), second)
+
+    read = read_records(path)
+    assert read == [(len(first), None, None), (len(first) + len(second), {"receipt_id": "b"}, "b")]
+
+
+def test_apply_pending_writes_orders_and_receipts(tmp_path, erp_db):
+    journal = UploadJournal(str(tmp_path), 1024 * 1024)
+    receipts = [journal.append("user1", [order()]), journal.append("user1", [order(), order()])]
+    before = order_count(erp_db)
+
+    applier = JournalApplier(str(tmp_path), batch_receipts=10)
+    assert applier.apply_pending() == 2
+    assert applier.apply_pending() == 0
+    applier.close()
+
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 3
+    statuses = [journal.status(receipt_id) for receipt_id in receipts]
+    assert [status["status"] for status in statuses] == [RECEIPT_APPLIED, RECEIPT_APPLIED]
+    assert [len(status["results"]) for status in statuses] == [1, 2]
+    journal.close()
+
+
+def test_reapply_after_crash_is_deduplicated(tmp_path, erp_db):
+    journal = UploadJournal(str(tmp_path), 1024 * 1024)
+    receipt_id = journal.append("user1", [order(), order(quantity=5)])
+    before = order_count(erp_db)
+
+    applier = JournalApplier(str(tmp_path))
+    applier.apply_pending()
+    first = journal.status(receipt_id)["results"]
+
+    # Crash after the orders were committed but before the position was saved
+    with applier._receipts:
+        applier._receipts.execute("UPDATE applier_position SET offset = 0")
+    assert applier.apply_pending() == 1
+    applier.close()
+
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 2
+    again = journal.status(receipt_id)["results"]
+    assert [r["duplicate"] for r in again] == [True, True]
+    assert [(r["order_uuid"], r["slno"], r["orderno"]) for r in again] == \
+        [(r["order_uuid"], r["slno"], r["orderno"]) for r in first]
+    # Derived from the receipt id, so the same on every re-read
+    assert first[0]["order_uuid"] == str(uuid.uuid5(uuid.UUID(receipt_id), "0"))
+    journal.close()
+
+
+def test_applied_segments_are_removed(tmp_path):
+    directory = str(tmp_path)
+    journal = UploadJournal(directory, 1024 * 1024)
+    first = journal.append("user1", [order()])
+    # A crash mid-append leaves a torn record at the end of segment 1
+    write(os.path.join(directory, segment_name(1)), encode_record({"receipt_id": "x"})[:10])
+    journal.close()
+
+    # After a restart the server appends to a new segment only
+    journal = UploadJournal(directory, 1024 * 1024)
+    second = journal.append("user1", [order()])
+    assert list_segments(directory) == [1, 2]
+
+    applier = JournalApplier(directory)
+    assert applier.apply_pending() == 2
+    applier.close()
+    assert list_segments(directory) == [2]
+    assert journal.status(first)["status"] == RECEIPT_APPLIED
+    assert journal.status(second)["status"] == RECEIPT_APPLIED
+    journal.close()
+
+
+def test_segments_roll_at_size_limit(tmp_path):
+    directory = str(tmp_path)
+    journal = UploadJournal(directory, 1)
+    receipts = [journal.append("user1", [order()]) for _ in range(3)]
+    assert list_segments(directory) == [1, 2, 3]
+    journal.close()
+
+    applier = JournalApplier(directory)
+    assert applier.apply_pending() == 3
+    applier.close()
+    # The newest segment stays: the server may still append to it
+    assert list_segments(directory) == [3]
+    assert {journal.status(r)["status"] for r in receipts} == {RECEIPT_APPLIED}
+
+
+def test_corrupt_record_does_not_block_later_ones(tmp_path):
+    directory = str(tmp_path)
+    journal = UploadJournal(directory, 1024 * 1024)
+    first = journal.append("user1", [order()])
+    second = journal.append("user1", [order()])
+    journal.close()
+
+    path = os.path.join(directory, segment_name(1))
+    with open(path, "r+b") as f:
+        # Inside the orders, after the receipt id
+        f.seek(RECORD_HEADER.size + 60)
+        f.write(b"#")
+    assert read_records(path)[0].receipt_id == first
+
+    applier = JournalApplier(directory)
+    assert applier.apply_pending() == 2
+    segment, offset = applier._position()
+    applier.close()
+    assert (segment, offset) == (1, os.path.getsize(path))
+    assert journal.status(second)["status"] == RECEIPT_APPLIED
+    # Reported, not left pending forever
+    status = journal.status(first)
+    assert status["status"] == RECEIPT_FAILED
+    assert "damaged" in status["error"]
+
+
+def test_batches_are_not_held_to_the_per_upload_line_limit(tmp_path, monkeypatch, erp_db):
+    settings = dataclasses.replace(orders_module.get_settings(), upload_max_lines=2)
+    monkeypatch.setattr(orders_module, "get_settings", lambda: settings)
+    calls = []
+
+    def counting_insert(orders, **kwargs):
+        calls.append(len(orders))
+        return orders_module.insert_orders(orders, **kwargs)
+
+    monkeypatch.setattr(upload_journal, "insert_orders", counting_insert)
+
+    journal = UploadJournal(str(tmp_path), 1024 * 1024)
+    receipts = [journal.append("user1", [order(), order()]) for _ in range(3)]
+    before = order_count(erp_db)
+
+    applier = JournalApplier(str(tmp_path), batch_receipts=10)
+    assert applier.apply_pending() == 3
+    applier.close()
+
+    # One insert for the batch, no failed attempt and per-receipt fallback
+    assert calls == [6]
+    erp_db.rollback()
+    assert order_count(erp_db) == before + 6
+    assert {journal.status(r)["status"] for r in receipts} == {RECEIPT_APPLIED}
+    journal.close()